@@ -0,0 +1,225 @@
+"""
+Approximate nearest-neighbour index (IVF) for large face galleries
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, ANN_MIN_IDENTITIES, pack
+
+
+def index_path_for(enrollments_path):
+    """Index file stored next to the enrollments file"""
+    path = Path(enrollments_path)
+    return path.with_name(path.stem + '.ivf.npz')
+
+
+def _squared_distances(queries, points, point_norms):
+    squared = np.einsum('ij,ij->i', queries, queries)[:, None] + point_norms[None, :]
+    squared -= 2.0 * (queries @ points.T)
+    return squared
+
+
+def kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """Plain Lloyd's k-means, returns (n_clusters, dim) float32 centroids"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        norms = np.einsum('ij,ij->i', centroids, centroids)
+        assign = np.argmin(_squared_distances(vectors, centroids, norms), axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        sizes = np.bincount(assign, minlength=n_clusters)
+
+        empty = sizes == 0
+        centroids[~empty] = sums[~empty] / sizes[~empty, None]
+        # Re-seed empty clusters from random points so no list stays unused
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over enrollment samples.
+
+    Samples are bucketed by their nearest k-means centroid. A query scans
+    only the n_probe closest buckets and returns the identities of its
+    nearest samples as candidates for an exact re-rank. Each bucket is
+    replaced, never modified in place, so searches running on another
+    thread always see a consistent set of buckets.
+    """
+
+    def __init__(self, centroids, n_probe=16):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.n_probe = n_probe
+        # Each bucket is (vectors, squared norms, labels)
+        empty = (
+            np.empty((0, ENCODING_SIZE), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=str)
+        )
+        self.lists = tuple(empty for _ in range(len(self.centroids)))
+        self.trained_size = 0
+
+    def __len__(self):
+        return sum(len(labels) for _, _, labels in self.lists)
+
+    @classmethod
+    def build(cls, enrollments, n_lists=None, n_probe=16, seed=0):
+        """Train centroids on the enrollment samples and index all of them"""
+        names, counts, vectors = pack(enrollments)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        labels = np.repeat(np.array(names), counts)
+
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        # Training on a subsample is plenty for a coarse quantizer
+        rng = np.random.default_rng(seed)
+        train = vectors[rng.choice(len(vectors), min(len(vectors), n_lists * 64), replace=False)]
+
+        index = cls(kmeans(train, n_lists, seed=seed), n_probe)
+        index._insert(vectors, labels)
+        index.trained_size = len(vectors)
+        return index
+
+    def needs_retrain(self):
+        """True once the gallery has outgrown the data the centroids were trained on"""
+        return len(self) > 4 * max(self.trained_size, 1)
+
+    def _assign(self, vectors):
+        return np.argmin(_squared_distances(vectors, self.centroids, self.centroid_norms), axis=1)
+
+    def _insert(self, vectors, labels):
+        assign = self._assign(vectors)
+        lists = list(self.lists)
+        for list_id in np.unique(assign):
+            members = assign == list_id
+            old_vectors, _, old_labels = lists[list_id]
+            merged = np.concatenate([old_vectors, vectors[members]])
+            lists[list_id] = (
+                merged,
+                np.einsum('ij,ij->i', merged, merged),
+                np.concatenate([old_labels, labels[members]])
+            )
+        self.lists = tuple(lists)
+
+    def add(self, name, samples):
+        """Index a person's samples; only the buckets they fall into are rebuilt"""
+        vectors = np.asarray(samples, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        self._insert(vectors, np.full(len(vectors), name))
+
+    def remove(self, name):
+        """Drop every sample of a person"""
+        lists = list(self.lists)
+        for list_id, (vectors, norms, labels) in enumerate(lists):
+            keep = labels != name
+            if not keep.all():
+                lists[list_id] = (vectors[keep], norms[keep], labels[keep])
+        self.lists = tuple(lists)
+
+    def search(self, queries, candidates=32):
+        """Candidate identity names for each query, nearest first"""
+        lists = self.lists
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(
+            _squared_distances(queries, self.centroids, self.centroid_norms), n_probe - 1, axis=1
+        )[:, :n_probe]
+
+        results = []
+        for query, probe in zip(queries, probes):
+            # Score each probed bucket in place; only the small distance
+            # vectors are concatenated, never the bucket contents
+            scores = [lists[i][1] - 2.0 * (lists[i][0] @ query) for i in probe]
+            sizes = np.array([len(score) for score in scores])
+            if not sizes.sum():
+                results.append([])
+                continue
+
+            squared = np.concatenate(scores)
+            top = min(candidates, len(squared))
+            nearest = np.argpartition(squared, top - 1)[:top]
+            nearest = nearest[np.argsort(squared[nearest])]
+
+            bounds = np.cumsum(sizes)
+            owners = np.searchsorted(bounds, nearest, side='right')
+            offsets = nearest - (bounds[owners] - sizes[owners])
+            labels = [str(lists[probe[owner]][2][offset]) for owner, offset in zip(owners, offsets)]
+            # Keep first occurrence of each identity, in distance order
+            results.append(list(dict.fromkeys(labels)))
+
+        return results
+
+    def save(self, path):
+        """Write the index atomically (temp file + rename)"""
+        path = Path(path)
+        sizes = np.array([len(labels) for _, _, labels in self.lists], dtype=np.int64)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                vectors=np.concatenate([v for v, _, _ in self.lists]),
+                labels=np.concatenate([l for _, _, l in self.lists]),
+                sizes=sizes,
+                n_probe=np.array(self.n_probe),
+                trained_size=np.array(self.trained_size),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(data['centroids'], int(data['n_probe']))
+            bounds = np.concatenate([[0], np.cumsum(data['sizes'])])
+            vectors, labels = data['vectors'], data['labels']
+            norms = np.einsum('ij,ij->i', vectors, vectors)
+            index.lists = tuple(
+                (vectors[start:end], norms[start:end], labels[start:end])
+                for start, end in zip(bounds[:-1], bounds[1:])
+            )
+            index.trained_size = int(data['trained_size'])
+        return index
+
+
+def load_saved(enrollments, enrollments_path='enrollments.npz'):
+    """
+    The saved index if it still covers exactly the enrolled samples and
+    does not need retraining, else None; never builds one
+    """
+    path = index_path_for(enrollments_path)
+    if not path.exists():
+        return None
+
+    total = sum(len(samples) for samples in enrollments.values())
+    try:
+        index = IVFIndex.load(path)
+        labels = np.concatenate([l for _, _, l in index.lists])
+        if len(index) == total and set(np.unique(labels)) == set(enrollments) and not index.needs_retrain():
+            return index
+    except Exception as e:
+        print(f"Error loading ANN index: {e}")
+    return None
+
+
+def load_or_build(enrollments, enrollments_path='enrollments.npz', min_identities=ANN_MIN_IDENTITIES):
+    """
+    Index for the current enrollments, or None when the gallery is small
+    enough for exact search. A saved index is reused if it still covers
+    exactly the enrolled samples.
+    """
+    if len(enrollments) < min_identities:
+        return None
+
+    index = load_saved(enrollments, enrollments_path)
+    if index is None:
+        index = IVFIndex.build(enrollments)
+        index.save(index_path_for(enrollments_path))
+    return index
@@ -1,17 +1,22 @@
-import cv2, pickle, pandas as pd
-from pathlib import Path
+import cv2, pandas as pd
 from datetime import datetime
-import face_recognition
 from deepface import DeepFace
 import tkinter as tk
 from tkinter import ttk, messagebox
-
-
-def enroll_person(name, n_samples=5):
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened(): print("Error: Could not open camera"); return []
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+from gallery import GalleryMatcher, UNKNOWN
+from detection import FaceDetector
+from emotion import shared_cache, cache_key
+from sources import open_capture
+from tracker import FaceTracker
+import attendance_store
+from records_cache import RecordsCache, shared_records
+from enrollment_store import ENROLLMENTS_PATH, EnrollmentStore
+
+
+def enroll_person(name, n_samples=5, detection_scale=0.5, source=0):
+    detector = FaceDetector(detection_scale)
+    cap = open_capture(source)
+    if cap is None: return []
     encodings = []
     print(f"Capturing {n_samples} samples for {name}. Press SPACE to capture, ESC to quit.")
     
@@ -22,9 +27,10 @@ def enroll_person(name, n_samples=5):
         key = cv2.waitKey(1) & 0xFF
         
         if key == 32:
-            face_locs = face_recognition.face_locations(frame)
+            rgb = detector.to_rgb(frame)
+            face_locs = detector.detect(rgb)
             if len(face_locs) == 1:
-                enc = face_recognition.face_encodings(frame, face_locs)[0]
+                enc = detector.encode(rgb, face_locs)[0]
                 encodings.append(enc)
                 print(f"Captured {len(encodings)}/{n_samples}")
             else: print(f"Found {len(face_locs)} faces, need exactly 1")
@@ -34,41 +40,41 @@ def enroll_person(name, n_samples=5):
     cv2.destroyAllWindows()
     return encodings
 
-def save_enrollments(enrollments, path='enrollments.pkl'):
-    with open(path, 'wb') as f: pickle.dump(enrollments, f)
-    print(f"Saved {len(enrollments)} enrollments to {path}")
+def save_person(name, encodings, path=ENROLLMENTS_PATH):
+    EnrollmentStore(path).add(name, encodings)  # Appends only this person's samples
+    print(f"Saved {name} ({len(encodings)} samples) to {path}")
+
+def delete_person(name, path=ENROLLMENTS_PATH):
+    EnrollmentStore(path).remove(name)
+    print(f"Removed {name} from {path}")
 
-def load_enrollments(path='enrollments.pkl'):
-    if not Path(path).exists(): return {}
-    with open(path, 'rb') as f: return pickle.load(f)
+def load_enrollments(path=ENROLLMENTS_PATH): return EnrollmentStore(path)
 
-def recognize_faces(enrollments, tolerance=0.6):
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened(): print("Error: Could not open camera"); return
-    known_names = list(enrollments.keys())
-    known_encodings = [sum(enrollments[n])/len(enrollments[n]) for n in known_names]
+def recognize_faces(enrollments, tolerance=0.6, policy='centroid', detection_scale=0.5, source=0):
+    detector = FaceDetector(detection_scale)
+    cap = open_capture(source)
+    if cap is None: return
+    matcher = GalleryMatcher(enrollments, tolerance, policy)
     logged = set()
     face_timers = {}
+    tracker = FaceTracker()  # Track ids key the emotion cache for unknown faces
 
 
     
     while True:
         ret, frame = cap.read()
         if not ret: break
-        face_locs = face_recognition.face_locations(frame)
-        face_encs = face_recognition.face_encodings(frame, face_locs)
+        face_locs, face_encs = detector.detect_and_encode(frame)
         current_time = datetime.now()
+        names, _, _ = matcher.match(face_encs)
+        tracks = tracker.update(face_locs)
         
-        for (top,right,bottom,left), face_enc in zip(face_locs, face_encs):
-            matches = face_recognition.compare_faces(known_encodings, face_enc, tolerance)
-            name = "Unknown"
-            if True in matches: name = known_names[matches.index(True)]
-            
+        for (top,right,bottom,left), name, track in zip(face_locs, names, tracks):
             if name not in face_timers: face_timers[name] = current_time
             elapsed = (current_time - face_timers[name]).total_seconds()
             
-            emotion = "waiting..." if elapsed < 3 else detect_emotion(frame, (top,right,bottom,left))
-            if name != "Unknown" and name not in logged and elapsed >= 3: log_attendance(name, emotion); logged.add(name)
+            emotion = "waiting..." if elapsed < 3 else detect_emotion(frame, (top,right,bottom,left), cache_key(name, track.id))
+            if name != UNKNOWN and name not in logged and elapsed >= 3: log_attendance(name, emotion); logged.add(name)
             cv2.rectangle(frame, (left,top), (right,bottom), (0,255,0), 2)
             cv2.putText(frame, f"{name} - {emotion}", (left,top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,255,0), 2)
         
@@ -79,42 +85,47 @@ def recognize_faces(enrollments, tolerance=0.6):
     cv2.destroyAllWindows()
 
 
-def detect_emotion(frame, face_loc):
+def detect_emotion(frame, face_loc, key=None, cache=shared_cache):
+    cached = cache.get(key)
+    if cached is not None: return cached
     top,right,bottom,left = face_loc
     face_img = frame[top:bottom, left:right]
     try:
         result = DeepFace.analyze(face_img, actions=['emotion'], enforce_detection=False)
         emotion = result[0]['dominant_emotion'] if isinstance(result, list) else result['dominant_emotion']
+        cache.put(key, emotion)
         return emotion
     except: return "unknown"
     
-def log_attendance(name, emotion, csv_path='attendance.csv'):
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    data = {'Name': [name], 'Emotion': [emotion], 'Timestamp': [timestamp]}
-    df = pd.DataFrame(data)
-    if Path(csv_path).exists(): df.to_csv(csv_path, mode='a', header=False, index=False)
-    else: df.to_csv(csv_path, index=False)
-    print(f"Logged: {name} - {emotion} at {timestamp}")
-
-def view_attendance(csv_path='attendance.csv'):
-    if not Path(csv_path).exists(): print("No attendance records found"); return
-    df = pd.read_csv(csv_path)
+def log_attendance(name, emotion, db_path=attendance_store.DB_PATH):
+    timestamp = attendance_store.log_attendance(name, emotion, db_path)
+    if timestamp: print(f"Logged: {name} - {emotion} at {timestamp}")
+
+def view_attendance(db_path=attendance_store.DB_PATH):
+    # The shared cache only reads what was logged since the last view
+    cache = shared_records if db_path == attendance_store.DB_PATH else RecordsCache(db_path)
+    cache.refresh()
+    df = pd.DataFrame(cache.rows(cache.select()), columns=attendance_store.COLUMNS)
+    if df.empty: print("No attendance records found"); return
     print("\n=== Attendance Records ===")
     print(df.to_string(index=False))
     print(f"\nTotal records: {len(df)}")
 
 class AttendanceUI:
-    def __init__(self):
+    def __init__(self, source=0):
         self.root = tk.Tk()
         self.root.title("Face Attendance System")
         self.root.geometry("900x700")
         self.enrollments = load_enrollments()
-        self.cap = cv2.VideoCapture(0)
+        self.matcher = GalleryMatcher(self.enrollments)
+        self.detector = FaceDetector()
+        self.cap = open_capture(source)
         self.mode = 'preview'
         self.enroll_name = None
         self.enroll_samples = []
         self.enroll_target = 3
         self.face_timers = {}
+        self.tracker = FaceTracker()  # Track ids key the emotion cache for unknown faces
         self.logged = set()
 
         
@@ -147,19 +158,21 @@ class AttendanceUI:
         if self.enroll_name: self.mode = 'enroll'; self.enroll_samples = []; self.update_status(); self.show_message(f"Enrolling {self.enroll_name}. Press SPACE to capture ({len(self.enroll_samples)}/{self.enroll_target})")
 
     
-    def recognize_mode(self): self.mode = 'recognize'; self.face_timers = {}; self.logged = set(); self.update_status(); self.show_message("Recognition started")
+    def recognize_mode(self): self.mode = 'recognize'; self.matcher.set_enrollments(self.enrollments); self.face_timers = {}; self.logged = set(); self.update_status(); self.show_message("Recognition started")
 
     
     def view(self): view_attendance()
     
-    def exit(self): self.cap.release(); self.root.quit()
+    def exit(self):
+        if self.cap: self.cap.release()
+        self.root.quit()
 
     def show_frame(self):
         if self.cap:
             ret, frame = self.cap.read()
             if ret:
                 if self.mode == 'enroll' and self.enroll_name:
-                    face_locs = face_recognition.face_locations(frame)
+                    face_locs = self.detector.detect(self.detector.to_rgb(frame))
                     if len(face_locs) == 1:
                         top,right,bottom,left = face_locs[0]
                         cv2.rectangle(frame, (left,top), (right,bottom), (0,255,0), 2)
@@ -167,24 +180,20 @@ class AttendanceUI:
                     elif len(face_locs) > 1: cv2.putText(frame, "Multiple faces detected!", (50,50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,255), 2)
                 
                 elif self.mode == 'recognize':
-                    face_locs = face_recognition.face_locations(frame)
-                    face_encs = face_recognition.face_encodings(frame, face_locs)
-                    known_names = list(self.enrollments.keys())
-                    known_encodings = [sum(self.enrollments[n])/len(self.enrollments[n]) for n in known_names]
+                    face_locs, face_encs = self.detector.detect_and_encode(frame)
                     current_time = datetime.now()
+                    names, _, _ = self.matcher.match(face_encs)
+                    tracks = self.tracker.update(face_locs)
                     
-                    for (top,right,bottom,left), face_enc in zip(face_locs, face_encs):
-                        matches = face_recognition.compare_faces(known_encodings, face_enc, 0.6)
-                        name = known_names[matches.index(True)] if True in matches else "Unknown"
-                        
+                    for (top,right,bottom,left), name, track in zip(face_locs, names, tracks):
                         if name not in self.face_timers: self.face_timers[name] = current_time
                         elapsed = (current_time - self.face_timers[name]).total_seconds()
                         
                         if elapsed < 3: text = f"{name} - {int(3-elapsed)}s"
                         else:
-                            emotion = detect_emotion(frame, (top,right,bottom,left))
+                            emotion = detect_emotion(frame, (top,right,bottom,left), cache_key(name, track.id))
                             text = f"{name} - {emotion}"
-                            if name != "Unknown" and name not in self.logged: log_attendance(name, emotion); self.logged.add(name); self.show_message(f"Logged: {name} - {emotion}")
+                            if name != UNKNOWN and name not in self.logged: log_attendance(name, emotion); self.logged.add(name); self.show_message(f"Logged: {name} - {emotion}")
                         
                         cv2.rectangle(frame, (left,top), (right,bottom), (0,255,0), 2)
                         cv2.putText(frame, text, (left,top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
@@ -204,6 +213,7 @@ class AttendanceUI:
 
 
 if __name__ == '__main__':
+    import sys
     from tkinter import simpledialog
-    ui = AttendanceUI()
+    ui = AttendanceUI(sys.argv[1] if len(sys.argv) > 1 else 0)  # camera index, RTSP URL or video file
     ui.run()
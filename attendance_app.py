@@ -8,28 +8,36 @@ import sys
 os.environ["QT_QPA_PLATFORM_PLUGIN_PATH"] = ""
 os.environ.pop("QT_QPA_PLATFORM", None)
 
+import argparse
+import math
+
 import cv2
 import numpy as np
-import pandas as pd
-import pickle
 from pathlib import Path
 from datetime import datetime, timedelta
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QTabWidget, QLabel, QPushButton, QTableWidget, QTableWidgetItem,
+    QTabWidget, QLabel, QPushButton, QTableWidget, QTableWidgetItem, QTableView,
     QLineEdit, QMessageBox, QProgressBar, QFrame, QGroupBox,
-    QComboBox, QDateEdit, QFileDialog, QSpinBox, QCheckBox
+    QComboBox, QDateEdit, QFileDialog, QSpinBox, QCheckBox, QGridLayout, QProgressDialog
 )
 from PyQt5.QtCore import Qt, QTimer, QDate, pyqtSlot
-from PyQt5.QtGui import QImage, QPixmap, QFont
+from PyQt5.QtGui import QFont
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
 from worker_threads import (
     CameraThread, FaceRecognitionThread,
-    EmotionDetectionThread, EnrollmentThread
+    EmotionDetectionThread, EnrollmentThread, AttendanceWriterThread, ExportThread, IndexBuildThread
 )
+import ann_index
+import attendance_store
+from display import FrameDisplay, bgr_pixmap
+from emotion import shared_cache
+from enrollment_store import ENROLLMENTS_PATH, EnrollmentStore
+from records_model import RecordsModel
+from sources import describe_source, parse_source
 
 
 class LiveRecognitionTab(QWidget):
@@ -38,7 +46,11 @@ class LiveRecognitionTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_app = parent
-        self.current_frame = None
+        self.current_frames = {}  # camera id -> latest frame (a view)
+        self.current_refs = {}  # camera id -> FrameRef keeping that frame alive
+        self.overlays = {}  # camera id -> (location, name, confidence, track id) per face
+        self.video_labels = {}
+        self.camera_captions = {}
         self.face_timers = {}
         self.logged_today = set()
         self.recognition_active = False
@@ -51,12 +63,9 @@ class LiveRecognitionTab(QWidget):
         # Left side - Video feed
         left_layout = QVBoxLayout()
 
-        self.video_label = QLabel()
-        self.video_label.setMinimumSize(640, 480)
-        self.video_label.setMaximumSize(640, 480)
-        self.video_label.setStyleSheet("border: 2px solid #3498db; background-color: black;")
-        self.video_label.setAlignment(Qt.AlignCenter)
-        left_layout.addWidget(self.video_label)
+        # One video tile per camera, laid out by set_cameras()
+        self.video_grid = QGridLayout()
+        left_layout.addLayout(self.video_grid)
 
         # Control buttons
         btn_layout = QHBoxLayout()
@@ -108,10 +117,13 @@ class LiveRecognitionTab(QWidget):
         self.status_logged.setFont(QFont('Arial', 12))
         self.status_mode = QLabel("Mode: Idle")
         self.status_mode.setFont(QFont('Arial', 12, QFont.Bold))
+        self.status_cache = QLabel("Emotion cache: 0 hits / 0 misses")
+        self.status_cache.setFont(QFont('Arial', 10))
 
         status_layout.addWidget(self.status_enrolled)
         status_layout.addWidget(self.status_logged)
         status_layout.addWidget(self.status_mode)
+        status_layout.addWidget(self.status_cache)
         status_group.setLayout(status_layout)
         right_layout.addWidget(status_group)
 
@@ -134,26 +146,65 @@ class LiveRecognitionTab(QWidget):
         layout.addLayout(right_layout, 1)
         self.setLayout(layout)
 
-    def update_frame(self, frame):
-        """Update video display with annotations"""
-        self.current_frame = frame.copy()
+    def set_cameras(self, camera_names):
+        """Lay out one video tile per camera, in a square-ish grid"""
+        columns = math.ceil(math.sqrt(len(camera_names)))
+        width, height = 640 // columns, 480 // columns
+
+        for camera_id, camera_name in camera_names.items():
+            label = QLabel()
+            label.setFixedSize(width, height)
+            label.setStyleSheet("border: 2px solid #3498db; background-color: black;")
+            label.setAlignment(Qt.AlignCenter)
+            caption = QLabel(camera_name)
+            caption.setFont(QFont('Arial', 9))
+
+            tile = QVBoxLayout()
+            tile.addWidget(label)
+            tile.addWidget(caption)
+            self.video_grid.addLayout(tile, camera_id // columns, camera_id % columns)
+            self.video_labels[camera_id] = label
+            self.camera_captions[camera_id] = (caption, camera_name)
+
+    def update_camera_stats(self, camera_stats):
+        """Per-camera capture FPS and frames dropped by the camera and by recognition"""
+        for camera_id, stats in camera_stats.items():
+            caption, camera_name = self.camera_captions[camera_id]
+            caption.setText(
+                f"{camera_name}: {stats['fps']:.1f} fps, "
+                f"{stats['dropped']} dropped, {stats['skipped']} not recognized"
+            )
 
-    def update_video_display(self, face_locations, names, confidences):
-        """Draw bounding boxes and labels on video"""
-        if self.current_frame is None:
+    def update_frame(self, camera_id, frame_ref):
+        """Keep a reference to the camera's latest frame; a view into the ring, not a copy"""
+        previous = self.current_refs.get(camera_id)
+        if previous is not None:
+            previous.release()
+        self.current_refs[camera_id] = frame_ref.retain()
+        self.current_frames[camera_id] = frame_ref.image
+
+    def update_video_display(self, camera_id, face_locations, names, confidences, track_ids):
+        """Keep the camera's latest boxes and labels; they are drawn on every painted frame"""
+        self.overlays[camera_id] = list(zip(face_locations, names, confidences, track_ids))
+
+    def render_frame(self, camera_id, frame):
+        """Draw bounding boxes and labels on video (called by the FrameDisplay)"""
+        label = self.video_labels.get(camera_id)
+        if label is None:
             return
 
-        frame = self.current_frame.copy()
+        overlays = self.overlays.get(camera_id, [])
+        if overlays:
+            # Overlays are drawn on a copy, never on the shared ring frame
+            frame = frame.copy()
 
-        for (top, right, bottom, left), name, confidence in zip(
-            face_locations, names, confidences
-        ):
+        for (top, right, bottom, left), name, confidence, track_id in overlays:
             # Draw rectangle
             color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
             cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
 
             # Get emotion if available
-            emotion = self.face_timers.get(name, {}).get('emotion', 'waiting...')
+            emotion = self.face_timers.get(track_id, {}).get('emotion', 'waiting...')
 
             # Draw label
             label = f"{name} - {emotion}"
@@ -165,19 +216,18 @@ class LiveRecognitionTab(QWidget):
                 cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2
             )
 
-        # Convert to Qt format
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = frame_rgb.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qt_image)
-
-        self.video_label.setPixmap(pixmap)
+        pixmap = bgr_pixmap(frame)
+        if pixmap.width() > label.width():
+            # Grid tiles are smaller than the frame
+            pixmap = pixmap.scaled(label.size(), Qt.KeepAspectRatio, Qt.FastTransformation)
+        label.setPixmap(pixmap)
 
     def start_recognition(self):
         """Start recognition mode"""
         self.recognition_active = True
         self.face_timers = {}
+        # People logged earlier today (or at another kiosk) are filtered
+        # out by the database on the writer thread
         self.logged_today = set()
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
@@ -187,6 +237,7 @@ class LiveRecognitionTab(QWidget):
     def stop_recognition(self):
         """Stop recognition mode"""
         self.recognition_active = False
+        self.overlays = {}
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.status_mode.setText("Mode: Idle")
@@ -196,45 +247,67 @@ class LiveRecognitionTab(QWidget):
         """Update status display"""
         self.status_enrolled.setText(f"Enrolled: {enrolled_count} people")
         self.status_logged.setText(f"Logged Today: {len(self.logged_today)}")
+        self.update_cache_status()
+
+    def update_cache_status(self):
+        """Show emotion cache hit/miss counters for tuning its TTL"""
+        cache = shared_cache.stats()
+        self.status_cache.setText(
+            f"Emotion cache: {cache['hits']} hits / {cache['misses']} misses"
+        )
 
-    def handle_face_detected(self, face_locations, names, confidences):
-        """Handle recognized faces"""
+    def handle_face_detected(self, camera_id, face_locations, names, confidences, track_ids):
+        """Handle recognized faces, timed per track rather than per name"""
         if not self.recognition_active:
-            self.update_video_display(face_locations, names, confidences)
+            self.update_video_display(camera_id, face_locations, names, confidences, track_ids)
             return
 
         current_time = datetime.now()
 
-        for idx, (name, confidence) in enumerate(zip(names, confidences)):
+        for idx, (name, track_id) in enumerate(zip(names, track_ids)):
             if name == "Unknown":
                 continue
 
-            # Initialize timer if new face
-            if name not in self.face_timers:
-                self.face_timers[name] = {
+            # Initialize timer for a new track, or restart it when the
+            # track's voted identity changed
+            timer = self.face_timers.get(track_id)
+            if timer is None or timer['name'] != name:
+                timer = self.face_timers[track_id] = {
+                    'name': name,
+                    'camera_id': camera_id,
                     'first_seen': current_time,
                     'emotion': 'waiting...',
                     'emotion_requested': False
                 }
+            timer['last_seen'] = current_time
 
             # Calculate elapsed time
-            elapsed = (current_time - self.face_timers[name]['first_seen']).total_seconds()
+            elapsed = (current_time - timer['first_seen']).total_seconds()
 
             # Request emotion after 3 seconds
-            if elapsed >= 3 and not self.face_timers[name]['emotion_requested']:
-                self.face_timers[name]['emotion_requested'] = True
-                if self.parent_app and self.current_frame is not None:
+            if elapsed >= 3 and not timer['emotion_requested']:
+                timer['emotion_requested'] = True
+                frame = self.current_frames.get(camera_id)
+                if self.parent_app and frame is not None:
                     face_loc = face_locations[idx]
                     self.parent_app.emotion_thread.add_task(
-                        self.current_frame, face_loc, name
+                        frame, face_loc, name, track_id, camera_id
                     )
 
-        self.update_video_display(face_locations, names, confidences)
+        # Forget tracks that left the frame a while ago
+        self.face_timers = {
+            track_id: timer for track_id, timer in self.face_timers.items()
+            if (current_time - timer['last_seen']).total_seconds() < 10
+        }
+
+        self.update_video_display(camera_id, face_locations, names, confidences, track_ids)
 
-    def handle_emotion_detected(self, name, emotion):
+    def handle_emotion_detected(self, camera_id, track_id, name, emotion):
         """Handle emotion detection result"""
-        if name in self.face_timers:
-            self.face_timers[name]['emotion'] = emotion
+        self.update_cache_status()
+
+        if track_id in self.face_timers:
+            self.face_timers[track_id]['emotion'] = emotion
 
             # Log attendance if not logged today
             if name not in self.logged_today:
@@ -242,32 +315,23 @@ class LiveRecognitionTab(QWidget):
                 self.logged_today.add(name)
 
     def log_attendance(self, name, emotion):
-        """Log attendance to CSV"""
-        csv_path = 'attendance.csv'
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        data = {
-            'Name': [name],
-            'Emotion': [emotion],
-            'Timestamp': [timestamp]
-        }
-        df = pd.DataFrame(data)
+        """Queue attendance for the writer thread; the GUI thread never waits on disk"""
+        self.parent_app.attendance_writer.log(name, emotion)
 
-        if Path(csv_path).exists():
-            df.to_csv(csv_path, mode='a', header=False, index=False)
-        else:
-            df.to_csv(csv_path, index=False)
+    def handle_attendance_logged(self, rows):
+        """Rows the writer thread has committed (people already logged today are left out)"""
+        for name, emotion, timestamp in rows:
+            # Update recent table
+            self.add_to_recent_table(name, emotion, timestamp)
 
-        # Update recent table
-        self.add_to_recent_table(name, emotion, timestamp)
         self.update_status(
             len(self.parent_app.enrollments) if self.parent_app else 0
         )
 
-        # Show notification
-        QMessageBox.information(
-            self, "Attendance Logged",
-            f"{name} marked present with {emotion} emotion"
+        # Show notification, without blocking the video feed
+        self.parent_app.statusBar().showMessage(
+            ", ".join(f"{name} marked present with {emotion} emotion" for name, emotion, _ in rows),
+            5000
         )
 
     def add_to_recent_table(self, name, emotion, timestamp):
@@ -289,7 +353,8 @@ class EnrollmentTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_app = parent
-        self.current_frame = None
+        self.face_present = None  # Last answer from the enrollment thread
+        self.camera_id = 0  # Enrollment uses the first camera
         self.enrollment_active = False
         self.current_name = None
         self.captured_encodings = []
@@ -369,8 +434,15 @@ class EnrollmentTab(QWidget):
         """)
         self.capture_btn.clicked.connect(self.capture_sample)
 
+        self.auto_capture_btn = QPushButton("Auto Capture")
+        self.auto_capture_btn.setToolTip("Capture the remaining samples from the sharpest, most frontal frames")
+        self.auto_capture_btn.setEnabled(False)
+        self.auto_capture_btn.setStyleSheet(self.capture_btn.styleSheet())
+        self.auto_capture_btn.clicked.connect(self.auto_capture)
+
         btn_layout.addWidget(self.start_enroll_btn)
         btn_layout.addWidget(self.capture_btn)
+        btn_layout.addWidget(self.auto_capture_btn)
         enroll_layout.addLayout(btn_layout)
 
         self.status_label = QLabel("Ready to enroll")
@@ -416,44 +488,32 @@ class EnrollmentTab(QWidget):
         layout.addLayout(right_layout, 1)
         self.setLayout(layout)
 
-    def update_frame(self, frame):
-        """Update video display"""
-        self.current_frame = frame.copy()
-
-        if not self.enrollment_active:
-            # Just display the frame
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qt_image)
-            self.video_label.setPixmap(pixmap)
-
     def update_video_with_faces(self, face_detected):
-        """Update video with face detection overlay"""
-        if self.current_frame is None:
+        """Remember whether the enrollment thread sees exactly one face"""
+        self.face_present = face_detected
+
+    def render_frame(self, camera_id, frame):
+        """Update video display, with the face detection overlay while enrolling"""
+        if camera_id != self.camera_id:
             return
 
-        frame = self.current_frame.copy()
+        if self.enrollment_active and self.face_present is not None:
+            # Draw on a copy, never on the shared ring frame
+            frame = frame.copy()
 
-        # Simple face detection visualization
-        if face_detected:
-            cv2.putText(
-                frame, "Face detected - Ready to capture",
-                (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2
-            )
-        else:
-            cv2.putText(
-                frame, "Position your face in the frame",
-                (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2
-            )
+            # Simple face detection visualization
+            if self.face_present:
+                cv2.putText(
+                    frame, "Face detected - Ready to capture",
+                    (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2
+                )
+            else:
+                cv2.putText(
+                    frame, "Position your face in the frame",
+                    (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2
+                )
 
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = frame_rgb.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qt_image)
-        self.video_label.setPixmap(pixmap)
+        self.video_label.setPixmap(bgr_pixmap(frame))
 
     def start_enrollment(self):
         """Start enrollment process"""
@@ -473,9 +533,11 @@ class EnrollmentTab(QWidget):
 
         self.current_name = name
         self.captured_encodings = []
+        self.face_present = None
         self.enrollment_active = True
         self.start_enroll_btn.setEnabled(False)
         self.capture_btn.setEnabled(True)
+        self.auto_capture_btn.setEnabled(True)
         self.name_input.setEnabled(False)
         self.samples_spin.setEnabled(False)
         self.progress_bar.setMaximum(self.samples_spin.value())
@@ -491,6 +553,21 @@ class EnrollmentTab(QWidget):
         if self.parent_app and self.parent_app.enrollment_thread:
             self.parent_app.enrollment_thread.capture_sample()
 
+    def auto_capture(self):
+        """Let the enrollment thread pick the best frames of the next moments"""
+        if self.parent_app and self.parent_app.enrollment_thread:
+            self.auto_capture_btn.setEnabled(False)
+            self.status_label.setText("Auto capture: look at the camera and hold still...")
+            self.parent_app.enrollment_thread.capture_burst()
+
+    def burst_finished(self, captured):
+        """Re-enable auto capture; report if the burst fell short"""
+        if not self.enrollment_active:
+            return
+        self.auto_capture_btn.setEnabled(True)
+        if not captured:
+            self.status_label.setText("Auto capture found no usable face. Try again or press SPACE.")
+
     def update_progress(self, current, total):
         """Update progress bar"""
         self.progress_bar.setValue(current)
@@ -501,12 +578,12 @@ class EnrollmentTab(QWidget):
     def enrollment_complete(self, encodings):
         """Handle enrollment completion"""
         if self.parent_app:
-            self.parent_app.enrollments[self.current_name] = encodings
-            self.parent_app.save_enrollments()
+            self.parent_app.enroll_person(self.current_name, encodings)
 
         self.enrollment_active = False
         self.start_enroll_btn.setEnabled(True)
         self.capture_btn.setEnabled(False)
+        self.auto_capture_btn.setEnabled(False)
         self.name_input.setEnabled(True)
         self.name_input.clear()
         self.samples_spin.setEnabled(True)
@@ -555,8 +632,7 @@ class EnrollmentTab(QWidget):
 
         if reply == QMessageBox.Yes and self.parent_app:
             if name in self.parent_app.enrollments:
-                del self.parent_app.enrollments[name]
-                self.parent_app.save_enrollments()
+                self.parent_app.delete_person(name)
                 self.refresh_enrolled_list()
                 QMessageBox.information(self, "Success", f"{name} deleted")
 
@@ -572,6 +648,8 @@ class RecordsTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_app = parent
+        self.filters = {}  # Current filter, also applied to exports
+        self.export_thread = None
         self.init_ui()
 
     def init_ui(self):
@@ -616,10 +694,14 @@ class RecordsTab(QWidget):
         filter_group.setLayout(filter_layout)
         layout.addWidget(filter_group)
 
-        # Records table
-        self.records_table = QTableWidget()
-        self.records_table.setColumnCount(3)
-        self.records_table.setHorizontalHeaderLabels(["Name", "Emotion", "Timestamp"])
+        # Records table: rows are paged in from the store as it scrolls
+        self.records_model = RecordsModel(parent=self)
+        self.records_table = QTableView()
+        self.records_table.setModel(self.records_model)
+        self.records_model.loaded.connect(self.records_loaded)
+        # No initial sort indicator, so opening the tab does not load every record
+        self.records_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.records_table.setSortingEnabled(True)
         self.records_table.setColumnWidth(0, 200)
         self.records_table.setColumnWidth(1, 150)
         self.records_table.setColumnWidth(2, 200)
@@ -671,139 +753,110 @@ class RecordsTab(QWidget):
         self.setLayout(layout)
 
     def load_records(self):
-        """Load attendance records from CSV"""
-        csv_path = 'attendance.csv'
-        if not Path(csv_path).exists():
-            self.records_table.setRowCount(0)
-            self.stats_label.setText("Total Records: 0")
-            return
-
-        df = pd.read_csv(csv_path)
-        self.display_dataframe(df)
+        """Show all attendance records"""
+        self.filters = {}
+        self.display_records()
 
     def apply_filter(self):
-        """Apply filters to records"""
-        csv_path = 'attendance.csv'
-        if not Path(csv_path).exists():
-            return
-
-        df = pd.read_csv(csv_path)
-
-        # Date filter
-        date_from = self.date_from.date().toPyDate()
-        date_to = self.date_to.date().toPyDate()
-
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-        df = df[
-            (df['Timestamp'].dt.date >= date_from) &
-            (df['Timestamp'].dt.date <= date_to)
-        ]
-
-        # Name filter
-        name_filter = self.name_filter.text().strip()
-        if name_filter:
-            df = df[df['Name'].str.contains(name_filter, case=False, na=False)]
+        """Apply filters to the cached records"""
+        self.filters = {
+            'date_from': self.date_from.date().toPyDate(),
+            'date_to': self.date_to.date().toPyDate(),
+            'name': self.name_filter.text().strip() or None,
+        }
+        self.display_records()
 
-        self.display_dataframe(df)
+    def display_records(self):
+        """Point the table at the current filter; records are read on a worker thread"""
+        self.stats_label.setText("Loading records...")
+        self.records_model.set_filters(**self.filters)
 
-    def display_dataframe(self, df):
-        """Display dataframe in table"""
-        self.records_table.setRowCount(len(df))
-
-        for row_idx, row in df.iterrows():
-            self.records_table.setItem(
-                row_idx, 0, QTableWidgetItem(str(row['Name']))
-            )
-            self.records_table.setItem(
-                row_idx, 1, QTableWidgetItem(str(row['Emotion']))
-            )
-            self.records_table.setItem(
-                row_idx, 2, QTableWidgetItem(str(row['Timestamp']))
-            )
-
-        self.stats_label.setText(f"Total Records: {len(df)}")
+    def records_loaded(self, count):
+        """The model selected the filtered records"""
+        self.records_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.stats_label.setText(f"Total Records: {count}")
 
     def export_csv(self):
         """Export filtered records to CSV"""
-        filename, _ = QFileDialog.getSaveFileName(
-            self, "Export to CSV", "", "CSV Files (*.csv)"
-        )
-
-        if filename:
-            try:
-                rows = []
-                for row_idx in range(self.records_table.rowCount()):
-                    row_data = [
-                        self.records_table.item(row_idx, col).text()
-                        for col in range(3)
-                    ]
-                    rows.append(row_data)
-
-                df = pd.DataFrame(rows, columns=["Name", "Emotion", "Timestamp"])
-                df.to_csv(filename, index=False)
-
-                QMessageBox.information(
-                    self, "Success",
-                    f"Exported {len(df)} records to {filename}"
-                )
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Export failed: {e}")
+        self.start_export("Export to CSV", "CSV Files (*.csv)", '.csv')
 
     def export_excel(self):
         """Export filtered records to Excel"""
-        filename, _ = QFileDialog.getSaveFileName(
-            self, "Export to Excel", "", "Excel Files (*.xlsx)"
+        self.start_export("Export to Excel", "Excel Files (*.xlsx)", '.xlsx')
+
+    def start_export(self, title, file_filter, suffix):
+        """Export the current filter's records on a worker thread, with a cancellable progress dialog"""
+        if self.export_thread is not None:
+            return
+        filename, _ = QFileDialog.getSaveFileName(self, title, "", file_filter)
+        if not filename:
+            return
+        if not filename.lower().endswith(suffix):
+            filename += suffix
+
+        # The view's count; rows logged meanwhile are exported too
+        self.export_total = max(len(self.records_model.indices), 1)
+        self.export_dialog = QProgressDialog("Exporting records...", "Cancel", 0, self.export_total, self)
+        self.export_dialog.setWindowTitle(title)
+        self.export_dialog.setWindowModality(Qt.WindowModal)
+        self.export_dialog.setAutoReset(False)
+        self.export_dialog.setMinimumDuration(500)  # Quick exports finish without showing it
+
+        self.export_thread = ExportThread(filename, self.filters)
+        self.export_thread.progress.connect(self.update_export_progress)
+        self.export_thread.export_finished.connect(self.export_finished)
+        self.export_thread.export_failed.connect(self.export_failed)
+        self.export_thread.finished.connect(self.export_done)
+        self.export_dialog.canceled.connect(self.export_thread.cancel)
+        self.export_thread.start()
+
+    def update_export_progress(self, count):
+        self.export_dialog.setValue(min(count, self.export_total))
+        self.export_dialog.setLabelText(f"Exported {count} of {self.export_total} records...")
+
+    def export_finished(self, count):
+        self.export_dialog.close()
+        QMessageBox.information(
+            self, "Success",
+            f"Exported {count} records to {self.export_thread.path}"
         )
 
-        if filename:
-            try:
-                rows = []
-                for row_idx in range(self.records_table.rowCount()):
-                    row_data = [
-                        self.records_table.item(row_idx, col).text()
-                        for col in range(3)
-                    ]
-                    rows.append(row_data)
-
-                df = pd.DataFrame(rows, columns=["Name", "Emotion", "Timestamp"])
-                df.to_excel(filename, index=False)
-
-                QMessageBox.information(
-                    self, "Success",
-                    f"Exported {len(df)} records to {filename}"
-                )
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Export failed: {e}")
+    def export_failed(self, error):
+        self.export_dialog.close()
+        QMessageBox.critical(self, "Error", f"Export failed: {error}")
+
+    def export_done(self):
+        """Forget the finished (or cancelled) export"""
+        self.export_dialog.close()
+        self.export_dialog.deleteLater()
+        self.export_thread = None
+
+    def stop_export(self):
+        """Cancel a running export and wait for it to clean up"""
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            self.export_thread.wait()
 
 
 class DashboardTab(QWidget):
     """Tab for attendance analytics and visualizations"""
 
+    REFRESH_INTERVAL_MS = 1000
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_app = parent
+        self.shown_version = None  # (data version, day) last drawn
         self.init_ui()
 
+        # Redraws live while visible, only when something was logged
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_if_changed)
+        self.refresh_timer.start(self.REFRESH_INTERVAL_MS)
+
     def init_ui(self):
         layout = QVBoxLayout()
 
-        # Refresh button
-        refresh_btn = QPushButton("Refresh Dashboard")
-        refresh_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #3498db;
-                color: white;
-                padding: 10px;
-                border-radius: 5px;
-                font-size: 14px;
-            }
-            QPushButton:hover {
-                background-color: #2980b9;
-            }
-        """)
-        refresh_btn.clicked.connect(self.refresh_dashboard)
-        layout.addWidget(refresh_btn)
-
         # Charts container
         charts_layout = QHBoxLayout()
 
@@ -827,48 +880,59 @@ class DashboardTab(QWidget):
         self.unique_people_label = QLabel("Unique People: 0")
         self.today_count_label = QLabel("Today's Attendance: 0")
         self.most_common_emotion_label = QLabel("Most Common Emotion: N/A")
+        self.top_attendee_label = QLabel("Most Regular Attendee: N/A")
 
         stats_layout.addWidget(self.total_records_label)
         stats_layout.addWidget(self.unique_people_label)
         stats_layout.addWidget(self.today_count_label)
         stats_layout.addWidget(self.most_common_emotion_label)
+        stats_layout.addWidget(self.top_attendee_label)
 
         stats_group.setLayout(stats_layout)
         layout.addWidget(stats_group)
 
         self.setLayout(layout)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh_if_changed()
+
+    def refresh_if_changed(self):
+        """Redraw if records were logged (by any process) or the day changed since the last draw"""
+        if not self.isVisible():
+            return
+        version = (attendance_store.data_version(), datetime.now().date())
+        if version != self.shown_version:
+            self.shown_version = version
+            self.refresh_dashboard()
+
     def refresh_dashboard(self):
         """Refresh dashboard with latest data"""
-        csv_path = 'attendance.csv'
-        if not Path(csv_path).exists():
+        # Read from the rollups the database keeps, never the records themselves
+        summary = attendance_store.summary()
+        if not summary['total']:
             return
 
-        df = pd.read_csv(csv_path)
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-
         # Update statistics
-        self.total_records_label.setText(f"Total Records: {len(df)}")
-        self.unique_people_label.setText(f"Unique People: {df['Name'].nunique()}")
-
-        today = datetime.now().date()
-        today_df = df[df['Timestamp'].dt.date == today]
-        self.today_count_label.setText(f"Today's Attendance: {len(today_df)}")
+        self.total_records_label.setText(f"Total Records: {summary['total']}")
+        self.unique_people_label.setText(f"Unique People: {summary['people']}")
+        self.today_count_label.setText(f"Today's Attendance: {summary['today']}")
 
-        if not df.empty:
-            most_common = df['Emotion'].mode()[0]
-            self.most_common_emotion_label.setText(
-                f"Most Common Emotion: {most_common}"
-            )
+        most_common = summary['emotions'][0][0]
+        self.most_common_emotion_label.setText(
+            f"Most Common Emotion: {most_common}"
+        )
+        name, days = summary['attendees'][0]
+        self.top_attendee_label.setText(f"Most Regular Attendee: {name} ({days} days)")
 
         # Daily attendance chart
         self.daily_figure.clear()
         ax1 = self.daily_figure.add_subplot(111)
 
-        df['Date'] = df['Timestamp'].dt.date
-        daily_counts = df.groupby('Date').size()
+        days = [datetime.strptime(day, attendance_store.DAY_FORMAT).date() for day, _ in summary['daily']]
+        counts = [count for _, count in summary['daily']]
 
-        ax1.plot(daily_counts.index, daily_counts.values, marker='o', linewidth=2)
+        ax1.plot(days, counts, marker='o', linewidth=2)
         ax1.set_title('Daily Attendance Trend')
         ax1.set_xlabel('Date')
         ax1.set_ylabel('Count')
@@ -880,12 +944,12 @@ class DashboardTab(QWidget):
         self.emotion_figure.clear()
         ax2 = self.emotion_figure.add_subplot(111)
 
-        emotion_counts = df['Emotion'].value_counts()
-        colors = plt.cm.Paired(range(len(emotion_counts)))
+        emotions = [emotion for emotion, _ in summary['emotions']]
+        colors = plt.cm.Paired(range(len(emotions)))
 
         ax2.pie(
-            emotion_counts.values,
-            labels=emotion_counts.index,
+            [count for _, count in summary['emotions']],
+            labels=emotions,
             autopct='%1.1f%%',
             colors=colors,
             startangle=90
@@ -897,16 +961,34 @@ class DashboardTab(QWidget):
 class AttendanceApp(QMainWindow):
     """Main application window"""
 
-    def __init__(self):
+    def __init__(self, sources=None, workers=0):
         super().__init__()
         self.setWindowTitle("Face Recognition Attendance System")
         self.setGeometry(100, 100, 1200, 800)
 
-        # Load enrollments
+        # Camera indices, RTSP URLs or video files; camera ids are positions
+        self.sources = [parse_source(source) for source in (sources or [0])]
+        # Recognition worker processes; 0 runs recognition on one thread
+        self.workers = workers
+
+        # Load enrollments (memory-mapped, so instant whatever the gallery size)
+        self.enrollments_path = ENROLLMENTS_PATH
         self.enrollments = self.load_enrollments()
+        # Index builds run on an IndexBuildThread; the version counts
+        # enrollment changes so a stale build is redone. Until a saved index
+        # is valid, recognition uses exact search.
+        self.ann_index = None
+        self.enrollments_version = 0
+        self.index_builder = None
+        self.index_build_pending = False
+        if len(self.enrollments) >= ann_index.ANN_MIN_IDENTITIES:
+            self.ann_index = ann_index.load_saved(self.enrollments, self.enrollments_path)
+            if self.ann_index is None:
+                self.build_index()
 
         # Initialize threads
-        self.camera_thread = None
+        self.camera_threads = []
+        self.attendance_writer = None
         self.face_recognition_thread = None
         self.emotion_thread = None
         self.enrollment_thread = None
@@ -958,6 +1040,17 @@ class AttendanceApp(QMainWindow):
         layout.addWidget(self.tabs)
         central_widget.setLayout(layout)
 
+        # Paints camera frames on whichever video tab is showing
+        self.display = FrameDisplay(self.tabs, parent=self)
+        self.live_tab.set_cameras({
+            camera_id: describe_source(source) for camera_id, source in enumerate(self.sources)
+        })
+
+        # Refresh per-camera FPS and drop counters once a second
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_camera_stats)
+        self.stats_timer.start(1000)
+
         # Initial updates
         self.live_tab.update_status(len(self.enrollments))
         self.enrollment_tab.refresh_enrolled_list()
@@ -965,14 +1058,26 @@ class AttendanceApp(QMainWindow):
 
     def start_threads(self):
         """Start background worker threads"""
-        # Camera thread
-        self.camera_thread = CameraThread(camera_index=0)
-        self.camera_thread.frame_ready.connect(self.handle_frame)
-        self.camera_thread.start()
-
-        # Face recognition thread
-        self.face_recognition_thread = FaceRecognitionThread()
-        self.face_recognition_thread.set_enrollments(self.enrollments)
+        # Attendance is written (and the database opened) on its own thread
+        self.attendance_writer = AttendanceWriterThread()
+        self.attendance_writer.batch_logged.connect(self.live_tab.handle_attendance_logged)
+        self.attendance_writer.start()
+
+        # One capture thread per camera; everything after them is shared
+        for camera_id, source in enumerate(self.sources):
+            # With a process pool, frames live in shared memory so workers read
+            # them without a copy, and each worker may hold two of them
+            camera_thread = CameraThread(
+                source, camera_id, ring_slots=8 + 2 * self.workers, shared_frames=bool(self.workers)
+            )
+            camera_thread.frame_ready.connect(self.handle_frame)
+            camera_thread.start()
+            self.camera_threads.append(camera_thread)
+        self.display.start()
+
+        # Face recognition thread, shared by all cameras
+        self.face_recognition_thread = FaceRecognitionThread(workers=self.workers)
+        self.face_recognition_thread.set_enrollments(self.enrollments, index=self.ann_index)
         self.face_recognition_thread.faces_detected.connect(
             self.live_tab.handle_face_detected
         )
@@ -997,49 +1102,133 @@ class AttendanceApp(QMainWindow):
         self.enrollment_thread.face_detected.connect(
             self.enrollment_tab.update_video_with_faces
         )
+        self.enrollment_thread.burst_finished.connect(
+            self.enrollment_tab.burst_finished
+        )
         self.enrollment_thread.enrollment_complete.connect(
             self.enrollment_tab.enrollment_complete
         )
         self.enrollment_thread.start()
 
-    @pyqtSlot(np.ndarray)
-    def handle_frame(self, frame):
-        """Handle new frame from camera"""
-        # Update displays
-        self.live_tab.update_frame(frame)
-        self.enrollment_tab.update_frame(frame)
-
-        # Send to recognition thread if active
-        if self.live_tab.recognition_active:
-            self.face_recognition_thread.set_frame(frame)
-
-        # Send to enrollment thread if active
-        if self.enrollment_tab.enrollment_active and self.enrollment_thread:
-            self.enrollment_thread.set_frame(frame)
+    @pyqtSlot(int, object)
+    def handle_frame(self, camera_id, frame_ref):
+        """Handle new frame from a camera; each consumer retains its own reference"""
+        try:
+            # Only the visible tab is painted, at the screen refresh rate
+            self.display.set_frame(camera_id, frame_ref)
+            self.live_tab.update_frame(camera_id, frame_ref)
+
+            # Send to recognition thread if active
+            if self.live_tab.recognition_active:
+                self.face_recognition_thread.set_frame(camera_id, frame_ref)
+
+            # Send to enrollment thread if active
+            if (self.enrollment_tab.enrollment_active and self.enrollment_thread
+                    and camera_id == self.enrollment_tab.camera_id):
+                self.enrollment_thread.set_frame(frame_ref)
+        finally:
+            # The reference emitted by the camera thread
+            frame_ref.release()
 
     def load_enrollments(self):
-        """Load enrollments from file"""
-        path = 'enrollments.pkl'
-        if not Path(path).exists():
-            return {}
-
-        with open(path, 'rb') as f:
-            return pickle.load(f)
-
-    def save_enrollments(self):
-        """Save enrollments to file"""
-        path = 'enrollments.pkl'
-        with open(path, 'wb') as f:
-            pickle.dump(self.enrollments, f)
+        """Open the enrollment store"""
+        store = EnrollmentStore(self.enrollments_path)
+        if not len(store) and Path('enrollments.pkl').exists():
+            print("Found enrollments.pkl from an older version; import it with: "
+                  "python enrollment_store.py import enrollments.pkl")
+        return store
+
+    def enroll_person(self, name, encodings):
+        """Add or replace a person and update the ANN index incrementally"""
+        if self.ann_index is not None:
+            if name in self.enrollments:
+                self.ann_index.remove(name)
+            self.ann_index.add(name, encodings)
+
+        self.enrollments.add(name, encodings)
+        self.enrollments_changed(name, encodings)
+
+    def delete_person(self, name):
+        """Remove a person and drop their samples from the ANN index"""
+        if self.ann_index is not None:
+            self.ann_index.remove(name)
+
+        self.enrollments.remove(name)
+        self.enrollments_changed(name)
+
+    def enrollments_changed(self, name, encodings=None):
+        """Update the ANN index and the recognition thread after one person was enrolled or removed"""
+        self.enrollments_version += 1
+
+        # Build the index once the gallery crosses the ANN threshold, retrain
+        # when it has outgrown its centroids, otherwise persist the update.
+        # Builds run in the background; until one lands the old index (kept
+        # up to date incrementally) or exact search keeps serving matches.
+        if self.ann_index is None:
+            if len(self.enrollments) >= ann_index.ANN_MIN_IDENTITIES:
+                self.build_index()
+        elif self.ann_index.needs_retrain():
+            self.build_index()
+        elif self.index_builder is None:
+            self.ann_index.save(ann_index.index_path_for(self.enrollments_path))
+
+        # Only this person's samples change in the running gallery
+        if self.face_recognition_thread:
+            self.face_recognition_thread.update_person(name, encodings, self.enrollments, self.ann_index)
 
-        # Update face recognition thread
+    def build_index(self):
+        """Start a background index build, or queue one behind the build in progress"""
+        if self.index_builder is not None:
+            self.index_build_pending = True
+            return
+        self.index_build_pending = False
+        self.index_builder = IndexBuildThread(self.enrollments_path, self.enrollments_version)
+        self.index_builder.index_built.connect(self.index_built)
+        self.index_builder.build_failed.connect(self.index_build_failed)
+        self.index_builder.finished.connect(self.index_build_finished)
+        self.index_builder.start()
+
+    @pyqtSlot(object, int)
+    def index_built(self, index, version):
+        """Swap in the rebuilt index unless people were enrolled or removed while it was built"""
+        if version != self.enrollments_version:
+            self.index_build_pending = True
+            return
+        self.ann_index = index
         if self.face_recognition_thread:
-            self.face_recognition_thread.set_enrollments(self.enrollments)
+            self.face_recognition_thread.set_index(index, self.enrollments)
+
+    @pyqtSlot(str)
+    def index_build_failed(self, message):
+        print(f"Error building ANN index: {message}")
+
+    @pyqtSlot()
+    def index_build_finished(self):
+        self.index_builder.deleteLater()
+        self.index_builder = None
+        if self.index_build_pending:
+            self.build_index()
+
+    def update_camera_stats(self):
+        """Per-camera FPS, frames dropped by the camera ring and by recognition"""
+        lanes = self.face_recognition_thread.stats()['lanes'] if self.face_recognition_thread else {}
+        camera_stats = {}
+        for camera_thread in self.camera_threads:
+            stats = camera_thread.stats()
+            camera_stats[camera_thread.camera_id] = {
+                'fps': stats['fps'],
+                'dropped': stats.get('dropped', 0),
+                'skipped': lanes.get(camera_thread.camera_id, {}).get('dropped', 0),
+            }
+        self.live_tab.update_camera_stats(camera_stats)
 
     def closeEvent(self, event):
         """Clean up on close"""
-        if self.camera_thread:
-            self.camera_thread.stop()
+        self.stats_timer.stop()
+        self.display.stop()
+
+        for camera_thread in self.camera_threads:
+            camera_thread.stop()
 
         if self.face_recognition_thread:
             self.face_recognition_thread.stop()
@@ -1050,12 +1239,32 @@ class AttendanceApp(QMainWindow):
         if self.enrollment_thread:
             self.enrollment_thread.stop()
 
+        self.records_tab.stop_export()
+        self.records_tab.records_model.wait()
+        if self.index_builder:
+            self.index_builder.wait()
+
+        # Last: commits the attendance the stages above produced
+        if self.attendance_writer:
+            self.attendance_writer.stop()
+
         event.accept()
 
 
 def main():
-    app = QApplication(sys.argv)
-    window = AttendanceApp()
+    parser = argparse.ArgumentParser(description="Face recognition attendance system")
+    parser.add_argument(
+        '--camera', action='append', dest='cameras', metavar='SOURCE',
+        help="Camera index, RTSP URL or video file; repeat for several entrances (default: 0)"
+    )
+    parser.add_argument(
+        '--workers', type=int, default=0, metavar='N',
+        help="Recognition worker processes, e.g. the number of CPU cores (default: 0, one recognition thread)"
+    )
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = AttendanceApp(args.cameras, args.workers)
     window.show()
     sys.exit(app.exec_())
 
@@ -0,0 +1,258 @@
+"""
+Columnar archive of past attendance, one Parquet directory per month.
+
+The live log (attendance_store, SQLite) only has to hold recent days;
+compact() moves older rows into attendance_archive/month=YYYY-MM/*.parquet
+with typed columns: dictionary-encoded name, emotion and day, int64 epoch
+timestamp. Files are sorted by time and written in row groups, so a
+date-range query opens only the months it overlaps and skips row groups by
+their timestamp statistics. Requires pyarrow; without it the archive can
+neither be written nor read.
+
+Usage:
+    python attendance_archive.py compact [--keep-days 31]   # e.g. nightly from cron
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+import attendance_store
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only the archive needs it
+    pa = None
+
+
+ROW_GROUP_SIZE = 65536
+DEFAULT_KEEP_DAYS = 31
+
+
+def _schema():
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([('name', text), ('emotion', text), ('ts', pa.int64()), ('day', text)])
+
+
+def _require():
+    if pa is None:
+        raise ImportError("The attendance archive needs pyarrow: pip install pyarrow")
+
+
+def parts(archive_dir=attendance_store.ARCHIVE_DIR):
+    """The archive's Parquet files, in time order"""
+    return sorted(Path(archive_dir).glob('month=*/*.parquet'))
+
+
+def exists(archive_dir=attendance_store.ARCHIVE_DIR):
+    """True once anything has been archived"""
+    return any(Path(archive_dir).glob('month=*/*.parquet'))
+
+
+def _month_start(day):
+    return datetime(day.year, day.month, 1)
+
+
+def _next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def _months(first_ts, last_ts):
+    """(start, end) local datetimes of every month from first_ts to last_ts"""
+    start = _month_start(datetime.fromtimestamp(first_ts))
+    while start.timestamp() <= last_ts:
+        end = _next_month(start)
+        yield start, end
+        start = end
+
+
+def _day_column(ts):
+    """'YYYY-MM-DD' of each (sorted) epoch timestamp, dictionary-encoded"""
+    first = datetime.fromtimestamp(ts[0]).date()
+    days = [first + timedelta(days=n) for n in range((datetime.fromtimestamp(ts[-1]).date() - first).days + 1)]
+    bounds = np.array([attendance_store._epoch(day) for day in days[1:]], dtype=np.int64)
+    indices = np.searchsorted(bounds, ts, side='right').astype(np.int32)
+    return pa.DictionaryArray.from_arrays(indices, [day.strftime(attendance_store.DAY_FORMAT) for day in days])
+
+
+def _dictionary(column):
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    if not pa.types.is_dictionary(column.type):
+        column = column.dictionary_encode()
+    return column.cast(pa.dictionary(pa.int32(), pa.string()))
+
+
+def write_table(table, archive_dir=attendance_store.ARCHIVE_DIR, part='0'):
+    """
+    Add a table with name, emotion and ts (epoch seconds) columns to the
+    archive, one file per month it spans, named part-<part>.parquet. A
+    file of the same name is replaced, so re-running a compaction that
+    was interrupted does not duplicate rows. Returns the files written.
+    """
+    _require()
+    if not table.num_rows:
+        return []
+    table = table.sort_by('ts')
+    ts = table['ts'].to_numpy()
+
+    written = []
+    for start, end in _months(ts[0], ts[-1]):
+        lo, hi = np.searchsorted(ts, [start.timestamp(), end.timestamp()])
+        if lo == hi:
+            continue
+        chunk = table.slice(lo, hi - lo)
+        month = pa.Table.from_arrays([
+            _dictionary(chunk['name']),
+            _dictionary(chunk['emotion']),
+            chunk['ts'].combine_chunks().cast(pa.int64()),
+            _day_column(ts[lo:hi]),
+        ], schema=_schema())
+
+        directory = Path(archive_dir) / f"month={start:%Y-%m}"
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"part-{part}.parquet"
+        # Written aside (hidden from readers) and renamed, so nobody sees half a file
+        temporary = directory / f".{path.name}.tmp"
+        pq.write_table(month, temporary, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temporary, path)
+        written.append(path)
+    return written
+
+
+def compact(db_path=attendance_store.DB_PATH, archive_dir=None, keep_days=DEFAULT_KEEP_DAYS):
+    """
+    Move live rows older than keep_days into the archive, a month at a
+    time, and delete them from the live log. Returns the number of rows
+    moved.
+    """
+    _require()
+    archive_dir = attendance_store.archive_dir_for(db_path, archive_dir)
+    conn = attendance_store.connect(db_path)
+    cutoff = attendance_store._epoch(datetime.now().date() - timedelta(days=keep_days))
+    first = conn.execute('SELECT MIN(ts) FROM attendance WHERE ts < ?', (cutoff,)).fetchone()[0]
+    if first is None:
+        return 0
+
+    moved = 0
+    for start, end in _months(first, cutoff - 1):
+        rows = conn.execute(
+            'SELECT id, name, emotion, ts FROM attendance WHERE ts >= ? AND ts < ? ORDER BY ts',
+            (int(start.timestamp()), min(int(end.timestamp()), cutoff))
+        ).fetchall()
+        if not rows:
+            continue
+
+        ids, names, emotions, ts = zip(*rows)
+        table = pa.table({'name': names, 'emotion': emotions, 'ts': pa.array(ts, pa.int64())})
+        write_table(table, archive_dir, part=f"{ts[0]:011d}-{max(ids):010d}")
+
+        # Only deleted once the month is safely on disk; from then on
+        # writes to these days are checked against the archive
+        with conn:
+            conn.execute(
+                attendance_store.ARCHIVED_BEFORE_SQL,
+                (attendance_store.ARCHIVED_BEFORE, min(int(end.timestamp()), cutoff))
+            )
+            conn.execute(
+                'DELETE FROM attendance WHERE ts >= ? AND ts < ? AND id <= ?',
+                (int(start.timestamp()), min(int(end.timestamp()), cutoff), max(ids))
+            )
+        moved += len(rows)
+    return moved
+
+
+def dataset(archive_dir=attendance_store.ARCHIVE_DIR):
+    _require()
+    return ds.dataset(
+        str(archive_dir), schema=_schema().append(pa.field('month', pa.string())), format='parquet',
+        partitioning=ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive'),
+        ignore_prefixes=['.', '_'],
+    )
+
+
+def _filters(date_from=None, date_to=None, name=None):
+    """
+    (partition filter, row filter): the month bounds prune whole month
+    directories, the timestamp bounds skip row groups by their statistics
+    """
+    months = rows = ds.scalar(True)
+    if date_from is not None:
+        months &= ds.field('month') >= f"{date_from:%Y-%m}"
+        rows &= ds.field('ts') >= attendance_store._epoch(date_from)
+    if date_to is not None:
+        months &= ds.field('month') <= f"{date_to:%Y-%m}"
+        rows &= ds.field('ts') < attendance_store._epoch(date_to + timedelta(days=1))
+    if name:
+        rows &= pc.match_substring(ds.field('name').cast(pa.string()), name, ignore_case=True)
+    return months, rows
+
+
+def _encoded(column):
+    """(dictionary, int32 indices) of a dictionary column"""
+    return column.dictionary.to_pylist(), column.indices.to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+
+
+def batches(archive_dir=attendance_store.ARCHIVE_DIR, date_from=None, date_to=None, name=None):
+    """
+    Archived rows in columnar batches (names, name indices, emotions,
+    emotion indices, ts), oldest first, with the same filters as
+    attendance_store.records
+    """
+    months, rows = _filters(date_from, date_to, name)
+    fragments = sorted(dataset(archive_dir).get_fragments(filter=months), key=lambda fragment: fragment.path)
+    for fragment in fragments:
+        for batch in fragment.to_batches(columns=['name', 'emotion', 'ts'], filter=rows):
+            if batch.num_rows:
+                yield (*_encoded(batch.column('name')), *_encoded(batch.column('emotion')),
+                       batch.column('ts').to_numpy())
+
+
+def records(archive_dir=attendance_store.ARCHIVE_DIR, date_from=None, date_to=None, name=None):
+    """Archived (name, emotion, timestamp) rows, oldest first, read lazily batch by batch"""
+    for names, name_codes, emotions, emotion_codes, ts in batches(archive_dir, date_from, date_to, name):
+        # Dictionary lookups per row; to_pylist() on dictionary columns is much slower
+        for name_code, emotion_code, seconds in zip(name_codes.tolist(), emotion_codes.tolist(), ts.tolist()):
+            yield names[name_code], emotions[emotion_code], attendance_store.format_timestamp(seconds)
+
+
+def logged_days(archive_dir=attendance_store.ARCHIVE_DIR, date_from=None, date_to=None):
+    """Archived (name, 'YYYY-MM-DD') pairs within date_from..date_to (inclusive)"""
+    months, rows = _filters(date_from, date_to)
+    table = dataset(archive_dir).to_table(columns=['name', 'day'], filter=months & rows)
+    return set(zip(table['name'].cast(pa.string()).to_pylist(), table['day'].cast(pa.string()).to_pylist()))
+
+
+def counts(archive_dir=attendance_store.ARCHIVE_DIR):
+    """Archived record counts per day, emotion and name: {column: {value: count}}"""
+    table = dataset(archive_dir).to_table(columns=['name', 'emotion', 'day'])
+
+    def count(column):
+        grouped = table.select([column]).cast(pa.schema([(column, pa.string())])).group_by(column).aggregate(
+            [([], 'count_all')]
+        )
+        return dict(zip(grouped[column].to_pylist(), grouped['count_all'].to_pylist()))
+
+    return {column: count(column) for column in ('day', 'emotion', 'name')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll old attendance from the live log into the Parquet archive")
+    commands = parser.add_subparsers(dest='command', required=True)
+    compact_parser = commands.add_parser('compact', help="Archive rows older than --keep-days")
+    compact_parser.add_argument('--database', default=attendance_store.DB_PATH)
+    compact_parser.add_argument('--archive', help=f"Default: {attendance_store.ARCHIVE_DIR} next to the database")
+    compact_parser.add_argument('--keep-days', type=int, default=DEFAULT_KEEP_DAYS,
+                                help="Days kept in the live log")
+    args = parser.parse_args()
+
+    moved = compact(args.database, args.archive, args.keep_days)
+    print(f"Archived {moved} records to {attendance_store.archive_dir_for(args.database, args.archive)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+"""
+Headless recognition daemon for servers without a display.
+
+Cameras, recognition, emotion detection and attendance logging run
+without Qt, coordinated by an asyncio event loop; blocking camera reads
+and the dlib and TensorFlow calls are offloaded to executor threads.
+
+Usage:
+    python attendance_daemon.py --camera 0 --camera rtsp://10.0.0.12/stream [--port 8765]
+
+    kill -HUP <pid>                    # reload enrollments
+    kill -TERM <pid>                   # finish in-flight work and exit
+    curl http://127.0.0.1:8765/health  # 200 while every camera delivers frames
+    curl http://127.0.0.1:8765/stats
+"""
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import ann_index
+import attendance_store
+from enrollment_store import ENROLLMENTS_PATH, EnrollmentStore
+from emotion import EmotionModel, cache_key, crop_face, shared_cache
+from gallery import UNKNOWN
+from recognition import Recognizer
+from sources import Capture, describe_source
+
+
+class AttendanceDaemon:
+    """
+    Round-robins the newest frame of every camera through one shared
+    Recognizer, requests an emotion once a track has held an identity for
+    `dwell` seconds and logs each person once per day.
+
+    Each executor has a single purpose: one thread per camera for blocking
+    reads, one thread for detection/matching (so the gallery is only ever
+    swapped between two frames), one for emotion batches and one for file
+    I/O. The event loop itself never blocks.
+    """
+    LOG_ATTEMPTS = 3  # Tries per attendance write before giving up on it
+
+    def __init__(self, sources, enrollments_path=ENROLLMENTS_PATH, host='127.0.0.1', port=8765,
+                 tolerance=0.6, dwell=3.0, process_every_n_frames=3, emotion_batch=32,
+                 max_pending_emotions=64, stale_after=10.0):
+        self.captures = {camera_id: Capture(source, ring_slots=4) for camera_id, source in enumerate(sources)}
+        self.enrollments_path = enrollments_path
+        self.host = host
+        self.port = port
+        self.tolerance = tolerance
+        self.dwell = dwell
+        self.process_every_n_frames = process_every_n_frames
+        self.emotion_batch = emotion_batch
+        self.stale_after = stale_after
+
+        self.recognizer = Recognizer()
+        self.emotion_model = None
+        # One thread per camera: a capture is opened, read and closed on the
+        # same thread, so close() can never interrupt a read()
+        self.capture_executors = {
+            camera_id: ThreadPoolExecutor(1, thread_name_prefix=f'capture-{camera_id}')
+            for camera_id in self.captures
+        }
+        self.recognition_executor = ThreadPoolExecutor(1, thread_name_prefix='recognition')
+        self.emotion_executor = ThreadPoolExecutor(1, thread_name_prefix='emotion')
+        self.io_executor = ThreadPoolExecutor(1, thread_name_prefix='io')
+
+        self.pending = {}  # camera id -> newest FrameRef waiting for recognition
+        self.last_served = -1
+        self.timers = {}  # track id -> name, first_seen, last_seen, emotion_requested
+        self.logged = set()  # (name, day)
+        self.writes = set()  # Attendance writes in progress
+        self.emotion_queue = asyncio.Queue(max_pending_emotions)
+
+        self.started = time.monotonic()
+        self.enrolled = 0
+        self.counters = {
+            'frames_recognized': 0, 'recognition_seconds': 0.0, 'frames_skipped': 0,
+            'emotion_batches': 0, 'emotions_dropped': 0, 'attendance_logged': 0, 'attendance_failed': 0,
+            'reloads': 0,
+        }
+        self.camera_frames = {camera_id: 0 for camera_id in self.captures}
+        self.camera_last_frame = {camera_id: None for camera_id in self.captures}
+
+    # -- Setup -------------------------------------------------------------
+
+    def load_gallery(self):
+        """Enrollments and ANN index from disk; runs on the I/O executor"""
+        enrollments = EnrollmentStore(self.enrollments_path)
+        return enrollments, ann_index.load_or_build(enrollments, self.enrollments_path)
+
+    async def reload(self):
+        """(Re)load the gallery; also what SIGHUP does"""
+        loop = asyncio.get_running_loop()
+        try:
+            enrollments, index = await loop.run_in_executor(self.io_executor, self.load_gallery)
+        except Exception as e:
+            print(f"Error loading enrollments: {e}")
+            return
+
+        # Swapped on the recognition thread, between two frames
+        await loop.run_in_executor(
+            self.recognition_executor, self.recognizer.set_enrollments, enrollments, self.tolerance, index
+        )
+        self.enrolled = len(enrollments)
+        self.counters['reloads'] += 1
+        print(f"Loaded {self.enrolled} enrollments from {self.enrollments_path}")
+
+    # -- Pipeline ----------------------------------------------------------
+
+    async def capture_loop(self, camera_id):
+        loop = asyncio.get_running_loop()
+        capture = self.captures[camera_id]
+        executor = self.capture_executors[camera_id]
+        if not await loop.run_in_executor(executor, capture.open):
+            return
+
+        try:
+            while not capture.finished:
+                frame_ref = await loop.run_in_executor(executor, capture.read)
+                if frame_ref is None:
+                    continue
+
+                self.camera_frames[camera_id] += 1
+                self.camera_last_frame[camera_id] = time.monotonic()
+                if self.camera_frames[camera_id] % self.process_every_n_frames:
+                    frame_ref.release()
+                    continue
+
+                # Latest wins: an unprocessed older frame of this camera is dropped
+                previous = self.pending.pop(camera_id, None)
+                if previous is not None:
+                    previous.release()
+                    self.counters['frames_skipped'] += 1
+                self.pending[camera_id] = frame_ref
+                self.frame_ready.set()
+        finally:
+            # Queued on the camera's thread behind a read that may still be running
+            await loop.run_in_executor(executor, capture.close)
+
+    def next_camera(self):
+        """The next camera after the last one served that has a frame waiting"""
+        waiting = sorted(self.pending)
+        if not waiting:
+            return None
+        later = [camera_id for camera_id in waiting if camera_id > self.last_served]
+        self.last_served = later[0] if later else waiting[0]
+        return self.last_served
+
+    async def recognition_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.frame_ready.wait()
+            if self.stopping.is_set():
+                return
+            camera_id = self.next_camera()
+            if camera_id is None:
+                self.frame_ready.clear()
+                continue
+
+            frame_ref = self.pending.pop(camera_id)
+            try:
+                started = time.perf_counter()
+                results = await loop.run_in_executor(
+                    self.recognition_executor, self.recognizer.recognize, camera_id, frame_ref.image
+                )
+                self.counters['recognition_seconds'] += time.perf_counter() - started
+                self.counters['frames_recognized'] += 1
+                self.handle_faces(camera_id, frame_ref.image, *results)
+            except Exception as e:
+                print(f"Error in recognition: {e}")
+            finally:
+                # Only once the recognition thread is done reading the slot
+                frame_ref.release()
+
+    def handle_faces(self, camera_id, frame, face_locations, names, confidences, track_ids):
+        """Per-track timers, as in the live tab: ask for an emotion after `dwell` seconds"""
+        now = time.monotonic()
+        today = datetime.now().strftime('%Y-%m-%d')
+
+        for face_location, name, track_id in zip(face_locations, names, track_ids):
+            if name == UNKNOWN:
+                continue
+
+            timer = self.timers.get(track_id)
+            if timer is None or timer['name'] != name:
+                timer = self.timers[track_id] = {
+                    'name': name, 'first_seen': now, 'emotion_requested': False
+                }
+            timer['last_seen'] = now
+
+            if timer['emotion_requested'] or now - timer['first_seen'] < self.dwell:
+                continue
+            timer['emotion_requested'] = True
+            if (name, today) in self.logged:
+                continue
+
+            cached = shared_cache.get(cache_key(name, track_id))
+            if cached is not None:
+                self.log(name, cached)
+                continue
+
+            crop = crop_face(frame, face_location)
+            if crop is None:  # Face region too small to classify
+                timer['emotion_requested'] = False
+                continue
+            if self.emotion_queue.full():
+                self.emotion_queue.get_nowait()  # Oldest request goes
+                self.counters['emotions_dropped'] += 1
+            self.emotion_queue.put_nowait((camera_id, track_id, name, crop))
+
+        # Forget tracks that left the frame a while ago
+        self.timers = {
+            track_id: timer for track_id, timer in self.timers.items()
+            if now - timer['last_seen'] < 10
+        }
+
+    def classify(self, crops):
+        # Load TensorFlow on the emotion thread, on first use
+        if self.emotion_model is None:
+            self.emotion_model = EmotionModel()
+        return self.emotion_model.predict(crops)
+
+    async def emotion_loop(self):
+        """Classify queued crops in batches until the None that run() queues on shutdown"""
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            tasks = []
+            while not tasks or (not self.emotion_queue.empty() and len(tasks) < self.emotion_batch):
+                task = await self.emotion_queue.get()
+                if task is None:
+                    finished = True
+                    break
+                tasks.append(task)
+            if not tasks:
+                break
+
+            try:
+                emotions = await loop.run_in_executor(
+                    self.emotion_executor, self.classify, [crop for _, _, _, crop in tasks]
+                )
+            except Exception as e:
+                print(f"Error detecting emotion: {e}")
+                emotions = ["unknown"] * len(tasks)
+            self.counters['emotion_batches'] += 1
+
+            for (_, track_id, name, _), emotion in zip(tasks, emotions):
+                if emotion != "unknown":
+                    shared_cache.put(cache_key(name, track_id), emotion)
+                self.log(name, emotion)
+
+    def log(self, name, emotion):
+        """Log a person once per day; the database write happens on the I/O executor"""
+        now = datetime.now()
+        day = (name, now.strftime('%Y-%m-%d'))
+        if day in self.logged:
+            return
+        self.logged.add(day)
+        write = asyncio.ensure_future(self.write_attendance(name, emotion, now, day))
+        self.writes.add(write)
+        write.add_done_callback(self.writes.discard)
+
+    async def write_attendance(self, name, emotion, timestamp, day):
+        """Write one attendance row, retrying; if it cannot be written the person can be logged again"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, self.LOG_ATTEMPTS + 1):
+            try:
+                await loop.run_in_executor(
+                    self.io_executor, attendance_store.log_attendance,
+                    name, emotion, attendance_store.DB_PATH, timestamp
+                )
+                self.counters['attendance_logged'] += 1
+                print(f"Logged: {name} - {emotion}")
+                return
+            except Exception as e:
+                print(f"Error logging attendance for {name} (attempt {attempt}/{self.LOG_ATTEMPTS}): {e}")
+                if attempt < self.LOG_ATTEMPTS:
+                    await asyncio.sleep(attempt)
+
+        self.logged.discard(day)
+        self.counters['attendance_failed'] += 1
+
+    # -- Health and stats --------------------------------------------------
+
+    def stats(self):
+        now = time.monotonic()
+        cameras = {}
+        for camera_id, capture in self.captures.items():
+            last = self.camera_last_frame[camera_id]
+            cameras[camera_id] = dict(
+                capture.stats(),
+                frames=self.camera_frames[camera_id],
+                seconds_since_frame=None if last is None else round(now - last, 3),
+            )
+
+        recognized = self.counters['frames_recognized']
+        return {
+            'uptime': round(now - self.started, 1),
+            'enrolled': self.enrolled,
+            'cameras': cameras,
+            'recognition_ms': 1000 * self.counters['recognition_seconds'] / recognized if recognized else 0.0,
+            'emotion_queue': self.emotion_queue.qsize(),
+            'emotion_cache': shared_cache.stats(),
+            'counters': self.counters,
+            'modules': {name: name in sys.modules for name in ('PyQt5', 'matplotlib', 'tensorflow')},
+        }
+
+    def healthy(self):
+        """Every camera delivered a frame within stale_after seconds"""
+        now = time.monotonic()
+        return all(
+            last is not None and now - last < self.stale_after
+            for last in self.camera_last_frame.values()
+        )
+
+    async def handle_http(self, reader, writer):
+        """Minimal HTTP/1.0: GET /health and GET /stats, JSON bodies"""
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()).strip():
+                pass  # Headers are not needed
+
+            path = request[1] if len(request) > 1 else ''
+            if path == '/health':
+                healthy = self.healthy()
+                status = '200 OK' if healthy else '503 Service Unavailable'
+                body = {'status': 'ok' if healthy else 'degraded', 'uptime': round(time.monotonic() - self.started, 1)}
+            elif path == '/stats':
+                status, body = '200 OK', self.stats()
+            else:
+                status, body = '404 Not Found', {'error': 'not found'}
+
+            payload = json.dumps(body, default=str).encode()
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except Exception as e:
+            print(f"Error serving stats: {e}")
+        finally:
+            writer.close()
+
+    # -- Lifecycle ---------------------------------------------------------
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.frame_ready = asyncio.Event()
+        self.stopping = asyncio.Event()
+        # Seeded from the database so a restart does not log anyone twice
+        self.logged = await loop.run_in_executor(
+            self.io_executor, attendance_store.logged_days, attendance_store.DB_PATH, datetime.now().date()
+        )
+
+        loop.add_signal_handler(signal.SIGTERM, self.stopping.set)
+        loop.add_signal_handler(signal.SIGINT, self.stopping.set)
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.reload()))
+
+        await self.reload()
+        server = await asyncio.start_server(self.handle_http, self.host, self.port)
+        print(f"Serving health and stats on http://{self.host}:{self.port}, "
+              f"cameras: {', '.join(describe_source(c.source) for c in self.captures.values())}")
+
+        frame_tasks = [asyncio.ensure_future(self.capture_loop(camera_id)) for camera_id in self.captures]
+        frame_tasks.append(asyncio.ensure_future(self.recognition_loop()))
+        emotion_task = asyncio.ensure_future(self.emotion_loop())
+
+        await self.stopping.wait()
+        print("Shutting down")
+
+        server.close()
+        await server.wait_closed()
+
+        # Every loop finishes the call it is waiting on and exits by itself
+        for capture in self.captures.values():
+            capture.finished = True  # Capture loops exit after their current read
+        self.frame_ready.set()  # Recognition exits after its current frame
+        await asyncio.gather(*frame_tasks, return_exceptions=True)
+        for frame_ref in self.pending.values():
+            frame_ref.release()
+        self.pending.clear()
+
+        # No more emotion requests: classify and log what is queued, then stop
+        await self.emotion_queue.put(None)
+        await asyncio.gather(emotion_task, return_exceptions=True)
+        await asyncio.gather(*self.writes)
+
+        await loop.run_in_executor(self.io_executor, attendance_store.close)
+        for executor in (*self.capture_executors.values(), self.recognition_executor,
+                         self.emotion_executor, self.io_executor):
+            executor.shutdown(wait=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless attendance recognition daemon")
+    parser.add_argument('--camera', action='append', dest='cameras', metavar='SOURCE',
+                        help="Camera index, RTSP URL or video file; repeat for several (default: 0)")
+    parser.add_argument('--enrollments', default=ENROLLMENTS_PATH)
+    parser.add_argument('--host', default='127.0.0.1', help="Address of the health/stats endpoint")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--dwell', type=float, default=3.0, help="Seconds before a tracked person is logged")
+    args = parser.parse_args()
+
+    daemon = AttendanceDaemon(
+        args.cameras or [0], args.enrollments, args.host, args.port,
+        tolerance=args.tolerance, dwell=args.dwell
+    )
+    asyncio.run(daemon.run())
+
+
+if __name__ == '__main__':
+    main()
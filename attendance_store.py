@@ -0,0 +1,477 @@
+"""
+Attendance log storage, shared by the GUI, the terminal version, batch jobs
+and the daemon.
+
+Records live in a SQLite database in WAL mode, so several kiosks and the
+records/dashboard views can read while one process writes. Timestamps are
+stored as integer epoch seconds; a person is logged at most once per local
+day, enforced by the database (and, for days already moved to the archive,
+by checking the archive before writing). Triggers keep per-day, per-emotion and
+per-person rollups for the dashboard. CSV remains available as an export
+format, and an existing attendance.csv is imported the first time the
+database is created.
+
+Usage:
+    python attendance_store.py import old-attendance.csv
+    python attendance_store.py export attendance.csv [--from 2025-03-01] [--to 2025-03-31] [--name alice]
+    python attendance_store.py export attendance.xlsx --from 2025-03-01
+    python attendance_store.py rebuild-rollups
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from pathlib import Path
+
+import numpy as np
+
+
+DB_PATH = 'attendance.db'
+ARCHIVE_DIR = 'attendance_archive'  # Older months, as Parquet (attendance_archive.py)
+CSV_PATH = 'attendance.csv'
+COLUMNS = ['Name', 'Emotion', 'Timestamp']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+DAY_FORMAT = '%Y-%m-%d'
+EXPORT_CHUNK_SIZE = 5000
+
+SCHEMA_VERSION = 3
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    emotion TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    UNIQUE (name, day)
+);
+CREATE INDEX IF NOT EXISTS attendance_ts ON attendance (ts);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID;
+"""
+# meta key: epoch seconds before which days may have been moved to the archive
+ARCHIVED_BEFORE = 'archived_before'
+ARCHIVED_BEFORE_SQL = (
+    'INSERT INTO meta VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)'
+)
+
+# Dashboard rollups: record counts per day, per emotion and per person,
+# over the whole history (archived months included). The trigger keeps
+# them current in the same transaction as each insert, whichever process
+# writes; an ignored duplicate does not fire it. Rows moved to the archive
+# stay counted, so there is no delete trigger: after removing records by
+# hand, run rebuild_rollups().
+ROLLUPS = {'daily_rollup': 'day', 'emotion_rollup': 'emotion', 'person_rollup': 'name'}
+ROLLUP_SCHEMA = ''.join(
+    f"CREATE TABLE IF NOT EXISTS {table} ({key} TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID;\n"
+    for table, key in ROLLUPS.items()
+) + "CREATE TRIGGER IF NOT EXISTS attendance_rollup AFTER INSERT ON attendance BEGIN\n" + ''.join(
+    f"    INSERT INTO {table} VALUES (NEW.{key}, 1) ON CONFLICT ({key}) DO UPDATE SET count = count + 1;\n"
+    for table, key in ROLLUPS.items()
+) + "END;\n"
+# The UNIQUE constraint doubles as the (name, day) index
+INSERT_SQL = 'INSERT OR IGNORE INTO attendance (name, emotion, ts, day) VALUES (?, ?, ?, ?)'
+
+# sqlite3 connections must stay on the thread that opened them
+_local = threading.local()
+
+
+def connect(db_path=DB_PATH):
+    """
+    This thread's connection to db_path, created (and the schema set up)
+    on first use
+    """
+    connections = _local.__dict__.setdefault('connections', {})
+    conn = connections.get(str(db_path))
+    if conn is None:
+        conn = sqlite3.connect(str(db_path), timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')  # Durable at checkpoints, enough for a log
+        _create_schema(conn, db_path)
+        connections[str(db_path)] = conn
+    return conn
+
+
+def close(db_path=DB_PATH):
+    """Close this thread's connection to db_path, if any"""
+    conn = _local.__dict__.get('connections', {}).pop(str(db_path), None)
+    if conn is not None:
+        conn.close()
+
+
+def _create_schema(conn, db_path):
+    with conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        conn.executescript(SCHEMA + ROLLUP_SCHEMA)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    if version:
+        archive_dir = archive_dir_for(db_path)
+        if version < 2:
+            # Version 1 had no rollups: count what is already logged and archived
+            rebuild_rollups(db_path, archive_dir, conn)
+        # Versions before 3 did not record how far the archive reaches
+        archive = _archive(archive_dir)
+        if archive is not None:
+            days = {day for _, day in archive.logged_days(archive_dir)}
+            if days:
+                after = datetime.strptime(max(days), DAY_FORMAT) + timedelta(days=1)
+                with conn:
+                    conn.execute(ARCHIVED_BEFORE_SQL, (ARCHIVED_BEFORE, _epoch(after)))
+        return
+
+    # One-shot migration of the CSV log kept next to the database
+    csv_path = Path(db_path).with_name(CSV_PATH)
+    if csv_path.exists():
+        imported, skipped = import_csv(csv_path, db_path, conn)
+        print(f"Imported {imported} attendance records from {csv_path}"
+              + (f" ({skipped} duplicates or unreadable rows skipped)" if skipped else ""))
+
+
+def _row(name, emotion, timestamp):
+    timestamp = timestamp or datetime.now()
+    return name, emotion, int(timestamp.timestamp()), timestamp.strftime(DAY_FORMAT)
+
+
+def format_timestamp(ts):
+    """Epoch seconds as local TIMESTAMP_FORMAT text"""
+    return time.strftime(TIMESTAMP_FORMAT, time.localtime(ts))
+
+
+def _epoch(day):
+    """Epoch seconds at local midnight of a date or datetime"""
+    return int(datetime(day.year, day.month, day.day).timestamp())
+
+
+def archived_before(db_path=DB_PATH):
+    """Epoch seconds before which records may be in the archive (0 if nothing was archived)"""
+    row = connect(db_path).execute('SELECT value FROM meta WHERE key = ?', (ARCHIVED_BEFORE,)).fetchone()
+    return row[0] if row else 0
+
+
+def _archived_days(rows, db_path, archive_dir):
+    """(name, day) pairs in the archive for the days of rows that are older than the archive horizon"""
+    horizon = archived_before(db_path)
+    days = sorted({day for _, _, ts, day in rows if ts < horizon})
+    archive = _archive(archive_dir) if days else None
+    if archive is None:
+        return set()
+    return archive.logged_days(
+        archive_dir, datetime.strptime(days[0], DAY_FORMAT), datetime.strptime(days[-1], DAY_FORMAT)
+    )
+
+
+def log_many(rows, db_path=DB_PATH, archive_dir=None):
+    """
+    Insert (name, emotion, timestamp) rows in one transaction. timestamp
+    is a datetime, or None for now. Rows for a person already logged that
+    day are ignored, also when that day was moved to the archive. Returns
+    the rows actually written, with formatted timestamps.
+    """
+    conn = connect(db_path)
+    rows = [_row(name, emotion, timestamp) for name, emotion, timestamp in rows]
+    archived = _archived_days(rows, db_path, archive_dir_for(db_path, archive_dir))
+    written = []
+    with conn:
+        for row in rows:
+            name, emotion, ts, day = row
+            if (name, day) not in archived and conn.execute(INSERT_SQL, row).rowcount:
+                written.append((name, emotion, format_timestamp(ts)))
+    return written
+
+
+def log_attendance(name, emotion, db_path=DB_PATH, timestamp=None):
+    """Log one person; returns the formatted timestamp, or None if already logged that day"""
+    written = log_many([(name, emotion, timestamp)], db_path)
+    return written[0][2] if written else None
+
+
+def logged_days(db_path=DB_PATH, since=None, archive_dir=None):
+    """
+    (name, 'YYYY-MM-DD') pairs already logged, from `since` (a date) on,
+    for once-per-day checks; archived days included
+    """
+    query = 'SELECT name, day FROM attendance'
+    params = ()
+    if since is not None:
+        query += ' WHERE ts >= ?'
+        params = (_epoch(since),)
+    days = set(connect(db_path).execute(query, params))
+
+    if since is None or _epoch(since) < archived_before(db_path):
+        archive_dir = archive_dir_for(db_path, archive_dir)
+        archive = _archive(archive_dir)
+        if archive is not None:
+            days |= archive.logged_days(archive_dir, since)
+    return days
+
+
+def _where(date_from=None, date_to=None, name=None):
+    clauses, params = [], []
+    if date_from is not None:
+        clauses.append('ts >= ?')
+        params.append(_epoch(date_from))
+    if date_to is not None:
+        clauses.append('ts < ?')
+        params.append(_epoch(date_to + timedelta(days=1)))
+    if name:
+        clauses.append("name LIKE ? ESCAPE '\\'")
+        params.append('%' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def archive_dir_for(db_path=DB_PATH, archive_dir=None):
+    """archive_dir if given, else the archive next to the database at db_path"""
+    return Path(db_path).with_name(ARCHIVE_DIR) if archive_dir is None else archive_dir
+
+
+def _archive(archive_dir):
+    """The attendance_archive module if archive_dir holds archived months, else None"""
+    import attendance_archive
+
+    return attendance_archive if archive_dir and attendance_archive.exists(archive_dir) else None
+
+
+def records(db_path=DB_PATH, date_from=None, date_to=None, name=None, archive_dir=None):
+    """
+    (name, emotion, timestamp) rows, oldest first, optionally within the
+    dates date_from..date_to (inclusive) and with `name` as a
+    case-insensitive substring. Archived months come first. Returns an
+    iterator; rows are read lazily.
+    """
+    where, params = _where(date_from, date_to, name)
+    cursor = connect(db_path).execute(
+        'SELECT name, emotion, ts FROM attendance' + where + ' ORDER BY ts', params
+    )
+    live = ((name, emotion, format_timestamp(ts)) for name, emotion, ts in cursor)
+
+    archive_dir = archive_dir_for(db_path, archive_dir)
+    archive = _archive(archive_dir)
+    if archive is None:
+        return live
+    return chain(archive.records(archive_dir, date_from, date_to, name), live)
+
+
+def _encode(values):
+    """(dictionary, int32 indices) of a sequence of strings"""
+    codes = {}
+    indices = np.fromiter((codes.setdefault(value, len(codes)) for value in values), np.int32, len(values))
+    return list(codes), indices
+
+
+def rows_after(last_id=0, db_path=DB_PATH, batch_size=65536):
+    """
+    Live rows with a rowid above last_id, in insertion order, as columnar
+    batches (last rowid, names, name indices, emotions, emotion indices,
+    ts): each string column is a dictionary plus an int32 index per row
+    and ts is an int64 array of epoch seconds. For caches that follow the
+    log without re-reading it.
+    """
+    while True:
+        # One short query per batch, so no read transaction stays open
+        rows = connect(db_path).execute(
+            'SELECT id, name, emotion, ts FROM attendance WHERE id > ? ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        ids, names, emotions, ts = zip(*rows)
+        last_id = ids[-1]
+        yield (last_id, *_encode(names), *_encode(emotions), np.array(ts, dtype=np.int64))
+
+
+def last_rowid(db_path=DB_PATH):
+    """Highest rowid in the live log (0 when empty)"""
+    return connect(db_path).execute('SELECT MAX(id) FROM attendance').fetchone()[0] or 0
+
+
+def data_version(db_path=DB_PATH):
+    """
+    A number that changes whenever another connection commits to db_path
+    (any thread or process), for views that redraw only on new data
+    """
+    return connect(db_path).execute('PRAGMA data_version').fetchone()[0]
+
+
+def rebuild_rollups(db_path=DB_PATH, archive_dir=None, conn=None):
+    """Recount the dashboard rollups from the live log and the archive"""
+    conn = conn or connect(db_path)
+    archive_dir = archive_dir_for(db_path, archive_dir)
+    archive = _archive(archive_dir)
+    archived = archive.counts(archive_dir) if archive is not None else {}
+    with conn:
+        for table, key in ROLLUPS.items():
+            conn.execute(f'DELETE FROM {table}')
+            conn.execute(f'INSERT INTO {table} SELECT {key}, COUNT(*) FROM attendance GROUP BY {key}')
+            conn.executemany(
+                f'INSERT INTO {table} VALUES (?, ?) ON CONFLICT ({key}) DO UPDATE SET count = count + excluded.count',
+                archived.get(key, {}).items()
+            )
+
+
+def summary(db_path=DB_PATH, today=None):
+    """
+    Totals and per-day / per-emotion / per-person counts for the
+    dashboard, read from the rollups: the cost does not grow with the
+    history
+    """
+    conn = connect(db_path)
+    today = today or datetime.now().date()
+    emotions = conn.execute('SELECT emotion, count FROM emotion_rollup ORDER BY count DESC, emotion').fetchall()
+    people = conn.execute('SELECT name, count FROM person_rollup ORDER BY count DESC, name').fetchall()
+    today_count = conn.execute('SELECT count FROM daily_rollup WHERE day = ?',
+                               (today.strftime(DAY_FORMAT),)).fetchone()
+
+    return {
+        'total': sum(count for _, count in emotions),
+        'people': len(people),
+        'today': today_count[0] if today_count else 0,
+        'daily': conn.execute('SELECT day, count FROM daily_rollup ORDER BY day').fetchall(),
+        'emotions': emotions,
+        'attendees': people,
+    }
+
+
+def import_csv(csv_path, db_path=DB_PATH, conn=None):
+    """
+    Import an attendance CSV (Name, Emotion, Timestamp). Rows that repeat a
+    person's day are skipped, so importing twice is harmless. Returns
+    (imported, skipped).
+    """
+    conn = conn or connect(db_path)
+    imported = skipped = 0
+    with open(csv_path, newline='') as f, conn:
+        for row in csv.DictReader(f):
+            try:
+                timestamp = datetime.strptime(row['Timestamp'].strip(), TIMESTAMP_FORMAT)
+            except (AttributeError, KeyError, ValueError):
+                try:
+                    timestamp = datetime.fromisoformat(row['Timestamp'].strip())
+                except (AttributeError, KeyError, ValueError):
+                    skipped += 1
+                    continue
+            if not row.get('Name'):
+                skipped += 1
+                continue
+
+            if conn.execute(INSERT_SQL, _row(row['Name'], row.get('Emotion') or 'unknown', timestamp)).rowcount:
+                imported += 1
+            else:
+                skipped += 1
+    return imported, skipped
+
+
+class ExportCancelled(Exception):
+    """Raised inside export() when its progress callback asks to stop"""
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _write_csv(path, chunks):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+
+
+def _write_xlsx(path, chunks):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImportError("Excel export needs openpyxl: pip install openpyxl")
+
+    # Write-only: rows go straight to the sheet's XML on disk, not into cells in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Attendance')
+    sheet.append(COLUMNS)
+    for chunk in chunks:
+        for row in chunk:
+            sheet.append(row)
+    workbook.save(path)
+
+
+EXPORT_WRITERS = {'.csv': _write_csv, '.xlsx': _write_xlsx}
+
+
+def export(path, db_path=DB_PATH, date_from=None, date_to=None, name=None, progress=None,
+           chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream (filtered) records to a .csv or .xlsx file, chunk_size rows at
+    a time, so memory use does not grow with the number of records.
+    progress(rows written) is called after every chunk; when it returns
+    False the export stops. The file is written aside and renamed once
+    complete, so a cancelled or failed export leaves no partial file.
+    Returns the number of rows, or None if cancelled.
+    """
+    path = Path(path)
+    writer = EXPORT_WRITERS.get(path.suffix.lower())
+    if writer is None:
+        raise ValueError(f"Can only export to {', '.join(EXPORT_WRITERS)}, not {path.name}")
+
+    count = 0
+
+    def chunks():
+        nonlocal count
+        for chunk in _chunks(records(db_path, date_from, date_to, name), chunk_size):
+            yield chunk
+            count += len(chunk)
+            if progress is not None and progress(count) is False:
+                raise ExportCancelled
+
+    temporary = path.with_name(f".{path.name}.tmp")
+    try:
+        writer(temporary, chunks())
+        os.replace(temporary, path)
+    except ExportCancelled:
+        return None
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the attendance database")
+    parser.add_argument('--database', default=DB_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="Import attendance CSV files")
+    import_parser.add_argument('csv_files', nargs='+')
+
+    date = lambda value: datetime.strptime(value, DAY_FORMAT).date()
+    export_parser = commands.add_parser('export', help="Export records to CSV or Excel (by extension)")
+    export_parser.add_argument('file')
+    export_parser.add_argument('--from', dest='date_from', type=date)
+    export_parser.add_argument('--to', dest='date_to', type=date)
+    export_parser.add_argument('--name')
+
+    rebuild_parser = commands.add_parser('rebuild-rollups', help="Recount the dashboard rollups")
+    rebuild_parser.add_argument('--archive', help=f"Default: {ARCHIVE_DIR} next to the database")
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        for csv_file in args.csv_files:
+            imported, skipped = import_csv(csv_file, args.database)
+            print(f"{csv_file}: {imported} imported, {skipped} skipped")
+    elif args.command == 'rebuild-rollups':
+        rebuild_rollups(args.database, args.archive)
+        print(f"Rebuilt rollups: {summary(args.database)['total']} records")
+    else:
+        count = export(args.file, args.database, args.date_from, args.date_to, args.name)
+        print(f"Exported {count} records to {args.file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+Headless attendance from recorded video files and image folders.
+
+Runs the same detection, matching, emotion and logging pipeline as the
+live application, without a camera, a GUI or real-time pacing. Each
+input is processed in its own worker process.
+
+Usage:
+    python batch_attendance.py lecture-a.mp4 lecture-b.mp4 photos/ [--workers 4]
+    python batch_attendance.py recordings/*.mp4 --start "2025-03-04 09:00:00" --database monday.db
+    python batch_attendance.py recordings/*.mp4 --csv attendance.csv   # also write the days covered as CSV
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import cv2
+
+import ann_index
+import attendance_store
+from detection import DEFAULT_DETECTION_SCALE, DEFAULT_MIN_FACE_SIZE
+from enrollment_store import ENROLLMENTS_PATH, EnrollmentStore
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+# State of one worker process, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(enrollments_path, index_path, options):
+    from detection import FaceDetector
+    from gallery import GalleryMatcher
+
+    index = ann_index.IVFIndex.load(index_path) if index_path else None
+    _worker['detector'] = FaceDetector(options['detection_scale'], options['min_face_size'])
+    _worker['matcher'] = GalleryMatcher(
+        EnrollmentStore(enrollments_path), tolerance=options['tolerance'], index=index
+    )
+    _worker['emotion_model'] = None
+
+
+def _classify(crops):
+    """Emotion for each crop (None for faces too small to classify)"""
+    from emotion import EmotionModel
+
+    emotions = ["unknown"] * len(crops)
+    batch = [idx for idx, crop in enumerate(crops) if crop is not None]
+    if not batch:
+        return emotions
+
+    try:
+        if _worker['emotion_model'] is None:
+            _worker['emotion_model'] = EmotionModel()
+        for idx, emotion in zip(batch, _worker['emotion_model'].predict([crops[idx] for idx in batch])):
+            emotions[idx] = emotion
+    except Exception as e:
+        print(f"Error detecting emotion: {e}")
+    return emotions
+
+
+def _scan_video(path, options, sightings):
+    """
+    Track faces through a video and record, per person, the first moment a
+    track held that identity for `dwell` seconds (as the live tab does).
+    Returns (frames read, frames processed, faces, seconds of footage).
+    """
+    from emotion import crop_face
+    from gallery import UNKNOWN
+    from tracker import FaceTracker
+
+    detector, matcher = _worker['detector'], _worker['matcher']
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise IOError(f"Could not open {path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+    start = options['start'] or datetime.fromtimestamp(Path(path).stat().st_mtime) - timedelta(seconds=duration)
+
+    tracker = FaceTracker()
+    timers = {}  # track id -> (name, first seen in seconds)
+    frames = processed = faces = 0
+
+    try:
+        while True:
+            # Skipped frames are only grabbed, never decoded
+            if frames % options['step']:
+                if not cap.grab():
+                    break
+                frames += 1
+                continue
+
+            ret, frame = cap.read()
+            if not ret:
+                break
+            seconds = frames / fps
+            frames += 1
+            processed += 1
+
+            rgb = detector.to_rgb(frame)
+            boxes = detector.detect(rgb)
+            tracks = tracker.update(boxes)
+            faces += len(boxes)
+
+            stale = [idx for idx, track in enumerate(tracks) if tracker.needs_encoding(track)]
+            if stale:
+                names, distances, _ = matcher.match(detector.encode(rgb, [boxes[idx] for idx in stale]))
+                for idx, name, distance in zip(stale, names, distances):
+                    tracker.record(tracks[idx], name, distance)
+
+            for box, track in zip(boxes, tracks):
+                name, _ = track.identity()
+                if name == UNKNOWN or name in sightings:
+                    continue
+                timer = timers.get(track.id)
+                if timer is None or timer[0] != name:
+                    timers[track.id] = (name, seconds)
+                elif seconds - timer[1] >= options['dwell']:
+                    sightings[name] = (start + timedelta(seconds=seconds), crop_face(frame, box))
+    finally:
+        cap.release()
+
+    return frames, processed, faces, frames / fps
+
+
+def _taken_at(path):
+    """When a photo was taken: its EXIF capture time if it has one, else the file time"""
+    try:
+        from PIL import Image
+
+        with Image.open(path) as image:
+            exif = image.getexif()
+        # DateTimeOriginal (Exif IFD), else DateTime
+        stamp = exif.get_ifd(0x8769).get(36867) or exif.get(306)
+        if stamp:
+            return datetime.strptime(str(stamp).strip('\0 '), '%Y:%m:%d %H:%M:%S')
+    except (ImportError, OSError, ValueError):
+        pass
+    return datetime.fromtimestamp(path.stat().st_mtime)
+
+
+def _scan_images(path, options, sightings):
+    """
+    Match every face in every image of a folder, earliest photo first, so
+    each person's first sighting is the earliest one; timestamps come from
+    the photos (EXIF) or the files
+    """
+    from emotion import crop_face
+    from gallery import UNKNOWN
+
+    detector, matcher = _worker['detector'], _worker['matcher']
+    images = [p for p in Path(path).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS]
+    images = sorted((options['start'] or _taken_at(p), p) for p in images)
+    processed = faces = 0
+
+    for taken_at, image_path in images:
+        frame = cv2.imread(str(image_path))
+        if frame is None:
+            print(f"Warning: could not read {image_path}")
+            continue
+        processed += 1
+
+        boxes, encodings = detector.detect_and_encode(frame)
+        faces += len(boxes)
+        names, _, _ = matcher.match(encodings)
+        for box, name in zip(boxes, names):
+            if name != UNKNOWN and name not in sightings:
+                sightings[name] = (taken_at, crop_face(frame, box))
+
+    return len(images), processed, faces, 0.0
+
+
+def process_source(path, options):
+    """Runs in a worker: one video file or image folder -> attendance events and counters"""
+    started = time.perf_counter()
+    sightings = {}  # name -> (timestamp, emotion crop)
+    result = {'path': str(path), 'events': [], 'error': None}
+
+    try:
+        scan = _scan_images if Path(path).is_dir() else _scan_video
+        frames, processed, faces, seconds = scan(path, options, sightings)
+        result.update(frames=frames, processed=processed, faces=faces, media_seconds=seconds)
+
+        names = list(sightings)
+        crops = [sightings[name][1] for name in names]
+        emotions = _classify(crops) if options['emotion'] else ["unknown"] * len(names)
+        result['events'] = [
+            (name, emotion, sightings[name][0]) for name, emotion in zip(names, emotions)
+        ]
+    except Exception as e:
+        result.update(frames=0, processed=0, faces=0, media_seconds=0.0, error=str(e))
+
+    result['elapsed'] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless attendance from video files and image folders")
+    parser.add_argument('inputs', nargs='+', help="Video files and/or folders of images")
+    parser.add_argument('--enrollments', default=ENROLLMENTS_PATH)
+    parser.add_argument('--database', default=attendance_store.DB_PATH, help="Attendance database to log to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Files processed in parallel")
+    parser.add_argument('--step', type=int, default=3, help="Process every Nth video frame")
+    parser.add_argument('--dwell', type=float, default=3.0,
+                        help="Seconds a person must be tracked before being logged (videos)")
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--detection-scale', type=float, default=DEFAULT_DETECTION_SCALE)
+    parser.add_argument('--min-face-size', type=int, default=DEFAULT_MIN_FACE_SIZE)
+    parser.add_argument('--start', type=lambda value: datetime.strptime(value, attendance_store.TIMESTAMP_FORMAT),
+                        help="Recording start 'YYYY-MM-DD HH:MM:SS' (default: from file times)")
+    parser.add_argument('--no-emotion', dest='emotion', action='store_false',
+                        help="Skip emotion detection and log 'unknown'")
+    parser.add_argument('--csv', metavar='PATH',
+                        help="Also export the attendance of the days seen in the inputs to this CSV file")
+    args = parser.parse_args()
+
+    enrollments = EnrollmentStore(args.enrollments)
+    if not enrollments:
+        print(f"No enrollments found in {args.enrollments}")
+        return
+
+    # Built (or validated) once here; workers only load it
+    index = ann_index.load_or_build(enrollments, args.enrollments)
+    index_path = str(ann_index.index_path_for(args.enrollments)) if index else None
+
+    options = {
+        'step': max(1, args.step),
+        'dwell': args.dwell,
+        'tolerance': args.tolerance,
+        'detection_scale': args.detection_scale,
+        'min_face_size': args.min_face_size,
+        'start': args.start,
+        'emotion': args.emotion,
+    }
+    workers = max(1, min(args.workers or 1, len(args.inputs)))
+
+    print(f"Processing {len(args.inputs)} inputs with {workers} workers, "
+          f"gallery of {len(enrollments)} people")
+    print(f"{'input':<32}{'frames':>8}{'faces':>8}{'people':>8}{'fps':>8}{'x realtime':>12}")
+
+    started = time.perf_counter()
+    results = []
+    # spawn: dlib and TensorFlow are not fork-safe
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(args.enrollments, index_path, options)) as pool:
+        futures = [pool.submit(process_source, path, options) for path in args.inputs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            name = Path(result['path']).name[:31]
+            if result['error']:
+                print(f"{name:<32}error: {result['error']}")
+                continue
+            fps = result['processed'] / result['elapsed'] if result['elapsed'] else 0.0
+            realtime = f"{result['media_seconds'] / result['elapsed']:.1f}" if result['media_seconds'] else '-'
+            print(f"{name:<32}{result['frames']:>8}{result['faces']:>8}{len(result['events']):>8}"
+                  f"{fps:>8.1f}{realtime:>12}")
+    wall = time.perf_counter() - started
+
+    # Earliest sighting first; the database keeps one row per person per day,
+    # also across earlier runs
+    events = sorted((event for result in results for event in result['events']), key=lambda event: event[2])
+    rows = attendance_store.log_many(events, args.database)
+
+    processed = sum(result['processed'] for result in results)
+    media = sum(result['media_seconds'] for result in results)
+    failed = sum(1 for result in results if result['error'])
+    print(f"\n{len(rows)} attendance rows written to {args.database}")
+    if args.csv and events:
+        # Whole days, so people logged there by earlier runs are included
+        exported = attendance_store.export(
+            args.csv, args.database, date_from=events[0][2].date(), date_to=events[-1][2].date()
+        )
+        print(f"{exported} records of {events[0][2]:%Y-%m-%d} to {events[-1][2]:%Y-%m-%d} exported to {args.csv}")
+    print(f"{processed} frames in {wall:.1f}s: {processed / wall:.1f} frames/s"
+          + (f", {media / wall:.1f}x real time" if media else "")
+          + (f", {failed} inputs failed" if failed else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,490 @@
+"""
+Performance benchmarks for the attendance pipeline
+
+Usage:
+    python benchmark.py matcher [--people 3000] [--samples 5] [--faces 8]
+    python benchmark.py ann [--people 100000] [--probe 4 8 16]
+    python benchmark.py detect clip1.mp4 [clip2.mp4 ...] [--scales 1 0.5 0.25]
+    python benchmark.py emotion [--faces 15] [--batches 1 8 32]
+    python benchmark.py pool clip.mp4 [--workers 1 2 4 8 16]
+    python benchmark.py frames clip.mp4 [--max-frames 300]
+    python benchmark.py writer [--events 5000] [--batch-size 64] [--flush-ms 50]
+    python benchmark.py archive [--rows 1000000 10000000] [--days 730]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from gallery import GalleryMatcher, POLICIES, UNKNOWN, ENCODING_SIZE
+from ann_index import IVFIndex
+
+
+def synthetic_gallery(people, samples, modes=2, seed=0):
+    """
+    Build a synthetic gallery shaped like dlib encodings.
+
+    Each identity has a few appearance modes (e.g. with and without glasses)
+    and enrollment samples are spread across them, which is the case where
+    a single mean vector loses accuracy.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.045, size=(people, ENCODING_SIZE)).astype(np.float32)
+    mode_offsets = rng.normal(0, 0.035, size=(people, modes, ENCODING_SIZE)).astype(np.float32)
+
+    def draw(person, count):
+        picked = rng.integers(0, modes, size=count)
+        noise = rng.normal(0, 0.02, size=(count, ENCODING_SIZE)).astype(np.float32)
+        return centers[person] + mode_offsets[person, picked] + noise
+
+    names = [f"person_{i:06d}" for i in range(people)]
+    enrollments = {name: list(draw(i, samples)) for i, name in enumerate(names)}
+    return names, enrollments, draw
+
+
+def bench_matcher(args):
+    names, enrollments, draw = synthetic_gallery(args.people, args.samples)
+    rng = np.random.default_rng(1)
+
+    truth = rng.integers(0, args.people, size=args.probes)
+    probes = np.concatenate([draw(person, 1) for person in truth])
+
+    print(f"Gallery: {args.people} people x {args.samples} samples, "
+          f"{args.probes} probes, {args.faces} faces per frame")
+    print(f"{'policy':<12}{'accuracy':>10}{'unknown':>10}{'frames/s':>12}{'faces/s':>12}")
+
+    for policy in POLICIES:
+        matcher = GalleryMatcher(enrollments, tolerance=args.tolerance, policy=policy, top_k=args.top_k)
+
+        matched, _, _ = matcher.match(probes)
+        correct = sum(m == names[t] for m, t in zip(matched, truth))
+        unknown = sum(m == UNKNOWN for m in matched)
+
+        frames = [probes[i:i + args.faces] for i in range(0, len(probes), args.faces)]
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for frame in frames:
+                matcher.match(frame)
+        elapsed = time.perf_counter() - start
+        frame_count = len(frames) * args.repeat
+
+        print(f"{policy:<12}{correct / len(truth):>10.1%}{unknown / len(truth):>10.1%}"
+              f"{frame_count / elapsed:>12.1f}{frame_count * args.faces / elapsed:>12.1f}")
+
+    # Reference: the old per-face loop against a list of mean vectors
+    known = [np.mean(enrollments[name], axis=0) for name in names]
+    start = time.perf_counter()
+    for probe in probes[:min(len(probes), 200)]:
+        np.argmin(np.linalg.norm(np.asarray(known) - probe, axis=1))
+    elapsed = time.perf_counter() - start
+    print(f"{'per-face':<12}{'':>10}{'':>10}{'':>12}{min(len(probes), 200) / elapsed:>12.1f}")
+
+
+def bench_ann(args):
+    names, enrollments, draw = synthetic_gallery(args.people, args.samples)
+    rng = np.random.default_rng(1)
+    probes = np.concatenate([draw(person, 1) for person in rng.integers(0, args.people, size=args.probes)])
+
+    frames = [probes[i:i + args.faces] for i in range(0, len(probes), args.faces)]
+
+    def timed(matcher):
+        start = time.perf_counter()
+        matched = [name for frame in frames for name in matcher.match(frame)[0]]
+        return matched, (time.perf_counter() - start) * 1000 / len(probes)
+
+    exact = GalleryMatcher(enrollments, tolerance=args.tolerance, policy=args.policy)
+    reference, exact_ms = timed(exact)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(enrollments)
+    build_s = time.perf_counter() - start
+
+    print(f"Gallery: {args.people} people x {args.samples} samples, {len(index.centroids)} lists, "
+          f"built in {build_s:.1f}s")
+    print(f"{'search':<14}{'recall@1':>10}{'ms/face':>10}{'speedup':>10}")
+    print(f"{'exact':<14}{1:>10.1%}{exact_ms:>10.3f}{1:>10.1f}")
+
+    for n_probe in args.probe:
+        index.n_probe = n_probe
+        ann = GalleryMatcher(enrollments, tolerance=args.tolerance, policy=args.policy,
+                             index=index, ann_threshold=0, ann_candidates=args.candidates)
+        matched, ann_ms = timed(ann)
+        recall = sum(a == b for a, b in zip(matched, reference)) / len(probes)
+        print(f"{f'ivf n_probe={n_probe}':<14}{recall:>10.1%}{ann_ms:>10.3f}{exact_ms / ann_ms:>10.1f}")
+
+
+def read_clip_frames(path, max_frames, step=1):
+    """Frames of a recorded clip, every step-th frame up to max_frames"""
+    import cv2
+
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    index = 0
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % step == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def bench_detect(args):
+    from detection import FaceDetector
+    from tracker import iou_matrix
+
+    frames = [frame for clip in args.clips for frame in read_clip_frames(clip, args.max_frames, args.step)]
+    if not frames:
+        print("No frames could be read from the given clips")
+        return
+
+    rgb_frames = [FaceDetector.to_rgb(frame) for frame in frames]
+    # Full-resolution detections are the reference for recall
+    reference = [FaceDetector(1.0, args.min_face_size).detect(rgb) for rgb in rgb_frames]
+    total = sum(len(boxes) for boxes in reference)
+
+    print(f"{len(frames)} frames, {total} reference faces at scale 1.0")
+    print(f"{'scale':<8}{'frames/s':>10}{'speedup':>10}{'recall':>10}{'faces':>8}")
+
+    baseline = None
+    for scale in args.scales:
+        detector = FaceDetector(scale, args.min_face_size)
+        start = time.perf_counter()
+        found = [detector.detect(rgb) for rgb in rgb_frames]
+        fps = len(frames) / (time.perf_counter() - start)
+        baseline = baseline or fps
+
+        hits = 0
+        for boxes, truth in zip(found, reference):
+            if boxes and truth:
+                hits += int((iou_matrix(truth, boxes).max(axis=1) >= 0.5).sum())
+
+        recall = hits / total if total else 1.0
+        print(f"{scale:<8}{fps:>10.1f}{fps / baseline:>10.1f}{recall:>10.1%}"
+              f"{sum(len(b) for b in found):>8}")
+
+
+def bench_emotion(args):
+    from deepface import DeepFace
+    from emotion import EmotionModel, crop_face
+
+    rng = np.random.default_rng(0)
+    # Emotion inference cost does not depend on image content
+    frame = rng.integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+    face_location = (100, 260, 260, 100)
+    face_img = frame[100:260, 100:260]
+
+    model = EmotionModel()
+    model.predict([crop_face(frame, face_location)])  # warm-up
+    DeepFace.analyze(face_img, actions=['emotion'], enforce_detection=False, silent=True)
+
+    print(f"{args.faces} faces per burst")
+    print(f"{'path':<22}{'faces/s':>10}{'ms/burst':>10}")
+
+    start = time.perf_counter()
+    for _ in range(args.faces):
+        DeepFace.analyze(face_img, actions=['emotion'], enforce_detection=False, silent=True)
+    elapsed = time.perf_counter() - start
+    print(f"{'analyze one-by-one':<22}{args.faces / elapsed:>10.1f}{elapsed * 1000:>10.1f}")
+
+    for batch in args.batches:
+        start = time.perf_counter()
+        for offset in range(0, args.faces, batch):
+            crops = [crop_face(frame, face_location) for _ in range(min(batch, args.faces - offset))]
+            model.predict(crops)
+        elapsed = time.perf_counter() - start
+        print(f"{f'batched x{batch}':<22}{args.faces / elapsed:>10.1f}{elapsed * 1000:>10.1f}")
+
+
+def bench_pool(args):
+    from recognition_pool import RecognitionPool
+
+    frames = [frame for clip in args.clips for frame in read_clip_frames(clip, args.max_frames)]
+    if not frames:
+        print("No frames could be read from the given clips")
+        return
+
+    _, enrollments, _ = synthetic_gallery(args.people, 5)
+    print(f"{len(frames)} frames, gallery of {args.people} people")
+    print(f"{'workers':<10}{'frames/s':>10}{'speedup':>10}{'in order':>10}")
+
+    baseline = None
+    for workers in args.workers:
+        order = []
+        pool = RecognitionPool(workers, on_result=lambda seq, *_: order.append(seq),
+                               detection_scale=args.detection_scale)
+        pool.set_gallery(enrollments)
+
+        # Warm up: start the workers and load the gallery in each of them
+        for frame in frames[:workers * 2]:
+            pool.submit(frame, block=True)
+        while pool.in_flight():
+            time.sleep(0.01)
+        order.clear()
+
+        start = time.perf_counter()
+        for frame in frames:
+            pool.submit(frame, block=True)
+        while pool.in_flight():
+            time.sleep(0.001)
+        fps = len(frames) / (time.perf_counter() - start)
+        pool.close()
+
+        baseline = baseline or fps
+        print(f"{workers:<10}{fps:>10.1f}{fps / baseline:>10.1f}{str(order == sorted(order)):>10}")
+
+
+def bench_frames(args):
+    import tracemalloc
+    import cv2
+    from frame_ring import FrameRing
+
+    def per_frame_arrays(cap):
+        """The old path: a new array per read, a copy per tab, a copy per overlay"""
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        live = frame.copy()  # LiveRecognitionTab.update_frame
+        enroll = frame.copy()  # EnrollmentTab.update_frame
+        overlay = cv2.cvtColor(live.copy(), cv2.COLOR_BGR2RGB)  # update_video_display
+        return [frame, live, enroll, overlay]
+
+    def frame_ring(cap, ring):
+        """The ring path: views into a preallocated slot, one overlay copy"""
+        frame_ref = ring.read_from(cap)
+        if frame_ref is None:
+            return None
+        refs = [frame_ref.retain() for _ in range(3)]  # live tab, enrollment tab, recognition
+        overlay = cv2.cvtColor(frame_ref.image, cv2.COLOR_BGR2RGB)
+        for ref in refs + [frame_ref]:
+            ref.release()
+        return [overlay]
+
+    def measure(clip, step):
+        cap = cv2.VideoCapture(str(clip))
+        frames = 0
+        allocated = 0
+        start = time.perf_counter()
+        tracemalloc.start()
+        while frames < args.max_frames:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            # Everything a frame creates stays alive until it is measured
+            kept = step(cap)
+            if kept is None:
+                break
+            allocated += tracemalloc.get_traced_memory()[1] - before
+            frames += 1
+            del kept
+        tracemalloc.stop()
+        elapsed = time.perf_counter() - start
+        cap.release()
+        return frames, allocated, elapsed
+
+    print(f"{'path':<14}{'frames':>8}{'MB/frame':>10}{'frame bufs':>12}{'ms/frame':>10}")
+    for clip in args.clips:
+        cap = cv2.VideoCapture(str(clip))
+        ret, first = cap.read()
+        cap.release()
+        if not ret:
+            print(f"Could not read {clip}")
+            continue
+
+        ring = FrameRing(first.shape, slots=8)
+        for label, step in (('per-frame', per_frame_arrays), ('ring', lambda cap: frame_ring(cap, ring))):
+            frames, allocated, elapsed = measure(clip, step)
+            if not frames:
+                continue
+            print(f"{label:<14}{frames:>8}{allocated / frames / 1e6:>10.2f}"
+                  f"{allocated / frames / first.nbytes:>12.2f}{elapsed / frames * 1000:>10.2f}")
+        print(f"ring stats: {ring.stats()}")
+
+
+def bench_writer(args):
+    import tempfile
+    from pathlib import Path
+    import attendance_store
+    from worker_threads import AttendanceWriterThread
+
+    # Distinct names, so the once-per-day rule does not skip any event
+    events = [(f"person-{idx}", "neutral") for idx in range(args.events)]
+
+    def direct(db_path, durable):
+        """The old path: each event written on the calling (GUI) thread"""
+        if durable:
+            attendance_store.connect(db_path).execute('PRAGMA synchronous=FULL')
+        stalls = []
+        start = time.perf_counter()
+        for name, emotion in events:
+            before = time.perf_counter()
+            attendance_store.log_attendance(name, emotion, db_path)
+            stalls.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - start
+        attendance_store.close(db_path)
+        return stalls, elapsed
+
+    def writer(db_path):
+        """The writer thread: the calling thread only queues; stop() waits for the last commit"""
+        thread = AttendanceWriterThread(db_path, batch_size=args.batch_size,
+                                        flush_interval=args.flush_ms / 1000)
+        thread.start()
+        stalls = []
+        start = time.perf_counter()
+        for name, emotion in events:
+            before = time.perf_counter()
+            thread.log(name, emotion)
+            stalls.append(time.perf_counter() - before)
+        thread.stop()
+        elapsed = time.perf_counter() - start
+        print(f"writer stats: {thread.stats()}")
+        return stalls, elapsed
+
+    print(f"{args.events} events")
+    print(f"{'path':<16}{'events/s':>10}{'p50 stall ms':>14}{'p99 stall ms':>14}{'max stall ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = (
+            ('direct', lambda db_path: direct(db_path, False)),
+            ('direct+fsync', lambda db_path: direct(db_path, True)),
+            ('writer+fsync', writer),
+        )
+        for label, run in paths:
+            stalls, elapsed = run(Path(tmp) / f"{label}.db")
+            stalls = np.array(stalls) * 1000
+            print(f"{label:<16}{len(events) / elapsed:>10.0f}{np.percentile(stalls, 50):>14.3f}"
+                  f"{np.percentile(stalls, 99):>14.3f}{stalls.max():>14.3f}")
+
+
+def bench_archive(args):
+    import tempfile
+    from datetime import datetime, timedelta
+    from pathlib import Path
+    import pandas as pd
+    import pyarrow as pa
+    import attendance_archive
+
+    rng = np.random.default_rng(0)
+    names = np.array([f"person-{idx}" for idx in range(args.people)])
+    emotions = np.array(["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"])
+    first_day = datetime(2024, 1, 1)
+    week_from = (first_day + timedelta(days=args.days // 2)).date()
+    week_to = week_from + timedelta(days=6)
+
+    def csv_week(csv_path):
+        """The old records tab: parse the whole CSV to show one week"""
+        df = pd.read_csv(csv_path)
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        return df[(df['Timestamp'].dt.date >= week_from) & (df['Timestamp'].dt.date <= week_to)]
+
+    def archive_week(archive_dir):
+        return list(attendance_archive.records(archive_dir, week_from, week_to))
+
+    print(f"one-week query over {args.days} days of history, {args.people} people")
+    print(f"{'rows':>10}{'csv MB':>9}{'parquet MB':>12}{'csv ms':>10}{'archive ms':>12}{'speedup':>9}{'week rows':>11}")
+    for rows in args.rows:
+        ts = np.sort(rng.integers(int(first_day.timestamp()),
+                                  int((first_day + timedelta(days=args.days)).timestamp()), rows))
+        name_idx = rng.integers(0, len(names), rows)
+        emotion_idx = rng.integers(0, len(emotions), rows)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / 'attendance.csv'
+            pd.DataFrame({
+                'Name': names[name_idx],
+                'Emotion': emotions[emotion_idx],
+                'Timestamp': pd.to_datetime(ts, unit='s').strftime('%Y-%m-%d %H:%M:%S'),
+            }).to_csv(csv_path, index=False)
+
+            archive_dir = Path(tmp) / 'archive'
+            attendance_archive.write_table(pa.table({
+                'name': pa.DictionaryArray.from_arrays(name_idx.astype(np.int32), names),
+                'emotion': pa.DictionaryArray.from_arrays(emotion_idx.astype(np.int32), emotions),
+                'ts': ts,
+            }), archive_dir)
+            parquet_bytes = sum(path.stat().st_size for path in archive_dir.rglob('*.parquet'))
+
+            timings = {}
+            for label, query, target in (('csv', csv_week, csv_path), ('archive', archive_week, archive_dir)):
+                best = float('inf')
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    result = query(target)
+                    best = min(best, time.perf_counter() - start)
+                timings[label] = (best, len(result))
+
+            print(f"{rows:>10}{csv_path.stat().st_size / 1e6:>9.1f}{parquet_bytes / 1e6:>12.1f}"
+                  f"{timings['csv'][0] * 1000:>10.0f}{timings['archive'][0] * 1000:>12.1f}"
+                  f"{timings['csv'][0] / timings['archive'][0]:>9.0f}x{timings['archive'][1]:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance pipeline benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    matcher = commands.add_parser('matcher', help="Gallery matching accuracy and throughput per policy")
+    matcher.add_argument('--people', type=int, default=3000)
+    matcher.add_argument('--samples', type=int, default=5)
+    matcher.add_argument('--probes', type=int, default=2000)
+    matcher.add_argument('--faces', type=int, default=8, help="Faces per frame")
+    matcher.add_argument('--tolerance', type=float, default=0.6)
+    matcher.add_argument('--top-k', type=int, default=3)
+    matcher.add_argument('--repeat', type=int, default=3)
+    matcher.set_defaults(func=bench_matcher)
+
+    ann = commands.add_parser('ann', help="IVF index recall@1 and latency against exact search")
+    ann.add_argument('--people', type=int, default=100000)
+    ann.add_argument('--samples', type=int, default=3)
+    ann.add_argument('--probes', type=int, default=500)
+    ann.add_argument('--probe', type=int, nargs='+', default=[2, 4, 8, 16], help="n_probe values to try")
+    ann.add_argument('--candidates', type=int, default=32)
+    ann.add_argument('--faces', type=int, default=4, help="Faces per frame")
+    ann.add_argument('--policy', choices=POLICIES, default='centroid')
+    ann.add_argument('--tolerance', type=float, default=0.6)
+    ann.set_defaults(func=bench_ann)
+
+    detect = commands.add_parser('detect', help="Detector frames/s and recall per detection scale on recorded clips")
+    detect.add_argument('clips', nargs='+', help="Video files to read frames from")
+    detect.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.5, 0.25])
+    detect.add_argument('--min-face-size', type=int, default=0)
+    detect.add_argument('--max-frames', type=int, default=300, help="Frames per clip")
+    detect.add_argument('--step', type=int, default=1, help="Use every Nth frame")
+    detect.set_defaults(func=bench_detect)
+
+    emotion = commands.add_parser('emotion', help="Batched emotion inference against one DeepFace.analyze per face")
+    emotion.add_argument('--faces', type=int, default=15, help="Faces arriving at once")
+    emotion.add_argument('--batches', type=int, nargs='+', default=[1, 8, 32])
+    emotion.set_defaults(func=bench_emotion)
+
+    pool = commands.add_parser('pool', help="Recognition frames/s against process-pool worker count")
+    pool.add_argument('clips', nargs='+', help="Video files to read frames from")
+    pool.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    pool.add_argument('--people', type=int, default=1000)
+    pool.add_argument('--max-frames', type=int, default=300, help="Frames per clip")
+    pool.add_argument('--detection-scale', type=float, default=0.5)
+    pool.set_defaults(func=bench_pool)
+
+    frames = commands.add_parser('frames', help="Frame allocations and bytes copied per frame, with and without the frame ring")
+    frames.add_argument('clips', nargs='+', help="Video files to read frames from")
+    frames.add_argument('--max-frames', type=int, default=300, help="Frames per clip")
+    frames.set_defaults(func=bench_frames)
+
+    writer = commands.add_parser('writer', help="Attendance events/s and GUI-thread stall, direct writes against the writer thread")
+    writer.add_argument('--events', type=int, default=5000)
+    writer.add_argument('--batch-size', type=int, default=64)
+    writer.add_argument('--flush-ms', type=float, default=50)
+    writer.set_defaults(func=bench_writer)
+
+    archive = commands.add_parser('archive', help="One-week query latency: full CSV parse against the Parquet archive")
+    archive.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000])
+    archive.add_argument('--days', type=int, default=730, help="Days of history the rows are spread over")
+    archive.add_argument('--people', type=int, default=5000)
+    archive.add_argument('--repeat', type=int, default=3)
+    archive.set_defaults(func=bench_archive)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Bulk enrollment from a directory of photos.
+
+Expects one folder per person; every image below it is one sample:
+
+    photos/
+        Alice Smith/  id.jpg  2024.jpg
+        Bob Jones/    badge.png
+
+Images are decoded, detected and encoded in a pool of worker processes.
+Only images with exactly one face are used; the others are listed at the
+end. People who are already enrolled are skipped (use --replace to
+re-enroll them), and everyone found is written to the enrollment store
+with a single update.
+
+Progress is journaled next to the store (enrollments.bulk.npz) every few
+hundred images, so an interrupted run picks up where it stopped when it
+is started again with the same photo directory.
+
+Usage:
+    python bulk_enroll.py photos/ [--workers 8]
+    python bulk_enroll.py photos/ --replace --enrollments staff.npz
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import ann_index
+from batch_attendance import IMAGE_EXTENSIONS
+from detection import DEFAULT_MIN_FACE_SIZE
+from enrollment_store import ENROLLMENTS_PATH, EnrollmentStore
+from gallery import ENCODING_SIZE
+
+
+MAX_IMAGE_SIDE = 1024  # Larger photos are downscaled before detection
+CHECKPOINT_EVERY = 500  # Images between journal writes
+
+# Outcome of one image, as stored in the journal
+OK, NO_FACE, MULTIPLE_FACES, UNREADABLE = range(4)
+STATUS_TEXT = {OK: 'ok', NO_FACE: 'no face', MULTIPLE_FACES: 'several faces', UNREADABLE: 'unreadable'}
+
+# State of one worker process, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(options):
+    from detection import FaceDetector
+
+    # Photos are downscaled to max_side on decode, so detect at full size
+    _worker['detector'] = FaceDetector(1.0, options['min_face_size'])
+    _worker['max_side'] = options['max_side']
+
+
+def encode_image(path):
+    """Runs in a worker: image file -> (status, face count, encoding or None, seconds)"""
+    started = time.perf_counter()
+    frame = cv2.imread(str(path))
+    if frame is None:
+        return UNREADABLE, 0, None, time.perf_counter() - started
+
+    scale = _worker['max_side'] / max(frame.shape[:2])
+    if scale < 1:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    detector = _worker['detector']
+    rgb = detector.to_rgb(frame)
+    boxes = detector.detect(rgb)
+    if len(boxes) != 1:
+        return NO_FACE if not boxes else MULTIPLE_FACES, len(boxes), None, time.perf_counter() - started
+
+    encoding = np.asarray(detector.encode(rgb, boxes)[0], np.float32)
+    return OK, 1, encoding, time.perf_counter() - started
+
+
+def find_photos(root):
+    """{name: [image paths relative to root]} for every person folder with images"""
+    people = {}
+    for folder in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        images = sorted(
+            str(p.relative_to(root)) for p in folder.rglob('*')
+            if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+        )
+        if images:
+            people[folder.name] = images
+    return people
+
+
+class Journal:
+    """
+    Outcome of every image handled so far (path, status, encoding), saved
+    atomically (temp file + rename) so a rerun can skip them
+    """
+
+    def __init__(self, path, root):
+        self.path = Path(path)
+        self.root = str(Path(root).resolve())
+        self.results = {}  # Relative image path -> (status, encoding or None)
+        if self.path.exists():
+            self._load()
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            root = str(data['root'])
+            paths = data['paths'].tobytes().decode('utf-8').split('\0')
+            statuses, encodings = data['statuses'], data['encodings']
+        if root != self.root:
+            print(f"Ignoring {self.path}: it belongs to a run over {root}")
+            return
+
+        rows = iter(encodings)
+        for path, status in zip(paths, statuses.tolist()):
+            self.results[path] = (status, next(rows) if status == OK else None)
+
+    def record(self, path, status, encoding):
+        self.results[path] = (status, encoding)
+
+    def save(self):
+        paths = list(self.results)
+        statuses = np.array([self.results[path][0] for path in paths], np.int8)
+        encodings = [encoding for status, encoding in self.results.values() if status == OK]
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                root=np.array(self.root),
+                paths=np.frombuffer('\0'.join(paths).encode('utf-8'), dtype=np.uint8),
+                statuses=statuses,
+                encodings=np.array(encodings, np.float32).reshape(-1, ENCODING_SIZE),
+            )
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enroll everyone in a directory of <name>/ photo folders")
+    parser.add_argument('directory', help="Folder with one sub-folder of photos per person")
+    parser.add_argument('--enrollments', default=ENROLLMENTS_PATH)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Images processed in parallel")
+    parser.add_argument('--replace', action='store_true', help="Re-enroll people who are already enrolled")
+    parser.add_argument('--max-side', type=int, default=MAX_IMAGE_SIDE,
+                        help="Downscale photos whose longest side exceeds this many pixels")
+    parser.add_argument('--min-face-size', type=int, default=DEFAULT_MIN_FACE_SIZE)
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY,
+                        help="Images between progress journal writes")
+    args = parser.parse_args()
+
+    store = EnrollmentStore(args.enrollments)
+    people = find_photos(args.directory)
+    if not args.replace:
+        people = {name: images for name, images in people.items() if name not in store}
+    if not people:
+        print(f"Nobody left to enroll from {args.directory}")
+        return
+
+    journal = Journal(Path(args.enrollments).with_suffix('.bulk.npz'), args.directory)
+    pending = [path for images in people.values() for path in images if path not in journal.results]
+    resumed = sum(len(images) for images in people.values()) - len(pending)
+
+    print(f"{len(people)} people to enroll from {args.directory}: {len(pending)} images"
+          + (f" ({resumed} done in an earlier run)" if resumed else ""))
+
+    started = time.perf_counter()
+    timings = []
+    if pending:
+        options = {'max_side': args.max_side, 'min_face_size': args.min_face_size}
+        workers = max(1, min(args.workers or 1, len(pending)))
+        print(f"{'image':<48}{'faces':>6}{'ms':>8}  result")
+
+        # spawn: dlib is not fork-safe
+        context = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(options,))
+        try:
+            futures = {pool.submit(encode_image, Path(args.directory) / path): path for path in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                status, faces, encoding, seconds = future.result()
+                journal.record(path, status, encoding)
+                timings.append(seconds)
+                print(f"{path[-47:]:<48}{faces:>6}{seconds * 1000:>8.0f}  {STATUS_TEXT[status]}")
+                if done % max(1, args.checkpoint_every) == 0:
+                    journal.save()
+        except KeyboardInterrupt:
+            journal.save()
+            pool.shutdown(wait=False, cancel_futures=True)
+            print(f"\nInterrupted; {len(journal.results)} images journaled to {journal.path}. "
+                  f"Run again to continue.")
+            return
+        pool.shutdown()
+        journal.save()
+    wall = time.perf_counter() - started
+
+    # Everyone in one store update, samples in file order
+    enrollments, rejected = {}, []
+    for name, images in people.items():
+        samples = []
+        for path in images:
+            status, encoding = journal.results[path]
+            if status == OK:
+                samples.append(encoding)
+            else:
+                rejected.append((path, status))
+        if samples:
+            enrollments[name] = np.stack(samples)
+    store.update(enrollments)
+    ann_index.load_or_build(store, args.enrollments)
+    journal.remove()
+
+    if rejected:
+        print(f"\nRejected {len(rejected)} images:")
+        for path, status in rejected:
+            print(f"  {path}: {STATUS_TEXT[status]}")
+    missing = len(people) - len(enrollments)
+    print(f"\nEnrolled {len(enrollments)} people into {args.enrollments}"
+          + (f"; {missing} had no usable photo" if missing else ""))
+    if timings:
+        touched = {Path(path).parts[0] for path in pending}
+        per_image = np.array(timings) * 1000
+        print(f"{len(timings)} images in {wall:.1f}s with {workers} workers: "
+              f"{len(touched) / wall * 60:.0f} identities/min, per image "
+              f"median {np.median(per_image):.0f} ms, p95 {np.percentile(per_image, 95):.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
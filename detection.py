@@ -0,0 +1,137 @@
+"""
+Multi-scale face detection: detect on a downscaled frame, encode on full resolution.
+PreviewDetector is a much cheaper detector for "is there a face" feedback.
+"""
+import cv2
+import numpy as np
+import face_recognition
+
+
+DEFAULT_DETECTION_SCALE = 0.5
+DEFAULT_MIN_FACE_SIZE = 40
+PREVIEW_WIDTH = 320  # Frames are shrunk to this width for the preview detector
+QUALITY_CROP_SIZE = 96  # Faces are compared for sharpness at this size
+
+
+class FaceDetector:
+    """
+    Runs the HOG/CNN detector on a resized copy of the frame and maps the
+    boxes back to full resolution, so face_encodings still sees the
+    original pixels.
+
+    Frames from OpenCV are BGR; dlib expects RGB, so frames are converted
+    once here and the RGB copy is reused for encoding.
+
+    With the default upsample of 1 the HOG detector finds faces down to
+    roughly 40 px at the detection scale, i.e. 40 / scale px in the
+    original frame (80 px at 1/2, 160 px at 1/4).
+    """
+
+    def __init__(self, scale=DEFAULT_DETECTION_SCALE, min_face_size=DEFAULT_MIN_FACE_SIZE,
+                 model='hog', upsample=1):
+        if not 0 < scale <= 1:
+            raise ValueError(f"Detection scale must be in (0, 1], got {scale}")
+
+        self.scale = scale
+        self.min_face_size = min_face_size
+        self.model = model
+        self.upsample = upsample
+
+    @staticmethod
+    def to_rgb(frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def detect(self, rgb):
+        """Face boxes (top, right, bottom, left) in full-resolution coordinates"""
+        if self.scale < 1:
+            small = cv2.resize(rgb, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = rgb
+
+        boxes = face_recognition.face_locations(
+            small, number_of_times_to_upsample=self.upsample, model=self.model
+        )
+        if not boxes:
+            return []
+
+        height, width = rgb.shape[:2]
+        scaled = np.rint(np.asarray(boxes, dtype=np.float32) / self.scale).astype(int)
+        scaled[:, [0, 2]] = np.clip(scaled[:, [0, 2]], 0, height)
+        scaled[:, [1, 3]] = np.clip(scaled[:, [1, 3]], 0, width)
+
+        return [
+            (int(top), int(right), int(bottom), int(left))
+            for top, right, bottom, left in scaled
+            if min(right - left, bottom - top) >= self.min_face_size
+        ]
+
+    def encode(self, rgb, boxes):
+        """128-d encodings computed on the full-resolution RGB frame"""
+        if not boxes:
+            return []
+        return face_recognition.face_encodings(rgb, boxes)
+
+    def detect_and_encode(self, frame):
+        """Convenience for BGR frames: returns (boxes, encodings)"""
+        rgb = self.to_rgb(frame)
+        boxes = self.detect(rgb)
+        return boxes, self.encode(rgb, boxes)
+
+
+class PreviewDetector:
+    """
+    OpenCV's Haar frontal-face cascade on a small grayscale copy of the
+    frame: a few milliseconds per frame where HOG on the same frame takes
+    tens to hundreds. Good enough to tell whether someone is in front of
+    the camera, not for encoding. Falls back to HOG at 1/4 scale on
+    OpenCV builds without the cascade classifier (5.x moved it to contrib).
+    """
+
+    def __init__(self, width=PREVIEW_WIDTH, min_face_size=DEFAULT_MIN_FACE_SIZE):
+        self.width = width
+        self.min_face_size = min_face_size
+        self.cascade = None
+        self.fallback = None
+
+        cascades = getattr(getattr(cv2, 'data', None), 'haarcascades', None)
+        if cascades and hasattr(cv2, 'CascadeClassifier'):
+            cascade = cv2.CascadeClassifier(cascades + 'haarcascade_frontalface_default.xml')
+            if not cascade.empty():
+                self.cascade = cascade
+        if self.cascade is None:
+            self.fallback = FaceDetector(0.25, min_face_size)
+
+    def detect(self, frame):
+        """Face boxes (top, right, bottom, left) in full-resolution coordinates of a BGR frame"""
+        if self.cascade is None:
+            return self.fallback.detect(self.fallback.to_rgb(frame))
+
+        scale = min(1.0, self.width / frame.shape[1])
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else frame
+        gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+        min_size = max(1, int(self.min_face_size * scale))
+
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+        return [
+            (int(y / scale), int((x + w) / scale), int((y + h) / scale), int(x / scale))
+            for x, y, w, h in faces
+        ]
+
+
+def face_quality(frame, box):
+    """
+    How good a BGR frame's face is as an enrollment sample: sharpness
+    (variance of the Laplacian) times left/right symmetry, which drops as
+    the head turns away from the camera
+    """
+    top, right, bottom, left = box
+    crop = frame[max(top, 0):bottom, max(left, 0):right]
+    if crop.size == 0:
+        return 0.0
+
+    gray = cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), (QUALITY_CROP_SIZE, QUALITY_CROP_SIZE),
+                      interpolation=cv2.INTER_AREA).astype(np.float32)
+    sharpness = cv2.Laplacian(gray, cv2.CV_32F).var()
+    symmetry = 1.0 - np.abs(gray - gray[:, ::-1]).mean() / 255.0
+    # Symmetry only spans ~0.8 (profile) to ~0.95 (frontal); sharpen its weight
+    return float(sharpness * symmetry ** 4)
@@ -0,0 +1,103 @@
+"""
+Video display: paints only the visible tab, at most once per screen refresh
+"""
+from PyQt5.QtCore import QObject, QTimer, Qt
+from PyQt5.QtGui import QImage, QPixmap, QGuiApplication
+
+
+DEFAULT_REFRESH_RATE = 60.0
+
+
+def bgr_pixmap(frame):
+    """
+    QPixmap of a BGR frame without a colour conversion. The QImage wraps the
+    frame's memory; QPixmap.fromImage makes the copy Qt paints from, so the
+    frame can be reused as soon as this returns.
+    """
+    h, w = frame.shape[:2]
+    image = QImage(frame.data, w, h, frame.strides[0], QImage.Format_BGR888)
+    return QPixmap.fromImage(image)
+
+
+class FrameDisplay(QObject):
+    """
+    Coalesces camera frames and paints them on the current tab of a
+    QTabWidget from a timer running at the screen refresh rate.
+
+    set_frame() only keeps a reference to the newest frame of each camera,
+    so a burst of frames costs nothing and the GUI thread can never fall
+    behind the cameras; frames that arrive between two refreshes are
+    skipped and counted. A page takes part by implementing
+    render_frame(camera_id, frame), which draws its overlays (copying only
+    when there is something to draw) and sets its pixmap. Hidden pages and
+    a minimised window are not painted.
+    """
+
+    def __init__(self, tabs, refresh_rate=None, parent=None):
+        super().__init__(parent)
+        self.tabs = tabs
+        self.frame_refs = {}  # camera id -> newest FrameRef
+        self.dirty = set()  # cameras with something new to paint
+        self.frames_in = 0
+        self.rendered = 0
+        self.skipped_hidden = 0
+
+        if refresh_rate is None:
+            screen = QGuiApplication.primaryScreen()
+            refresh_rate = screen.refreshRate() if screen else DEFAULT_REFRESH_RATE
+        self.refresh_rate = refresh_rate or DEFAULT_REFRESH_RATE
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(max(1, int(1000 / self.refresh_rate)))
+        self.timer.timeout.connect(self.render)
+
+        # Paint the newly selected page straight away
+        self.tabs.currentChanged.connect(self.invalidate)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        for frame_ref in self.frame_refs.values():
+            frame_ref.release()
+        self.frame_refs = {}
+
+    def set_frame(self, camera_id, frame_ref):
+        """Replace the camera's frame to show at the next refresh"""
+        previous = self.frame_refs.get(camera_id)
+        if previous is not None:
+            previous.release()
+        self.frame_refs[camera_id] = frame_ref.retain()
+        self.frames_in += 1
+        self.dirty.add(camera_id)
+
+    def invalidate(self, *args):
+        """Repaint every camera at the next refresh, e.g. after a tab switch"""
+        self.dirty.update(self.frame_refs)
+
+    def render(self):
+        if not self.dirty:
+            return
+
+        window = self.tabs.window()
+        page = self.tabs.currentWidget()
+        if window.isMinimized() or not page.isVisible() or not hasattr(page, 'render_frame'):
+            self.skipped_hidden += 1
+            return
+
+        for camera_id in sorted(self.dirty):
+            self.rendered += 1
+            page.render_frame(camera_id, self.frame_refs[camera_id].image)
+        self.dirty.clear()
+
+    def stats(self):
+        """Frames received and painted; the rest were coalesced or hidden"""
+        return {
+            'refresh_rate': self.refresh_rate,
+            'frames_in': self.frames_in,
+            'rendered': self.rendered,
+            'coalesced': self.frames_in - self.rendered,
+            'skipped_hidden': self.skipped_hidden,
+        }
@@ -0,0 +1,126 @@
+"""
+Batched emotion inference on small pre-cropped faces
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from gallery import UNKNOWN
+
+
+# Output order of DeepFace's facial expression model
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+CROP_SIZE = 48
+MIN_FACE_SIZE = 48
+
+
+def crop_face(frame, face_location, size=CROP_SIZE, min_face_size=MIN_FACE_SIZE):
+    """
+    Grayscale size x size crop of one face, the emotion model's input.
+    Returns None if the face region is too small to classify.
+    """
+    top, right, bottom, left = face_location
+    face_img = frame[max(top, 0):bottom, max(left, 0):right]
+
+    if face_img.shape[0] < min_face_size or face_img.shape[1] < min_face_size:
+        return None
+
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+
+
+class EmotionModel:
+    """DeepFace's facial expression CNN, called directly on batches of crops"""
+
+    def __init__(self):
+        from deepface import DeepFace
+
+        # The Keras model behind DeepFace.analyze(actions=['emotion'])
+        self.model = DeepFace.build_model(task='facial_attribute', model_name='Emotion').model
+
+    def predict(self, crops):
+        """Dominant emotion for each 48x48 grayscale crop, one forward pass for all"""
+        if not len(crops):
+            return []
+
+        batch = np.stack(crops).astype(np.float32)[..., None] / 255.0
+        scores = np.asarray(self.model(batch, training=False))
+        return [EMOTION_LABELS[idx] for idx in np.argmax(scores, axis=1)]
+
+
+class EmotionCache:
+    """
+    Recent emotion per identity (or track), so a person standing in front
+    of the camera is not re-classified every frame. Entries expire after
+    ttl seconds and the least recently used entry is evicted beyond
+    max_size. Safe to share between threads.
+    """
+
+    def __init__(self, ttl=30.0, max_size=512):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (emotion, stored_at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached emotion for key, or None if missing or expired"""
+        if key is None:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, emotion):
+        if key is None:
+            return
+
+        with self._lock:
+            self._entries[key] = (emotion, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# One cache shared by every front-end in the process
+shared_cache = EmotionCache()
+
+
+def cache_key(name, track_id=None):
+    """Known people are cached by name, unknown faces by their track (or not at all)"""
+    if name != UNKNOWN:
+        return name
+    return ('track', track_id) if track_id is not None else None
@@ -0,0 +1,336 @@
+"""
+Enrolled face encodings on disk, without pickle.
+
+For a store at enrollments.npz:
+    enrollments.npz       index: every record's name, first row, sample count
+                          and live flag, plus the matrix generation in use
+    enrollments.<n>.npy   float32 (capacity, 128) sample matrix, generation n
+    enrollments.npz.lock  taken by whoever is changing the store
+
+Opening a store reads the index and memory-maps the matrix, so it costs
+the same for a hundred people as for a hundred thousand; samples are paged
+in when the matcher first touches them. Enrolling writes the new samples
+into free rows at the end of the matrix and then replaces the index (temp
+file + rename); re-enrolling or deleting someone only clears their old
+record's live flag. A reader, or a crash, therefore only ever sees a
+complete index pointing at rows that were written before it. When the
+matrix is full, or dead rows outnumber live ones, the live rows are copied
+into the next generation and the index switched over to it; the previous
+generation is kept until the one after, for readers still opening it.
+
+Several processes may change the same store (the GUI while bulk_enroll.py
+runs, say): every change takes the lock file and first reloads the index
+if someone else committed since, so nobody writes back a stale index.
+
+Usage:
+    python enrollment_store.py import enrollments.pkl   # one-time migration of a trusted pickle
+    python enrollment_store.py compact
+"""
+import argparse
+import os
+from collections.abc import Mapping
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from gallery import ENCODING_SIZE
+
+
+ENROLLMENTS_PATH = 'enrollments.npz'
+INITIAL_CAPACITY = 4096  # Sample rows in a new matrix
+COMPACT_MIN_DEAD = 4096  # Dead rows tolerated before compacting, whatever the live count
+
+
+class EnrollmentStore(Mapping):
+    """
+    Read-only mapping of name to a (samples, 128) float32 array (a view of
+    the memory-mapped matrix), changed through update(), add() and
+    remove(). Arrays handed out stay valid after later changes: rows are
+    never overwritten while an index refers to them.
+
+    Changes from several processes are serialized by a lock file; readers
+    need no lock and see changes when they open the store again (or make
+    a change of their own).
+    """
+    # What the index file holds; everything else is derived on load
+    INDEX_FIELDS = ('name_blob', 'starts', 'counts', 'live', 'generation', 'used')
+
+    def __init__(self, path=ENROLLMENTS_PATH):
+        self.path = Path(path)
+        # One record per enrollment ever made since the last compaction;
+        # names are kept NUL-separated in one UTF-8 blob, which loads far
+        # faster than an array of strings
+        self.names = []
+        self.name_blob = b''
+        self.starts = np.empty(0, np.int64)
+        self.counts = np.empty(0, np.int64)
+        self.live = np.empty(0, bool)
+        self.generation = 0
+        self.used = 0  # Rows of the matrix written so far, live or dead
+        self.matrix = np.empty((0, ENCODING_SIZE), np.float32)
+        self.lookup = {}  # Name -> its live record
+        self.live_rows = 0
+        self.stamp = None  # Identity of the index file last loaded or written
+        if self.path.exists():
+            self._load()
+
+    def _matrix_path(self, generation):
+        return self.path.with_name(f"{self.path.stem}.{generation}.npy")
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        for attempt in range(3):
+            stamp = self._stamp()
+            with np.load(self.path, allow_pickle=False) as data:
+                name_blob = data['name_blob'].tobytes()
+                starts, counts, live = data['starts'], data['counts'], data['live']
+                generation, used = int(data['generation']), int(data['used'])
+            try:
+                matrix = np.load(self._matrix_path(generation), mmap_mode='r')
+                break
+            except FileNotFoundError:
+                # Another process moved two generations on since this index was written
+                if attempt == 2:
+                    raise
+
+        self.name_blob, self.starts, self.counts, self.live = name_blob, starts, counts, live
+        self.generation, self.used, self.matrix, self.stamp = generation, used, matrix, stamp
+        self.names = self.name_blob.decode('utf-8').split('\0') if self.name_blob else []
+        self.lookup = {self.names[record]: record for record in np.flatnonzero(self.live).tolist()}
+        self.live_rows = int(self.counts[self.live].sum())
+
+    @contextmanager
+    def _locked(self):
+        """Hold the store's lock file, with the index reloaded if another process changed it"""
+        with open(self.path.with_name(self.path.name + '.lock'), 'a+b') as f:
+            if os.name == 'nt':
+                import msvcrt
+
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Retries for ~10 s, then raises
+                        break
+                    except OSError:
+                        pass
+            else:
+                import fcntl
+
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if self._stamp() != self.stamp:
+                    if self.path.exists():
+                        self._load()
+                yield
+            finally:
+                if os.name == 'nt':
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _commit(self, **changes):
+        """Write the index with `changes` applied (temp file + rename), then adopt them"""
+        index = {field: changes.get(field, getattr(self, field)) for field in self.INDEX_FIELDS}
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                name_blob=np.frombuffer(index['name_blob'], dtype=np.uint8),
+                starts=index['starts'],
+                counts=index['counts'],
+                live=index['live'],
+                generation=np.array(index['generation']),
+                used=np.array(index['used']),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.stamp = self._stamp()
+        for field, value in changes.items():
+            setattr(self, field, value)
+
+    # -- Mapping -------------------------------------------------------------
+
+    def __getitem__(self, name):
+        record = self.lookup[name]
+        start = int(self.starts[record])
+        return self.matrix[start:start + int(self.counts[record])]
+
+    def __iter__(self):
+        return iter(self.lookup)
+
+    def __len__(self):
+        return len(self.lookup)
+
+    def __contains__(self, name):
+        return name in self.lookup
+
+    def packed(self):
+        """(names, sample counts, samples) of everyone, samples stacked in name order"""
+        records = np.fromiter(self.lookup.values(), np.intp, len(self.lookup))
+        starts, counts = self.starts[records], self.counts[records]
+        if self.live_rows == self.used and np.all(starts[1:] == starts[:-1] + counts[:-1]):
+            # Nothing dead or reordered: the mapped matrix itself, no copy
+            matrix = self.matrix[:self.used]
+        else:
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            matrix = self.matrix[offsets + np.arange(len(offsets))]
+        return list(self.lookup), counts, matrix
+
+    # -- Changes -------------------------------------------------------------
+
+    def update(self, enrollments):
+        """
+        Enroll (or re-enroll) several people with one index write:
+        enrollments maps names to their samples
+        """
+        batch = {}
+        for name, samples in enrollments.items():
+            if not name or '\0' in name:
+                raise ValueError(f"Invalid enrollment name {name!r}")
+            batch[name] = np.asarray(samples, np.float32).reshape(-1, ENCODING_SIZE)
+        rows = sum(len(samples) for samples in batch.values())
+        if not rows:
+            return
+        with self._locked():
+            self._update(batch, rows)
+
+    def _update(self, batch, rows):
+        if self.used + rows > len(self.matrix):
+            self._rewrite(extra=rows)
+
+        start = self.used
+        with open(self._matrix_path(self.generation), 'r+b') as f:
+            f.seek(self.matrix.offset + start * ENCODING_SIZE * 4)
+            for samples in batch.values():
+                f.write(samples.tobytes())
+            # Rows reach the disk before an index that refers to them
+            f.flush()
+            os.fsync(f.fileno())
+
+        replaced = [self.lookup[name] for name in batch if name in self.lookup]
+        live = self.live.copy()
+        live[replaced] = False
+        counts = np.array([len(samples) for samples in batch.values()], np.int64)
+        blob = b'\0'.join(name.encode('utf-8') for name in batch)
+        self._commit(
+            name_blob=self.name_blob + b'\0' + blob if self.names else blob,
+            starts=np.concatenate([self.starts, start + np.cumsum(counts) - counts]),
+            counts=np.concatenate([self.counts, counts]),
+            live=np.concatenate([live, np.ones(len(batch), bool)]),
+            used=start + rows,
+        )
+
+        self.live_rows += rows - int(self.counts[replaced].sum())
+        first = len(self.names)
+        self.names.extend(batch)
+        for record, name in enumerate(batch, first):
+            self.lookup.pop(name, None)  # Re-enrolled people move to the end
+            self.lookup[name] = record
+        self._compact_if_sparse()
+
+    def add(self, name, samples):
+        """Enroll a person, replacing any previous samples"""
+        self.update({name: samples})
+
+    def remove(self, name):
+        """Delete a person; their rows are reclaimed by a later compaction"""
+        with self._locked():
+            self._remove(name)
+
+    def _remove(self, name):
+        record = self.lookup[name]
+        live = self.live.copy()
+        live[record] = False
+        self._commit(live=live)
+        del self.lookup[name]
+        self.live_rows -= int(self.counts[record])
+        self._compact_if_sparse()
+
+    def _compact_if_sparse(self):
+        if self.used - self.live_rows > max(self.live_rows, COMPACT_MIN_DEAD):
+            self._rewrite(extra=0)  # The lock is already held
+
+    def compact(self):
+        """Copy the live rows into a new matrix generation, dropping dead records"""
+        with self._locked():
+            self._rewrite(extra=0)
+
+    def _rewrite(self, extra):
+        """Move the live records to a new generation with room for `extra` more rows"""
+        names, counts, samples = self.packed()
+        capacity = max(INITIAL_CAPACITY, 2 * (len(samples) + extra))
+
+        generation = self.generation + 1
+        matrix = np.lib.format.open_memmap(
+            self._matrix_path(generation), mode='w+', dtype=np.float32, shape=(capacity, ENCODING_SIZE)
+        )
+        matrix[:len(samples)] = samples
+        matrix.flush()
+        del matrix
+
+        self._commit(
+            name_blob=b'\0'.join(name.encode('utf-8') for name in names),
+            starts=np.cumsum(counts) - counts,
+            counts=counts,
+            live=np.ones(len(names), bool),
+            generation=generation,
+            used=len(samples),
+        )
+        self.names = names
+        self.lookup = {name: record for record, name in enumerate(names)}
+        self.matrix = np.load(self._matrix_path(generation), mmap_mode='r')
+        self._remove_old_generations()
+
+    def _remove_old_generations(self):
+        """Delete matrix generations before the previous one"""
+        for path in self.path.parent.glob(f"{self.path.stem}.*.npy"):
+            generation = path.suffixes[-2][1:] if len(path.suffixes) > 1 else ''
+            if generation.isdigit() and int(generation) < self.generation - 1:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass  # Still mapped (Windows); removed after a later rewrite
+
+
+def import_pickle(pickle_path, store):
+    """
+    Copy an old enrollments.pkl (name -> list of encodings) into the store.
+    Only for files you trust: unpickling can run arbitrary code.
+    """
+    import pickle
+
+    with open(pickle_path, 'rb') as f:
+        enrollments = pickle.load(f)
+    store.update({name: samples for name, samples in enrollments.items() if len(samples)})
+    return len(enrollments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the enrollment store")
+    parser.add_argument('--store', default=ENROLLMENTS_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="Import a (trusted) enrollments.pkl")
+    import_parser.add_argument('pickle_file')
+    commands.add_parser('compact', help="Reclaim the rows of deleted and re-enrolled people")
+    args = parser.parse_args()
+
+    store = EnrollmentStore(args.store)
+    if args.command == 'import':
+        count = import_pickle(args.pickle_file, store)
+        print(f"Imported {count} people into {args.store}")
+    else:
+        store.compact()
+        print(f"Compacted {args.store}: {len(store)} people, {store.used} samples")
+
+
+if __name__ == '__main__':
+    main()
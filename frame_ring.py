@@ -0,0 +1,175 @@
+"""
+Preallocated ring of camera frames shared by capture, recognition and display
+"""
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRef:
+    """
+    A counted reference to one frame in a FrameRing. image is a view into
+    the ring, not a copy; it stays valid until release(). Every holder
+    calls retain() for its own reference and releases it when done.
+    """
+
+    __slots__ = ('ring', 'slot', 'seq', '_released')
+
+    def __init__(self, ring, slot, seq):
+        self.ring = ring
+        self.slot = slot
+        self.seq = seq
+        self._released = False
+
+    @property
+    def image(self):
+        return self.ring.frames[self.slot]
+
+    @property
+    def shape(self):
+        return self.ring.shape
+
+    def retain(self):
+        """A new reference to the same frame, released independently"""
+        if self._released:
+            raise ValueError(f"Frame {self.seq} was already released")
+        self.ring._retain(self.slot)
+        return FrameRef(self.ring, self.slot, self.seq)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.ring._release(self.slot)
+
+
+class FrameRing:
+    """
+    Fixed set of frame slots allocated once. The capture thread reads each
+    frame straight into a free slot and publishes it with a sequence
+    number; consumers hold FrameRefs (views) instead of copies. A slot is
+    reused only once every reference to it was released. When all slots
+    are still referenced the new frame is dropped and counted.
+
+    With shared=True the slots live in shared memory, so the recognition
+    process pool can read a frame by slot without copying it.
+    """
+
+    def __init__(self, shape, slots=8, dtype=np.uint8, shared=False):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_count = slots
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        self.shm = None
+        if shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slots)
+            self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        else:
+            self.frames = np.empty((slots,) + self.shape, dtype=self.dtype)
+
+        self.refcounts = [0] * slots
+        self.seqs = [-1] * slots
+        self.next_slot = 0
+        self.next_seq = 0
+        self.published = 0
+        self.dropped = 0
+        self.read_failures = 0
+        self.allocations = 1  # the slot buffer itself
+        self.bytes_copied = 0
+        self._lock = threading.Lock()
+
+    def offset(self, slot):
+        """Byte offset of a slot within the shared memory block"""
+        return slot * self.frame_bytes
+
+    def _acquire(self):
+        """Reserve a free slot for writing, or None if every slot is referenced"""
+        with self._lock:
+            for step in range(self.slot_count):
+                slot = (self.next_slot + step) % self.slot_count
+                if self.refcounts[slot] == 0:
+                    self.refcounts[slot] = 1
+                    self.next_slot = (slot + 1) % self.slot_count
+                    return slot
+            self.dropped += 1
+            return None
+
+    def _publish(self, slot):
+        with self._lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.seqs[slot] = seq
+            self.published += 1
+        return FrameRef(self, slot, seq)
+
+    def _retain(self, slot):
+        with self._lock:
+            self.refcounts[slot] += 1
+
+    def _release(self, slot):
+        with self._lock:
+            self.refcounts[slot] -= 1
+
+    def read_from(self, cap):
+        """
+        Read the next frame from a cv2.VideoCapture directly into a free
+        slot. Returns a FrameRef owned by the caller, or None if the read
+        failed or no slot was free (the frame is then skipped).
+        """
+        slot = self._acquire()
+        if slot is None:
+            cap.grab()  # Keep the camera queue moving
+            return None
+
+        view = self.frames[slot]
+        ret, image = cap.read(image=view)
+        if not ret or image is None:
+            self._release(slot)
+            self.read_failures += 1
+            return None
+
+        if not np.shares_memory(image, view):
+            # The backend allocated its own buffer instead of filling ours
+            if image.shape != self.shape:
+                self._release(slot)
+                raise ValueError(f"Frame shape {image.shape} does not match the ring's {self.shape}")
+            view[...] = image
+            self.allocations += 1
+            self.bytes_copied += image.nbytes
+
+        return self._publish(slot)
+
+    def write(self, frame):
+        """Copy a frame from elsewhere into a free slot; returns a FrameRef or None"""
+        slot = self._acquire()
+        if slot is None:
+            return None
+        self.frames[slot] = frame
+        self.bytes_copied += frame.nbytes
+        return self._publish(slot)
+
+    def in_use(self):
+        with self._lock:
+            return sum(1 for count in self.refcounts if count)
+
+    def stats(self):
+        return {
+            'slots': self.slot_count,
+            'in_use': self.in_use(),
+            'published': self.published,
+            'dropped': self.dropped,
+            'read_failures': self.read_failures,
+            'allocations': self.allocations,
+            'bytes_copied': self.bytes_copied,
+        }
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.unlink()
+            try:
+                self.shm.close()
+            except BufferError:
+                # Views are still held; the mapping goes when they do
+                pass
+            self.shm = None
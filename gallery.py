@@ -0,0 +1,374 @@
+"""
+Vectorized gallery matcher for face encodings
+"""
+import numpy as np
+
+
+UNKNOWN = "Unknown"
+ENCODING_SIZE = 128
+
+# How a person's enrollment samples are reduced to a single distance:
+#   centroid - distance to the mean of the samples (one row per person)
+#   nearest  - distance to the closest sample
+#   topk     - mean distance to the k closest samples
+POLICIES = ('centroid', 'nearest', 'topk')
+
+# Below this many identities the exact scan is fast enough and more accurate
+# than the approximate index
+ANN_MIN_IDENTITIES = 20000
+
+# Dead sample rows are reclaimed by a repack once they outnumber the live
+# ones and there are at least this many
+REPACK_MIN_DEAD_ROWS = 1024
+
+
+def pack(enrollments):
+    """
+    (names, per-person sample counts, stacked float32 samples) of everyone
+    with samples, from a dict of name -> samples or an EnrollmentStore
+    (which stacks them without copying where it can)
+    """
+    packed = getattr(enrollments, 'packed', None)
+    if packed is not None:
+        return packed()
+
+    names = [name for name in enrollments if len(enrollments[name])]
+    samples = [np.asarray(enrollments[name], dtype=np.float32).reshape(-1, ENCODING_SIZE) for name in names]
+    counts = np.array([len(s) for s in samples], dtype=np.intp)
+    matrix = np.concatenate(samples) if samples else np.empty((0, ENCODING_SIZE), dtype=np.float32)
+    return names, counts, matrix
+
+
+class GalleryMatcher:
+    """
+    Matches face encodings against the enrolled gallery in one batched operation.
+
+    The gallery is published as an immutable snapshot (a dict of arrays)
+    that match() reads once per call, so a frame is matched against one
+    consistent gallery while another thread changes it. add(), replace()
+    and remove() cost O(samples changed): new samples are written into
+    spare capacity past the end of every published snapshot, removed
+    people become tombstones (their column is masked to inf), and a new
+    snapshot is swapped in with one assignment. Dead rows are dropped by
+    a full repack once they outnumber the live ones. Changes must come
+    from one thread at a time.
+    """
+
+    def __init__(self, enrollments=None, tolerance=0.6, policy='centroid', top_k=3,
+                 index=None, ann_threshold=ANN_MIN_IDENTITIES, ann_candidates=32,
+                 repack_min_dead_rows=REPACK_MIN_DEAD_ROWS):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown matching policy '{policy}', expected one of {POLICIES}")
+
+        self.tolerance = tolerance
+        self.policy = policy
+        self.top_k = top_k
+        # Optional IVFIndex; only consulted once the gallery reaches
+        # ann_threshold identities, below that exact search is used
+        self.ann_threshold = ann_threshold
+        self.ann_candidates = ann_candidates
+        self.repack_min_dead_rows = repack_min_dead_rows
+        # Every reader takes one reference to this dict so it never sees
+        # names from one gallery and vectors from another
+        self._gallery = self._pack(*pack({}), index=index)
+
+        if enrollments:
+            self.set_enrollments(enrollments)
+
+    def __len__(self):
+        return self._gallery['live']
+
+    def __contains__(self, name):
+        return self._person(self._gallery, name) is not None
+
+    @property
+    def names(self):
+        gallery = self._gallery
+        dead = gallery['dead']
+        return [name for idx, name in enumerate(gallery['names'][:gallery['people']]) if idx not in dead]
+
+    @property
+    def index(self):
+        return self._gallery['index']
+
+    @index.setter
+    def index(self, index):
+        self._gallery = dict(self._gallery, index=index)
+
+    def set_enrollments(self, enrollments):
+        """Rebuild the packed gallery from an enrollments mapping (dict or EnrollmentStore)"""
+        self._gallery = self._pack(*pack(enrollments), index=self._gallery['index'])
+
+    def _pack(self, names, counts, matrix, index=None):
+        """
+        New snapshot of stacked per-person samples: person offsets, norms,
+        centroids and padded sample indices, in buffers with room to grow
+        """
+        counts = np.asarray(counts, dtype=np.intp)
+        matrix = np.asarray(matrix, dtype=np.float32)
+        people, rows = len(counts), len(matrix)
+        width = int(counts.max()) if people else 0
+
+        # Some headroom, so the first few additions do not copy everything
+        buffers = self._buffers = self._allocate(people + people // 8 + 16, rows + rows // 8 + 64, width)
+        starts = np.zeros(people, dtype=np.intp)
+        if people:
+            starts[1:] = np.cumsum(counts)[:-1]
+        buffers['matrix'][:rows] = matrix
+        buffers['norms'][:rows] = np.einsum('ij,ij->i', matrix, matrix)
+        buffers['starts'][:people] = starts
+        buffers['counts'][:people] = counts
+        centroids = buffers['centroids'][:people]
+        # People grouped by sample count, each group summed as one (n, k, 128)
+        # block; np.add.reduceat over rows is several times slower
+        for count in np.unique(counts):
+            group = np.flatnonzero(counts == count)
+            members = (starts[group][:, None] + np.arange(count)).ravel()
+            centroids[group] = matrix[members].reshape(len(group), count, ENCODING_SIZE).mean(axis=1)
+        buffers['centroid_norms'][:people] = np.einsum('ij,ij->i', centroids, centroids)
+
+        # Sample indices per person padded to the largest enrollment, used
+        # by the top-k reduction; padding slots are masked out with inf
+        slots = np.arange(buffers['padded'].shape[1])
+        buffers['pad_mask'][:people] = slots[None, :] >= counts[:, None]
+        buffers['padded'][:people] = np.where(buffers['pad_mask'][:people], 0, starts[:, None] + slots[None, :])
+
+        buffers['names'].extend(names)
+        for idx, name in enumerate(names):
+            buffers['lookup'].setdefault(name, []).append(idx)
+        return self._snapshot(people, rows, frozenset(), index)
+
+    @staticmethod
+    def _allocate(people, rows, width, old=None):
+        """Buffers for at least this many people, sample rows and samples per person"""
+        buffers = {
+            'matrix': np.zeros((rows, ENCODING_SIZE), dtype=np.float32),
+            'norms': np.zeros(rows, dtype=np.float32),
+            'starts': np.zeros(people, dtype=np.intp),
+            'counts': np.zeros(people, dtype=np.intp),
+            'centroids': np.zeros((people, ENCODING_SIZE), dtype=np.float32),
+            'centroid_norms': np.zeros(people, dtype=np.float32),
+            'padded': np.zeros((people, width), dtype=np.intp),
+            'pad_mask': np.ones((people, width), dtype=bool),
+            # Shared by every snapshot and only ever appended to: a
+            # snapshot reads names[:people] and the lookup entries below
+            # its own people count
+            'names': old['names'] if old else [],
+            'lookup': old['lookup'] if old else {},
+        }
+        if old is not None:
+            for key, array in buffers.items():
+                if isinstance(array, np.ndarray):
+                    source = old[key]
+                    array[tuple(slice(0, n) for n in source.shape)] = source
+        return buffers
+
+    def _snapshot(self, people, rows, dead, index):
+        buffers = self._buffers
+        gallery = {
+            key: buffers[key][:rows] for key in ('matrix', 'norms')
+        }
+        gallery.update({
+            key: buffers[key][:people]
+            for key in ('starts', 'counts', 'centroids', 'centroid_norms', 'padded', 'pad_mask')
+        })
+        gallery.update({
+            'names': buffers['names'],
+            'lookup': buffers['lookup'],
+            'people': people,
+            'rows': rows,
+            'dead': dead,
+            'dead_columns': np.array(sorted(dead), dtype=np.intp),
+            'live': people - len(dead),
+            'dead_rows': int(gallery['counts'][list(dead)].sum()) if dead else 0,
+            'index': index,
+        })
+        return gallery
+
+    @staticmethod
+    def _person(gallery, name):
+        """Column of a live person in a snapshot, or None"""
+        for idx in reversed(gallery['lookup'].get(name, ())):
+            if idx < gallery['people']:
+                return None if idx in gallery['dead'] else idx
+        return None
+
+    # -- Incremental updates -------------------------------------------------
+
+    def add(self, name, samples):
+        """Enroll a new person; O(their samples)"""
+        gallery = self._gallery
+        if self._person(gallery, name) is not None:
+            raise ValueError(f"{name} is already enrolled")
+        self._publish(self._append(gallery, name, samples, gallery['dead']))
+
+    def replace(self, name, samples):
+        """Swap a person's samples for new ones, in one snapshot"""
+        gallery = self._gallery
+        idx = self._person(gallery, name)
+        if idx is None:
+            raise KeyError(name)
+        self._publish(self._append(gallery, name, samples, gallery['dead'] | {idx}))
+
+    def remove(self, name):
+        """Drop a person; their samples are only reclaimed by a later repack"""
+        gallery = self._gallery
+        idx = self._person(gallery, name)
+        if idx is None:
+            raise KeyError(name)
+        self._publish(self._snapshot(gallery['people'], gallery['rows'], gallery['dead'] | {idx}, gallery['index']))
+
+    def _append(self, gallery, name, samples, dead):
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = len(samples)
+        if not count:
+            raise ValueError(f"No samples for {name}")
+        people, rows = gallery['people'], gallery['rows']
+
+        # Written past the end of every published snapshot, so readers
+        # never see these rows change; outgrown buffers are copied into
+        # larger ones and the old ones are left to current readers
+        buffers = self._buffers
+        width = buffers['padded'].shape[1]
+        if people + 1 > len(buffers['starts']) or rows + count > len(buffers['matrix']) or count > width:
+            buffers = self._buffers = self._allocate(
+                max(people + 1, 2 * len(buffers['starts'])),
+                max(rows + count, 2 * len(buffers['matrix'])),
+                max(count, width), buffers
+            )
+
+        centroid = samples.mean(axis=0)
+        slots = np.arange(buffers['padded'].shape[1])
+        buffers['matrix'][rows:rows + count] = samples
+        buffers['norms'][rows:rows + count] = np.einsum('ij,ij->i', samples, samples)
+        buffers['starts'][people] = rows
+        buffers['counts'][people] = count
+        buffers['centroids'][people] = centroid
+        buffers['centroid_norms'][people] = centroid @ centroid
+        buffers['pad_mask'][people] = slots >= count
+        buffers['padded'][people] = np.where(slots < count, rows + slots, 0)
+        buffers['names'].append(name)
+        buffers['lookup'].setdefault(name, []).append(people)
+        return self._snapshot(people + 1, rows + count, dead, gallery['index'])
+
+    def _publish(self, gallery):
+        """Swap in a new snapshot, repacking first when mostly dead"""
+        if gallery['dead_rows'] > max(gallery['rows'] - gallery['dead_rows'], self.repack_min_dead_rows):
+            live = [idx for idx in range(gallery['people']) if idx not in gallery['dead']]
+            starts, counts = gallery['starts'][live], gallery['counts'][live]
+            rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+            names = [gallery['names'][idx] for idx in live]
+            gallery = self._pack(names, counts, gallery['matrix'][rows], index=gallery['index'])
+        self._gallery = gallery
+
+    @staticmethod
+    def _pairwise(faces, matrix, norms):
+        """Euclidean distances between rows of faces and rows of matrix, shape (F, N)"""
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, one GEMM for the whole frame
+        squared = np.einsum('ij,ij->i', faces, faces)[:, None] + norms[None, :]
+        squared -= 2.0 * (faces @ matrix.T)
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared)
+
+    def use_ann(self, gallery=None):
+        gallery = gallery or self._gallery
+        return gallery['index'] is not None and gallery['live'] >= self.ann_threshold
+
+    def distances(self, encodings, gallery=None):
+        """Per-person distances for every encoding under the matching policy, shape (F, P)"""
+        gallery = gallery or self._gallery
+        faces = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+        if self.use_ann(gallery):
+            return self._ann_distances(faces, gallery)
+
+        if self.policy == 'centroid':
+            distances = self._pairwise(faces, gallery['centroids'], gallery['centroid_norms'])
+        else:
+            sample_distances = self._pairwise(faces, gallery['matrix'], gallery['norms'])
+
+            if self.policy == 'nearest':
+                distances = np.minimum.reduceat(sample_distances, gallery['starts'], axis=1)
+            else:
+                # topk: gather each person's samples into (F, P, width) and average
+                # the k smallest, counting fewer when a person has fewer samples
+                grouped = sample_distances[:, gallery['padded']]
+                grouped[:, gallery['pad_mask']] = np.inf
+                k = min(self.top_k, grouped.shape[2])
+                nearest = np.partition(grouped, k - 1, axis=2)[:, :, :k]
+                finite = np.isfinite(nearest)
+                distances = np.where(finite, nearest, 0.0).sum(axis=2) / finite.sum(axis=2)
+
+        # Removed people never match
+        distances[:, gallery['dead_columns']] = np.inf
+        return distances
+
+    def _candidate_distances(self, face, gallery, people):
+        """Exact policy distances from one face to a subset of people"""
+        if self.policy == 'centroid':
+            return self._pairwise(face[None], gallery['centroids'][people], gallery['centroid_norms'][people])[0]
+
+        rows = gallery['padded'][people]
+        pad_mask = gallery['pad_mask'][people]
+        grouped = self._pairwise(face[None], gallery['matrix'][rows.ravel()], gallery['norms'][rows.ravel()])
+        grouped = grouped.reshape(rows.shape)
+        grouped[pad_mask] = np.inf
+
+        if self.policy == 'nearest':
+            return grouped.min(axis=1)
+
+        k = min(self.top_k, grouped.shape[1])
+        nearest = np.partition(grouped, k - 1, axis=1)[:, :k]
+        finite = np.isfinite(nearest)
+        return np.where(finite, nearest, 0.0).sum(axis=1) / finite.sum(axis=1)
+
+    def _ann_distances(self, faces, gallery):
+        """Index lookup followed by an exact re-rank of the candidates; other people stay at inf"""
+        result = np.full((len(faces), gallery['people']), np.inf, dtype=np.float32)
+
+        for row, (face, candidates) in enumerate(zip(faces, gallery['index'].search(faces, self.ann_candidates))):
+            people = [self._person(gallery, name) for name in candidates]
+            people = np.array([idx for idx in people if idx is not None], dtype=np.intp)
+            if len(people):
+                result[row, people] = self._candidate_distances(face, gallery, people)
+
+        return result
+
+    def match(self, encodings):
+        """
+        Match a frame's face encodings against the gallery.
+
+        Returns (names, distances, margins): the closest identity per face
+        ("Unknown" above tolerance), its distance, and the gap to the
+        runner-up identity (inf when there is no runner-up).
+        """
+        gallery = self._gallery
+        names = gallery['names']
+        count = len(encodings)
+
+        if count == 0 or not gallery['live']:
+            return (
+                [UNKNOWN] * count,
+                np.full(count, np.inf, dtype=np.float32),
+                np.full(count, np.inf, dtype=np.float32)
+            )
+
+        distances = self.distances(encodings, gallery)
+        rows = np.arange(count)
+
+        if gallery['people'] > 1:
+            top2 = np.argpartition(distances, 1, axis=1)[:, :2]
+            pair = distances[rows[:, None], top2]
+            order = np.argsort(pair, axis=1)
+            best = top2[rows, order[:, 0]]
+            margins = pair[rows, order[:, 1]] - pair[rows, order[:, 0]]
+        else:
+            best = np.zeros(count, dtype=np.intp)
+            margins = np.full(count, np.inf, dtype=np.float32)
+
+        best_distances = distances[rows, best]
+        matched = [
+            names[idx] if dist <= self.tolerance else UNKNOWN
+            for idx, dist in zip(best, best_distances)
+        ]
+        return matched, best_distances, margins
@@ -29,6 +29,9 @@ pip install seaborn==0.13.2
 # Install Excel export support
 pip install openpyxl==3.1.5
 
+# Install Parquet support for the attendance archive
+pip install pyarrow==21.0.0
+
 # The other dependencies should already be installed from your terminal version
 # But we'll ensure they're up to date
 
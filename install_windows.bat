@@ -121,6 +121,7 @@ pip install seaborn==0.13.2
 
 REM Install export packages
 pip install openpyxl==3.1.5
+pip install pyarrow==21.0.0
 pip install reportlab==4.2.5
 
 REM Install Pillow
@@ -0,0 +1,230 @@
+"""
+Small runtime for the processing pipeline: bounded hand-off between stages
+"""
+import threading
+from collections import deque
+
+
+class Mailbox:
+    """
+    Bounded hand-off between two pipeline stages.
+
+    The consumer blocks in get() until an item arrives, so an idle stage
+    costs no CPU. When the mailbox is full the oldest item is discarded
+    and counted in `dropped` (latest-wins), so a slow consumer always
+    works on the freshest frame and never processes one twice. With
+    drop='newest' the incoming item is refused instead, which suits
+    queues where the oldest work matters most. get() returns None once
+    the mailbox is closed, which is how stages are told to shut down.
+    Every item that is not delivered (dropped, refused after close, or
+    cleared) is passed to on_drop, e.g. to release a frame reference.
+    """
+
+    def __init__(self, capacity=1, on_drop=None, drop='oldest'):
+        if capacity < 1:
+            raise ValueError("Mailbox capacity must be at least 1")
+        if drop not in ('oldest', 'newest'):
+            raise ValueError(f"Unknown drop policy '{drop}'")
+
+        self.capacity = capacity
+        self.on_drop = on_drop
+        self.drop = drop
+        self.closed = False
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """Hand an item to the consumer; returns False if it was not queued"""
+        with self._cond:
+            if self.closed:
+                discarded = item
+            else:
+                discarded = None
+                self.received += 1
+                if len(self._items) >= self.capacity:
+                    self.dropped += 1
+                    if self.drop == 'newest':
+                        discarded = item
+                    else:
+                        discarded = self._items.popleft()
+                if discarded is not item:
+                    self._items.append(item)
+                    self.max_depth = max(self.max_depth, len(self._items))
+                    self._cond.notify()
+
+        if discarded is not None and self.on_drop:
+            self.on_drop(discarded)
+        return discarded is not item
+
+    def get(self, timeout=None):
+        """Next item, blocking until one arrives; None on close or timeout"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.closed, timeout)
+            if not self._items:
+                return None
+            self.delivered += 1
+            return self._items.popleft()
+
+    def get_batch(self, max_items, timeout=None, linger=0.0):
+        """
+        Everything waiting, up to max_items, blocking until at least one
+        item arrives. With linger, waits up to that many more seconds for
+        the batch to fill (group commit). Returns an empty list on close
+        or timeout.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.closed, timeout)
+            if linger and self._items:
+                self._cond.wait_for(lambda: len(self._items) >= max_items or self.closed, linger)
+            count = min(len(self._items), max_items)
+            batch = [self._items.popleft() for _ in range(count)]
+            self.delivered += count
+            return batch
+
+    def clear(self):
+        with self._cond:
+            discarded = list(self._items)
+            self._items.clear()
+
+        if self.on_drop:
+            for item in discarded:
+                self.on_drop(item)
+
+    def close(self):
+        """Wake the consumer and refuse further items"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'depth': len(self._items),
+            'max_depth': self.max_depth,
+        }
+
+
+class FairMailbox:
+    """
+    A Mailbox with one lane per source (e.g. per camera) for a stage
+    shared by several producers. Each lane is bounded and drops like a
+    Mailbox, so a busy camera cannot crowd out a quiet one, and get()
+    serves the lanes round-robin. Items come out as (key, item) pairs.
+    """
+
+    def __init__(self, capacity=1, on_drop=None, drop='oldest'):
+        if capacity < 1:
+            raise ValueError("Mailbox capacity must be at least 1")
+        if drop not in ('oldest', 'newest'):
+            raise ValueError(f"Unknown drop policy '{drop}'")
+
+        self.capacity = capacity
+        self.on_drop = on_drop
+        self.drop = drop
+        self.closed = False
+        self._lanes = {}  # key -> deque of items
+        self._counters = {}  # key -> received, delivered, dropped, max_depth
+        self._ready = deque()  # keys with waiting items, in turn order
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return sum(len(items) for items in self._lanes.values())
+
+    def put(self, key, item):
+        """Hand an item to the consumer on key's lane; returns False if it was not queued"""
+        with self._cond:
+            if self.closed:
+                discarded = item
+            else:
+                discarded = None
+                items = self._lanes.setdefault(key, deque())
+                counters = self._counters.setdefault(
+                    key, {'received': 0, 'delivered': 0, 'dropped': 0, 'max_depth': 0}
+                )
+                counters['received'] += 1
+                if len(items) >= self.capacity:
+                    counters['dropped'] += 1
+                    if self.drop == 'newest':
+                        discarded = item
+                    else:
+                        discarded = items.popleft()
+                if discarded is not item:
+                    # A lane that just dropped its oldest item is already in line
+                    if not items and discarded is None:
+                        self._ready.append(key)
+                    items.append(item)
+                    counters['max_depth'] = max(counters['max_depth'], len(items))
+                    self._cond.notify()
+
+        if discarded is not None and self.on_drop:
+            self.on_drop(discarded)
+        return discarded is not item
+
+    def _next(self):
+        key = self._ready.popleft()
+        items = self._lanes[key]
+        item = items.popleft()
+        if items:
+            self._ready.append(key)  # Back of the line
+        self._counters[key]['delivered'] += 1
+        return key, item
+
+    def get(self, timeout=None):
+        """Next (key, item) in round-robin order; None on close or timeout"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._ready or self.closed, timeout)
+            if not self._ready:
+                return None
+            return self._next()
+
+    def get_batch(self, max_items, timeout=None, linger=0.0):
+        """Up to max_items (key, item) pairs taken round-robin; empty on close or timeout"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._ready or self.closed, timeout)
+            if linger and self._ready:
+                self._cond.wait_for(lambda: len(self) >= max_items or self.closed, linger)
+            batch = []
+            while self._ready and len(batch) < max_items:
+                batch.append(self._next())
+            return batch
+
+    def clear(self):
+        with self._cond:
+            discarded = [item for items in self._lanes.values() for item in items]
+            for items in self._lanes.values():
+                items.clear()
+            self._ready.clear()
+
+        if self.on_drop:
+            for item in discarded:
+                self.on_drop(item)
+
+    def close(self):
+        """Wake the consumer and refuse further items"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        """Totals across lanes, plus the same counters per lane"""
+        with self._cond:
+            lanes = {
+                key: dict(counters, depth=len(self._lanes[key]))
+                for key, counters in self._counters.items()
+            }
+        totals = {
+            name: sum(lane[name] for lane in lanes.values())
+            for name in ('received', 'delivered', 'dropped', 'depth')
+        }
+        totals['max_depth'] = max((lane['max_depth'] for lane in lanes.values()), default=0)
+        totals['lanes'] = lanes
+        return totals
@@ -39,7 +39,7 @@ cp TROUBLESHOOTING.md "$SOURCE_PKG/"
 
 # Create data directory
 mkdir -p "$SOURCE_PKG/data"
-echo "Place enrollments.pkl and attendance.csv here" > "$SOURCE_PKG/data/README.txt"
+echo "Place enrollments.npz, enrollments.*.npy and attendance.csv here" > "$SOURCE_PKG/data/README.txt"
 
 echo "✓ Source package created"
 echo ""
@@ -54,11 +54,11 @@ mkdir -p "$DATA_PKG/data"
 cp START_HERE.txt "$DATA_PKG/"
 
 # Copy data files if they exist
-if [ -f "enrollments.pkl" ]; then
-    cp enrollments.pkl "$DATA_PKG/data/"
-    echo "  ✓ Copied enrollments.pkl"
+if [ -f "enrollments.npz" ]; then
+    cp enrollments.npz enrollments.*.npy "$DATA_PKG/data/"
+    echo "  ✓ Copied enrollments.npz"
 else
-    echo "  ⚠ enrollments.pkl not found - will create empty"
+    echo "  ⚠ enrollments.npz not found - will create empty"
 fi
 
 if [ -f "attendance.csv" ]; then
@@ -87,7 +87,7 @@ FOLDER STRUCTURE SHOULD BE:
     ├── START_HERE.txt
     ├── INSTRUCTIONS.txt (this file)
     └── data/
-        ├── enrollments.pkl
+        ├── enrollments.npz (+ enrollments.*.npy)
         └── attendance.csv
 
 CLIENT USAGE:
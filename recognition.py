@@ -0,0 +1,111 @@
+"""
+Qt-free recognition core: detection, per-camera tracking and gallery matching
+"""
+from itertools import count
+
+from detection import FaceDetector, DEFAULT_DETECTION_SCALE, DEFAULT_MIN_FACE_SIZE
+from gallery import GalleryMatcher
+from tracker import FaceTracker
+
+
+class Recognizer:
+    """
+    Detects faces, tracks them per camera and matches new or stale tracks
+    against the gallery. Every face comes back with the identity voted
+    over its track's history. Used by the Qt recognition thread and by
+    the headless daemon alike; not thread-safe, call it from one thread.
+    """
+
+    def __init__(self, match_policy='centroid', top_k=3, reverify_interval=15,
+                 detection_scale=DEFAULT_DETECTION_SCALE, min_face_size=DEFAULT_MIN_FACE_SIZE):
+        # Detect on a downscaled copy, encode on the full-resolution frame
+        self.detector = FaceDetector(detection_scale, min_face_size)
+        self.matcher = GalleryMatcher(policy=match_policy, top_k=top_k)
+        # Tracks faces between detections so only new or stale tracks are
+        # encoded; one tracker per camera, track ids unique across them
+        self.reverify_interval = reverify_interval
+        self.trackers = {}
+        self.tracker_versions = {}
+        self.track_ids = count(1)
+        self.gallery_version = 0
+
+    def set_enrollments(self, enrollments, tolerance=0.6, index=None):
+        """Update known faces from enrollments dictionary and optional ANN index"""
+        self.matcher.tolerance = tolerance
+        self.matcher.index = index
+        self.matcher.set_enrollments(enrollments)
+        self.gallery_version += 1
+
+    def update_person(self, name, samples=None, index=None):
+        """
+        Enroll, re-enroll (samples given) or remove (samples None) one
+        person without rebuilding the gallery; safe while another thread
+        is recognizing, which picks the change up at its next frame
+        """
+        matcher = self.matcher
+        if index is not matcher.index:
+            matcher.index = index
+        if samples is None:
+            matcher.remove(name)
+        elif name in matcher:
+            matcher.replace(name, samples)
+        else:
+            matcher.add(name, samples)
+        self.gallery_version += 1
+
+    def tracker_for(self, camera_id):
+        """This camera's tracker; its votes are reset when the gallery changed"""
+        tracker = self.trackers.get(camera_id)
+        if tracker is None:
+            tracker = self.trackers[camera_id] = FaceTracker(
+                reverify_interval=self.reverify_interval, ids=self.track_ids
+            )
+        elif self.tracker_versions[camera_id] != self.gallery_version:
+            # Re-verify every track against the new gallery
+            tracker.invalidate()
+        self.tracker_versions[camera_id] = self.gallery_version
+        return tracker
+
+    def recognize(self, camera_id, frame):
+        """Detect, track and match one BGR frame; returns (locations, names, confidences, track ids)"""
+        rgb = self.detector.to_rgb(frame)
+        tracker = self.tracker_for(camera_id)
+
+        # Detect faces in frame
+        face_locations = self.detector.detect(rgb)
+        tracks = tracker.update(face_locations)
+
+        # Only encode tracks that are new, due for re-verification
+        # or weakly associated
+        stale = [
+            idx for idx, track in enumerate(tracks)
+            if tracker.needs_encoding(track)
+        ]
+        if stale:
+            face_encodings = self.detector.encode(
+                rgb, [face_locations[idx] for idx in stale]
+            )
+
+            # Score every face against every identity at once
+            names, distances, _ = self.matcher.match(face_encodings)
+            for idx, name, distance in zip(stale, names, distances):
+                tracker.record(tracks[idx], name, distance)
+
+        return self.identities(face_locations, tracks)
+
+    def track_matches(self, camera_id, face_locations, names, distances):
+        """Track faces that were already matched elsewhere (e.g. in a process pool)"""
+        tracker = self.tracker_for(camera_id)
+        tracks = tracker.update(face_locations)
+        for track, name, distance in zip(tracks, names, distances):
+            tracker.record(track, name, distance)
+        return self.identities(face_locations, tracks)
+
+    @staticmethod
+    def identities(face_locations, tracks):
+        # Identity is voted over each track's history
+        identities = [track.identity() for track in tracks]
+        names = [name for name, _ in identities]
+        confidences = [confidence for _, confidence in identities]
+        track_ids = [track.id for track in tracks]
+        return face_locations, names, confidences, track_ids
@@ -0,0 +1,378 @@
+"""
+Process-pool recognition engine: detection, encoding and matching on all CPU cores
+"""
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from detection import DEFAULT_DETECTION_SCALE, DEFAULT_MIN_FACE_SIZE
+from frame_ring import FrameRef
+from gallery import ENCODING_SIZE, pack
+
+
+# One-person changes published before the next full gallery is written
+MAX_DELTAS = 64
+
+# State of one worker process, set up once by _init_worker
+_worker = {}
+
+
+def _load_gallery(path):
+    with np.load(path, allow_pickle=False) as data:
+        names = [str(name) for name in data['names']]
+        bounds = np.concatenate([[0], np.cumsum(data['counts'])])
+        matrix = data['matrix']
+        return {
+            name: matrix[start:end]
+            for name, start, end in zip(names, bounds[:-1], bounds[1:])
+        }
+
+
+def _init_worker(detector_config, matcher_config):
+    from detection import FaceDetector
+    from gallery import GalleryMatcher
+
+    _worker['segments'] = {}
+    _worker['detector'] = FaceDetector(**detector_config)
+    _worker['matcher'] = GalleryMatcher(**matcher_config)
+    _worker['version'] = None
+
+
+def _sync_gallery(version, base, directory, tolerance):
+    """
+    Catch up with the parent's gallery: load the full gallery published
+    as version `base` if this worker is older than it, then apply the
+    one-person changes published after it, in order
+    """
+    # A worker may already be ahead: it picked up a frame submitted later
+    if _worker['version'] is not None and _worker['version'] >= version:
+        return
+
+    from ann_index import IVFIndex
+
+    directory = Path(directory)
+    matcher = _worker['matcher']
+    matcher.tolerance = tolerance
+    if _worker['version'] is None or _worker['version'] < base:
+        index_path = directory / f'index-{base}.npz'
+        matcher.index = IVFIndex.load(index_path) if index_path.exists() else None
+        matcher.set_enrollments(_load_gallery(directory / f'gallery-{base}.npz'))
+        _worker['version'] = base
+
+    for delta in range(_worker['version'] + 1, version + 1):
+        _apply_delta(directory / f'delta-{delta}.npz')
+    _worker['version'] = version
+
+
+def _apply_delta(path):
+    """Add, replace or remove the one person in a delta file, in the matcher and its index"""
+    with np.load(path, allow_pickle=False) as data:
+        name = str(data['name'])
+        samples = data['samples'] if bool(data['enrolled']) else None
+
+    matcher = _worker['matcher']
+    if matcher.index is not None:
+        matcher.index.remove(name)
+        if samples is not None:
+            matcher.index.add(name, samples)
+    if samples is None:
+        if name in matcher:
+            matcher.remove(name)
+    elif name in matcher:
+        matcher.replace(name, samples)
+    else:
+        matcher.add(name, samples)
+
+
+def _attach(shm_name, live):
+    """
+    Shared memory block by name, attached once per worker; blocks that are
+    no longer in `live` (a replaced frame ring) are detached
+    """
+    segments = _worker['segments']
+    for name in [name for name in segments if name != shm_name and name not in live]:
+        segments.pop(name).close()
+    if shm_name not in segments:
+        segments[shm_name] = shared_memory.SharedMemory(name=shm_name)
+    return segments[shm_name]
+
+
+def _process_frame(seq, shm_name, offset, shape, gallery, live):
+    """Runs in a worker: read the frame from shared memory, detect, encode, match"""
+    _sync_gallery(*gallery)
+
+    size = int(np.prod(shape))
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=_attach(shm_name, live).buf[offset:offset + size])
+
+    detector = _worker['detector']
+    # The BGR->RGB conversion copies, so the slot is free once this returns
+    rgb = detector.to_rgb(frame)
+    del frame
+
+    boxes = detector.detect(rgb)
+    encodings = np.asarray(detector.encode(rgb, boxes), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    names, distances, _ = _worker['matcher'].match(encodings)
+    return seq, boxes, encodings, names, [float(d) for d in distances]
+
+
+class RecognitionPool:
+    """
+    Runs face detection, encoding and matching in a pool of worker
+    processes so dlib is not limited to one core by the GIL.
+
+    Frames are copied once into a slot of a shared-memory buffer and only
+    the slot's location is sent to a worker, never the pixels. A FrameRef
+    from a shared FrameRing is not copied at all: the worker reads the
+    ring slot, which stays retained until its result is back; workers
+    detach from the blocks of rings that were closed since. Each worker
+    loads the gallery once and reloads it only when set_gallery publishes
+    a new version; update_person publishes a single person's change, which
+    workers apply to the gallery they already hold. Version files no
+    queued frame refers to any more are deleted. Results can finish out
+    of order; they are handed to
+    on_result(seq, tag, boxes, encodings, names, distances) strictly in
+    submission order, tag being whatever was passed to submit().
+    """
+
+    def __init__(self, workers=None, on_result=None,
+                 detection_scale=DEFAULT_DETECTION_SCALE, min_face_size=DEFAULT_MIN_FACE_SIZE,
+                 tolerance=0.6, policy='centroid', top_k=3, slots_per_worker=2):
+        self.workers = workers or os.cpu_count() or 1
+        self.on_result = on_result
+        self.detector_config = {'scale': detection_scale, 'min_face_size': min_face_size}
+        self.matcher_config = {'policy': policy, 'top_k': top_k}
+        self.slot_count = self.workers * slots_per_worker
+
+        self.pool = None
+        self.shm = None
+        self.slot_bytes = 0
+        self.free_slots = queue.Queue()
+
+        self.next_seq = 0
+        self.next_emit = 0
+        self.pending = {}
+        self.holds = {}  # seq -> own slot number or retained FrameRef
+        self.tags = {}  # seq -> caller's tag, e.g. the camera id
+        self.bases = {}  # seq -> full gallery version its worker may load
+        self.rings = {}  # shared memory name -> FrameRing frames were submitted from
+        self.dropped = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+
+        self._gallery_dir = tempfile.TemporaryDirectory(prefix='attendance_gallery_')
+        self.files = []  # (version, path) of every published file, oldest first
+        self.index = None
+        self.gallery = (0, 0, self._gallery_dir.name, tolerance)  # version, full version, directory, tolerance
+        self.set_gallery({})
+
+    def _path(self, kind, version):
+        path = Path(self._gallery_dir.name) / f'{kind}-{version}.npz'
+        with self._lock:
+            self.files.append((version, path))
+        return path
+
+    def _write(self, kind, version, **arrays):
+        with open(self._path(kind, version), 'wb') as f:
+            np.savez(f, **arrays)
+
+    def set_gallery(self, enrollments, index=None, tolerance=None):
+        """Publish a new gallery; each worker picks it up before its next frame"""
+        tolerance = self.gallery[3] if tolerance is None else tolerance
+        version = self.gallery[0] + 1
+        names, counts, matrix = pack(enrollments)
+
+        self._write(
+            'gallery', version,
+            names=np.array(names, dtype=str),
+            counts=np.asarray(counts, dtype=np.int64),
+            matrix=matrix,
+        )
+        if index is not None:
+            index.save(self._path('index', version))
+
+        self.index = index
+        with self._lock:
+            self.gallery = (version, version, self._gallery_dir.name, tolerance)
+            self._collect()
+
+    def update_person(self, name, samples=None, enrollments=None, index=None):
+        """
+        Publish one person's change (samples given: added or replaced;
+        None: removed) in O(their samples). The whole gallery is written
+        instead when the index was swapped for another one, or once
+        MAX_DELTAS changes have piled up since the last full gallery.
+        """
+        version, base, directory, tolerance = self.gallery
+        if enrollments is not None and (index is not self.index or version - base >= MAX_DELTAS):
+            self.set_gallery(enrollments, index, tolerance)
+            return
+
+        samples_array = np.asarray(samples if samples is not None else [], dtype=np.float32)
+        self._write(
+            'delta', version + 1,
+            name=np.array(name),
+            enrolled=np.array(samples is not None),
+            samples=samples_array.reshape(-1, ENCODING_SIZE),
+        )
+        with self._lock:
+            self.gallery = (version + 1, base, directory, tolerance)
+
+    def _collect(self):
+        """Delete files older than the oldest full gallery still needed (call with the lock held)"""
+        oldest = min(self.bases.values(), default=self.gallery[1])
+        oldest = min(oldest, self.gallery[1])
+        while self.files and self.files[0][0] < oldest:
+            _, path = self.files.pop(0)
+            try:
+                path.unlink()
+            except OSError:
+                pass  # Still open in a worker (Windows); removed with the directory
+
+    def _start(self):
+        # spawn, not fork: forking a process that already runs Qt, dlib or
+        # TensorFlow threads is unsafe, and spawn is the only option on Windows
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(self.detector_config, self.matcher_config)
+        )
+
+    def _copy_in(self, frame, block):
+        """Copy a frame into a free slot of the pool's own buffer; returns the slot or None"""
+        if self.shm is None:
+            # Sized from the first frame that has to be copied
+            self.slot_bytes = frame.nbytes
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.slot_count)
+            for slot in range(self.slot_count):
+                self.free_slots.put(slot)
+
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes:
+            print(f"Error: frame {frame.shape} does not fit the recognition pool slots")
+            return None
+
+        try:
+            slot = self.free_slots.get(block=block)
+        except queue.Empty:
+            return None
+
+        offset = slot * self.slot_bytes
+        target = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf[offset:offset + frame.nbytes])
+        target[...] = frame
+        del target
+        return slot
+
+    def submit(self, frame, block=False, tag=None):
+        """
+        Queue a frame (an array or a FrameRef) for recognition. Returns its
+        sequence number, or None when every slot is busy (the frame is
+        dropped) or it does not fit.
+        """
+        if self.pool is None:
+            self._start()
+
+        if isinstance(frame, FrameRef) and frame.ring.shm is not None:
+            if self.in_flight() >= self.slot_count:
+                self.dropped += 1
+                return None
+            hold = frame.retain()
+            self.rings[frame.ring.shm.name] = frame.ring
+            source = (frame.ring.shm.name, frame.ring.offset(frame.slot))
+            shape = frame.shape
+        else:
+            if isinstance(frame, FrameRef):
+                frame = frame.image
+            hold = self._copy_in(frame, block)
+            if hold is None:
+                self.dropped += 1
+                return None
+            source = (self.shm.name, hold * self.slot_bytes)
+            shape = frame.shape
+
+        with self._lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.holds[seq] = hold
+            self.tags[seq] = tag
+            self.bases[seq] = self.gallery[1]
+            gallery = self.gallery
+
+        self.pool.apply_async(
+            _process_frame, (seq, *source, shape, gallery, self._segments()),
+            callback=self._on_done,
+            error_callback=lambda error, seq=seq: self._on_error(seq, error)
+        )
+        return seq
+
+    def _segments(self):
+        """Names of the shared memory blocks frames can still come from; workers detach the others"""
+        self.rings = {
+            name: ring for name, ring in self.rings.items()
+            if ring.shm is not None and ring.shm.name == name
+        }
+        names = set(self.rings)
+        if self.shm is not None:
+            names.add(self.shm.name)
+        return frozenset(names)
+
+    def _on_error(self, seq, error):
+        print(f"Error in recognition worker: {error}")
+        self._on_done((seq, [], np.empty((0, ENCODING_SIZE), dtype=np.float32), [], []))
+
+    def _on_done(self, result):
+        seq = result[0]
+        with self._lock:
+            hold = self.holds.pop(seq)
+            if self.bases.pop(seq) < self.gallery[1]:
+                self._collect()
+        if isinstance(hold, FrameRef):
+            hold.release()
+        else:
+            self.free_slots.put(hold)
+
+        # Release results in submission order
+        with self._lock:
+            self.pending[seq] = result
+            while self.next_emit in self.pending:
+                _, boxes, encodings, names, distances = self.pending.pop(self.next_emit)
+                tag = self.tags.pop(self.next_emit)
+                self.completed += 1
+                if self.on_result:
+                    self.on_result(self.next_emit, tag, boxes, encodings, names, distances)
+                self.next_emit += 1
+
+    def in_flight(self):
+        return self.next_seq - self.next_emit
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'submitted': self.next_seq,
+            'completed': self.completed,
+            'in_flight': self.in_flight(),
+            'dropped': self.dropped,
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        for hold in self.holds.values():
+            if isinstance(hold, FrameRef):
+                hold.release()
+        self.holds.clear()
+        self.tags.clear()
+        self.bases.clear()
+        self.rings.clear()
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+        self._gallery_dir.cleanup()
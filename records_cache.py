@@ -0,0 +1,156 @@
+"""
+Shared in-memory copy of the attendance history for the record views
+"""
+import os
+
+import numpy as np
+
+import attendance_archive
+import attendance_store
+
+
+class RecordsCache:
+    """
+    Every attendance record, archived and live, as typed columns: int32
+    name and emotion codes into per-cache dictionaries and int64 epoch
+    timestamps.
+
+    refresh() reads only the rows logged since the previous call (by
+    rowid), so it costs time proportional to new records, not to the
+    history. Everything is reloaded if the database file was replaced,
+    its highest rowid went down (rows removed) or the archive changed
+    (a compaction moved rows). Views select rows with vectorized masks
+    over the columns instead of querying again.
+
+    refresh() may run on a worker thread while a view reads the arrays it
+    got from columns() earlier: rows are only ever appended past the
+    current size, a grown or reloaded column is a new array, and the old
+    ones stay intact. Run one refresh at a time, and select() only after
+    it returned.
+    """
+
+    def __init__(self, db_path=attendance_store.DB_PATH, archive_dir=None):
+        self.db_path = db_path
+        self.archive_dir = attendance_store.archive_dir_for(db_path, archive_dir)
+        self.reloads = 0
+        self._clear()
+
+    def _clear(self):
+        self.names, self._name_codes = [], {}
+        self.emotions, self._emotion_codes = [], {}
+        self.name_column = np.empty(0, np.int32)
+        self.emotion_column = np.empty(0, np.int32)
+        self.ts_column = np.empty(0, np.int64)
+        self.size = 0
+        self.time_ordered = True
+        self.last_id = 0
+        self.identity = None
+
+    def __len__(self):
+        return self.size
+
+    def columns(self):
+        """(names, emotions, name codes, emotion codes, ts) as they are now, for reading while refreshing"""
+        return self.names, self.emotions, self.name_column, self.emotion_column, self.ts_column
+
+    def _identity(self):
+        """What a full reload is keyed on: the database file and the archive's files"""
+        try:
+            stat = os.stat(self.db_path)
+            database = (stat.st_dev, stat.st_ino)
+        except OSError:
+            database = None
+        return database, tuple(str(path) for path in attendance_archive.parts(self.archive_dir))
+
+    @staticmethod
+    def _map(dictionary, codes, values, indices):
+        """Translate a batch's dictionary indices into this cache's codes"""
+        mapping = np.empty(len(dictionary), np.int32)
+        for position, value in enumerate(dictionary):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(values)
+                values.append(value)
+            mapping[position] = code
+        return mapping[indices]
+
+    def _append(self, names, name_indices, emotions, emotion_indices, ts):
+        end = self.size + len(ts)
+        if end > len(self.ts_column):
+            # Grow geometrically, so appending stays linear overall
+            capacity = max(end, 2 * len(self.ts_column), 1024)
+            for column in ('name_column', 'emotion_column', 'ts_column'):
+                grown = np.empty(capacity, getattr(self, column).dtype)
+                grown[:self.size] = getattr(self, column)[:self.size]
+                setattr(self, column, grown)
+
+        if self.time_ordered and len(ts):
+            self.time_ordered = (not self.size or ts[0] >= self.ts_column[self.size - 1]) and bool(np.all(ts[1:] >= ts[:-1]))
+
+        self.name_column[self.size:end] = self._map(names, self._name_codes, self.names, name_indices)
+        self.emotion_column[self.size:end] = self._map(emotions, self._emotion_codes, self.emotions, emotion_indices)
+        self.ts_column[self.size:end] = ts
+        self.size = end
+
+    def refresh(self):
+        """Bring the cache up to date; returns the number of records added"""
+        identity = self._identity()
+        if identity != self.identity or attendance_store.last_rowid(self.db_path) < self.last_id:
+            self._clear()
+            self.reloads += 1
+            if attendance_archive.exists(self.archive_dir):
+                for batch in attendance_archive.batches(self.archive_dir):
+                    self._append(*batch)
+            self.identity = identity
+
+        before = self.size
+        for last_id, *batch in attendance_store.rows_after(self.last_id, self.db_path):
+            self._append(*batch)
+            self.last_id = last_id
+        return self.size - before
+
+    def select(self, date_from=None, date_to=None, name=None):
+        """
+        Row indices matching attendance_store.records() filters, oldest first
+        """
+        ts = self.ts_column[:self.size]
+        lo = attendance_store._epoch(date_from) if date_from is not None else None
+        hi = attendance_store._epoch(date_to) + 86400 if date_to is not None else None
+
+        if self.time_ordered:
+            # Binary search for the date range instead of a mask
+            start = 0 if lo is None else np.searchsorted(ts, lo)
+            stop = self.size if hi is None else np.searchsorted(ts, hi)
+            indices = np.arange(start, stop)
+        else:
+            mask = np.ones(self.size, bool)
+            if lo is not None:
+                mask &= ts >= lo
+            if hi is not None:
+                mask &= ts < hi
+            indices = np.flatnonzero(mask)
+            indices = indices[np.argsort(ts[indices], kind='stable')]
+
+        if name:
+            # Match against the dictionary once, then filter rows by code
+            needle = name.casefold()
+            codes = [code for code, value in enumerate(self.names) if needle in value.casefold()]
+            indices = indices[np.isin(self.name_column[indices], codes)]
+        return indices
+
+    def row(self, index):
+        """(name, emotion, timestamp) of one row"""
+        return (
+            self.names[self.name_column[index]],
+            self.emotions[self.emotion_column[index]],
+            attendance_store.format_timestamp(int(self.ts_column[index])),
+        )
+
+    def rows(self, indices=None):
+        """(name, emotion, timestamp) rows, for the given indices or all of them"""
+        for index in (range(self.size) if indices is None else indices):
+            yield self.row(index)
+
+
+# One parsed copy shared by all views of this process
+shared_records = RecordsCache()
@@ -0,0 +1,151 @@
+"""
+Lazily paged, columnar table model behind the Records tab
+"""
+import numpy as np
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QThread, pyqtSignal
+
+import attendance_store
+from records_cache import shared_records
+
+
+class CacheRefreshThread(QThread):
+    """Brings a RecordsCache up to date off the GUI thread"""
+    refreshed = pyqtSignal(int)  # records added
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def run(self):
+        try:
+            added = self.cache.refresh()
+        except Exception as e:
+            print(f"Error loading records: {e}")
+            added = 0
+        finally:
+            # Every run is a new OS thread with its own connection
+            attendance_store.close(self.cache.db_path)
+        self.refreshed.emit(added)
+
+
+class RecordsModel(QAbstractTableModel):
+    """
+    Attendance records for a QTableView, as a view over a RecordsCache:
+    the model only holds the indices of the matching rows, and a cell's
+    text is only built when the view paints it.
+
+    Setting filters refreshes the cache on a worker thread (reading just
+    the newly logged records, or the whole history the first time) and
+    then selects the matching rows from its columns; until then the
+    previous rows stay on screen. loaded is emitted with the number of
+    matching rows. Rows are handed to the view a page at a time as it
+    scrolls (canFetchMore/fetchMore); sorting reorders the indices with
+    one stable argsort.
+    """
+    COLUMNS = attendance_store.COLUMNS
+
+    loaded = pyqtSignal(int)  # matching records
+
+    def __init__(self, page_size=1000, parent=None, cache=shared_records):
+        super().__init__(parent)
+        self.page_size = page_size
+        self.cache = cache
+        self.filters = {}
+        self.indices = np.empty(0, np.int64)  # Cache rows matching the filters, in display order
+        self.rows = 0  # Rows shown to the view
+        # The cache's arrays as of the last selection; read while it refreshes
+        self.names, self.emotions, self.name_column, self.emotion_column, self.ts_column = cache.columns()
+
+        self.refresh_thread = CacheRefreshThread(cache)
+        self.refresh_thread.refreshed.connect(self.show_selection)
+        self.refresh_pending = False
+
+    def set_filters(self, **filters):
+        """Show the records matching attendance_store.records() filters, from the first page, once loaded"""
+        self.filters = filters
+        if self.refresh_thread.isRunning():
+            self.refresh_pending = True  # Refreshed again when this one finishes
+        else:
+            self.refresh_thread.start()
+
+    def show_selection(self, added=0):
+        """Select the filtered rows from the freshly refreshed cache"""
+        if self.refresh_pending:
+            self.refresh_pending = False
+            self.refresh_thread.start()
+            return
+
+        self.beginResetModel()
+        self.names, self.emotions, self.name_column, self.emotion_column, self.ts_column = self.cache.columns()
+        self.indices = self.cache.select(**self.filters)
+        self.rows = min(self.page_size, len(self.indices))
+        self.endResetModel()
+        self.loaded.emit(len(self.indices))
+
+    def wait(self):
+        """Let a refresh in progress finish, e.g. before the application exits"""
+        self.refresh_pending = False
+        self.refresh_thread.wait()
+
+    # -- QAbstractTableModel -----------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.rows < len(self.indices)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.page_size, len(self.indices) - self.rows)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.rows, self.rows + count - 1)
+        self.rows += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+
+        row = self.indices[index.row()]
+        column = index.column()
+        if column == 0:
+            return self.names[self.name_column[row]]
+        if column == 1:
+            return self.emotions[self.emotion_column[row]]
+        return attendance_store.format_timestamp(int(self.ts_column[row]))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return section + 1
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort all matching records by a column; names and emotions alphabetically"""
+        if column < 0:  # No sort indicator: keep the time order
+            return
+
+        self.beginResetModel()
+        if column == 2:
+            keys = self.ts_column[self.indices]
+        else:
+            values, codes = (self.names, self.name_column) if column == 0 else (self.emotions, self.emotion_column)
+            # Rank each dictionary entry once, then sort the int codes by rank;
+            # the dictionary may have grown since the selection, codes have not
+            ranks = np.empty(len(values), np.int32)
+            ranks[sorted(range(len(values)), key=lambda code: values[code].casefold())] = np.arange(len(values))
+            keys = ranks[codes[self.indices]]
+
+        permutation = np.argsort(keys, kind='stable')
+        if order == Qt.DescendingOrder:
+            permutation = permutation[::-1]
+        # Same number of rows shown as before; the rest still arrive by fetchMore
+        self.indices = self.indices[permutation]
+        self.endResetModel()
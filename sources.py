@@ -0,0 +1,143 @@
+"""
+Capture sources: camera device indices, RTSP/HTTP streams and video files
+"""
+import time
+from pathlib import Path
+
+import cv2
+
+from frame_ring import FrameRing
+
+
+def parse_source(value):
+    """'0' -> camera index 0; anything else (URL or path) is kept as a string"""
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    return int(value) if value.isdigit() else value
+
+
+def is_file_source(source):
+    """True for recorded video files, which are read faster than real time"""
+    return isinstance(source, str) and '://' not in source and Path(source).is_file()
+
+
+def describe_source(source):
+    if isinstance(source, int):
+        return f"camera {source}"
+    if is_file_source(source):
+        return Path(source).name
+    return source.split('@')[-1]  # Keep credentials in RTSP URLs off screen
+
+
+def open_capture(source, width=640, height=480, fps=30):
+    """
+    cv2.VideoCapture for a source. Resolution and frame rate are only
+    requested from local cameras; streams and files keep their own.
+    Returns None if the source cannot be opened.
+    """
+    cap = cv2.VideoCapture(parse_source(source))
+    if not cap.isOpened():
+        print(f"Error: Could not open {describe_source(source)}")
+        return None
+
+    if isinstance(parse_source(source), int):
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    return cap
+
+
+class Capture:
+    """
+    Reads one source straight into a FrameRing and hands out FrameRefs.
+    Video files are paced at their own frame rate and set `finished` at
+    the end; a change of resolution reallocates the ring. read() blocks
+    until the next frame, so run a Capture on a thread of its own.
+    """
+
+    def __init__(self, source=0, ring_slots=8, shared_frames=False):
+        self.source = parse_source(source)
+        self.ring_slots = ring_slots
+        self.shared_frames = shared_frames
+        self.cap = None
+        self.ring = None
+        self.finished = False
+        self.fps = 0.0
+        self.frame_interval = 0.0
+        self._next_frame = 0.0
+        self._window_start = 0.0
+        self._window_frames = 0
+
+    def open(self):
+        """Open the source and size the ring from its first frame; False on failure"""
+        self.cap = open_capture(self.source)
+        if self.cap is None:
+            return False
+
+        # Files are read as fast as decoding allows, so pace them
+        if is_file_source(self.source):
+            self.frame_interval = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 30)
+
+        self._next_frame = self._window_start = time.monotonic()
+        return self.open_ring()
+
+    def open_ring(self):
+        """Size a new frame ring from one frame of the source"""
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+        ret, frame = self.cap.read()
+        if not ret:
+            print(f"Error: Could not read from {describe_source(self.source)}")
+            return False
+
+        self.ring = FrameRing(frame.shape, self.ring_slots, shared=self.shared_frames)
+        return True
+
+    def read(self):
+        """
+        Next frame as a FrameRef owned by the caller, or None when it was
+        skipped (no free slot, failed read). Sets `finished` at the end of
+        a file or if the source cannot be read any more.
+        """
+        if self.frame_interval:
+            self._next_frame += self.frame_interval
+            time.sleep(max(0.0, self._next_frame - time.monotonic()))
+
+        failures = self.ring.read_failures
+        try:
+            frame_ref = self.ring.read_from(self.cap)
+        except ValueError as e:
+            # The camera changed resolution under us
+            print(f"Warning: {e}, reallocating frame ring")
+            self.finished = not self.open_ring()
+            return None
+
+        if frame_ref is None:
+            if self.frame_interval and self.ring.read_failures > failures:
+                print(f"End of {describe_source(self.source)}")
+                self.finished = True
+            return None
+
+        self._window_frames += 1
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self.fps = self._window_frames / (now - self._window_start)
+            self._window_start, self._window_frames = now, 0
+        return frame_ref
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        if self.ring is not None:
+            self.ring.close()
+
+    def stats(self):
+        """Capture rate plus frames published and dropped by the ring, allocations and bytes copied"""
+        stats = {'source': describe_source(self.source), 'fps': self.fps}
+        if self.ring:
+            stats.update(self.ring.stats())
+        return stats
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import attendance_archive
+import attendance_store
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # The database is not in the working directory
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'elsewhere').mkdir()
+    monkeypatch.chdir(tmp_path / 'elsewhere')
+    path = str(tmp_path / 'data' / 'attendance.db')
+    yield path
+    attendance_store.close(path)
+
+
+def test_archive_next_to_the_database_is_used(db_path):
+    day = datetime(2020, 3, 2, 9, 0)
+    attendance_store.log_many([('alice', 'happy', day), ('bob', 'sad', day)], db_path)
+    assert attendance_archive.compact(db_path, keep_days=30) == 2
+
+    archive_dir = attendance_store.archive_dir_for(db_path)
+    assert attendance_archive.exists(archive_dir)
+    assert not attendance_archive.exists(attendance_store.ARCHIVE_DIR)
+
+    # Archived rows are still read, and still count as logged that day
+    assert [name for name, _, _ in attendance_store.records(db_path)] == ['alice', 'bob']
+    assert ('alice', '2020-03-02') in attendance_store.logged_days(db_path)
+    later = day.replace(hour=15)
+    written = attendance_store.log_many([('alice', 'neutral', later), ('carol', 'happy', later)], db_path)
+    assert [name for name, _, _ in written] == ['carol']
@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+pytest.importorskip('face_recognition')
+
+import attendance_store
+from worker_threads import AttendanceWriterThread
+
+
+@pytest.fixture
+def qapp():
+    # batch_logged is delivered through this thread's event loop
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'attendance.db')
+    yield path
+    attendance_store.close(path)
+
+
+def stored(db_path):
+    return [name for name, _, _ in attendance_store.records(db_path)]
+
+
+def test_queued_events_are_group_committed(qapp, db_path):
+    writer = AttendanceWriterThread(db_path, batch_size=64)
+    logged = []
+    writer.batch_logged.connect(logged.append)
+
+    start = datetime(2024, 3, 1, 9, 0)
+    for i in range(100):
+        assert writer.log(f'person{i}', 'happy', start + timedelta(seconds=i))
+    writer.start()
+    writer.stop()
+    qapp.processEvents()
+
+    assert sorted(stored(db_path)) == sorted(f'person{i}' for i in range(100))
+    stats = writer.stats()
+    assert stats['batches'] == 2
+    assert stats['mean_batch'] == 50
+    assert [len(rows) for rows in logged] == [64, 36]
+
+
+def test_stop_drains_events_still_lingering(db_path):
+    # The first event would wait a minute for a batch to fill up
+    writer = AttendanceWriterThread(db_path, batch_size=64, flush_interval=60)
+    writer.start()
+    day = datetime(2024, 3, 1, 9, 0)
+    for i in range(10):
+        writer.log(f'person{i}', 'neutral', day + timedelta(minutes=i))
+
+    started = time.perf_counter()
+    writer.stop()
+
+    assert time.perf_counter() - started < 10
+    assert len(stored(db_path)) == 10
+
+
+def test_repeat_events_of_a_day_are_written_once(qapp, db_path):
+    writer = AttendanceWriterThread(db_path)
+    logged = []
+    writer.batch_logged.connect(logged.append)
+
+    day = datetime(2024, 3, 1, 9, 0)
+    writer.log('alice', 'happy', day)
+    writer.log('alice', 'sad', day + timedelta(hours=1))
+    writer.log('alice', 'happy', day + timedelta(days=1))
+    writer.start()
+    writer.stop()
+    qapp.processEvents()
+
+    assert stored(db_path) == ['alice', 'alice']
+    assert sum(len(rows) for rows in logged) == 2
@@ -0,0 +1,88 @@
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('face_recognition')
+
+import bulk_enroll
+from bulk_enroll import MULTIPLE_FACES, NO_FACE, OK, Journal
+from enrollment_store import EnrollmentStore
+from gallery import ENCODING_SIZE
+
+
+def encoding(value):
+    return np.full(ENCODING_SIZE, value, np.float32)
+
+
+def make_photos(root, people):
+    for name, images in people.items():
+        (root / name).mkdir(parents=True)
+        for image in images:
+            (root / name / image).write_bytes(b'not decoded by these tests')
+
+
+def test_journal_round_trip(tmp_path):
+    journal = Journal(tmp_path / 'enrollments.bulk.npz', tmp_path / 'photos')
+    journal.record('alice/1.jpg', OK, encoding(0.1))
+    journal.record('alice/2.jpg', NO_FACE, None)
+    journal.record('bob/1.jpg', MULTIPLE_FACES, None)
+    journal.record('bob/2.jpg', OK, encoding(0.2))
+    journal.save()
+
+    reloaded = Journal(tmp_path / 'enrollments.bulk.npz', tmp_path / 'photos')
+    assert list(reloaded.results) == list(journal.results)
+    for path, (status, saved) in journal.results.items():
+        status_, loaded = reloaded.results[path]
+        assert status_ == status
+        if status == OK:
+            np.testing.assert_array_equal(loaded, saved)
+        else:
+            assert loaded is None
+
+    journal.remove()
+    assert not journal.path.exists()
+
+
+def test_journal_of_another_directory_is_ignored(tmp_path):
+    journal = Journal(tmp_path / 'enrollments.bulk.npz', tmp_path / 'photos')
+    journal.record('alice/1.jpg', OK, encoding(0.1))
+    journal.save()
+
+    assert Journal(tmp_path / 'enrollments.bulk.npz', tmp_path / 'other').results == {}
+
+
+def test_rerun_enrolls_from_the_journal_without_reprocessing(tmp_path, monkeypatch):
+    photos = tmp_path / 'photos'
+    make_photos(photos, {'alice': ['1.jpg', '2.jpg'], 'bob': ['1.jpg'], 'carol': ['1.png']})
+    store_path = tmp_path / 'enrollments.npz'
+
+    # An interrupted run that got through every image
+    journal = Journal(store_path.with_suffix('.bulk.npz'), photos)
+    journal.record('alice/1.jpg', OK, encoding(0.1))
+    journal.record('alice/2.jpg', OK, encoding(0.2))
+    journal.record('bob/1.jpg', NO_FACE, None)
+    journal.record('carol/1.png', OK, encoding(0.3))
+    journal.save()
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("journaled images were processed again")
+
+    monkeypatch.setattr(bulk_enroll, 'ProcessPoolExecutor', no_pool)
+    monkeypatch.setattr(sys, 'argv', ['bulk_enroll.py', str(photos), '--enrollments', str(store_path)])
+    bulk_enroll.main()
+
+    store = EnrollmentStore(store_path)
+    assert len(store) == 2 and 'bob' not in store
+    np.testing.assert_array_equal(store['alice'], np.stack([encoding(0.1), encoding(0.2)]))
+    np.testing.assert_array_equal(store['carol'], encoding(0.3)[None])
+    assert not journal.path.exists()
+
+
+def test_find_photos_lists_images_per_person(tmp_path):
+    make_photos(tmp_path, {'alice': ['b.jpg', 'a.JPG', 'notes.txt'], 'bob': ['x.png'], 'empty': []})
+
+    assert bulk_enroll.find_photos(tmp_path) == {
+        'alice': ['alice/a.JPG', 'alice/b.jpg'],
+        'bob': ['bob/x.png'],
+    }
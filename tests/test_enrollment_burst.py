@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt5.QtCore')
+pytest.importorskip('face_recognition')
+
+from detection import face_quality
+from worker_threads import EnrollmentThread
+
+BOX = (0, 64, 64, 0)  # top, right, bottom, left
+
+
+def textured(seed):
+    """A sharp, left/right symmetric 64x64 BGR face stand-in"""
+    half = np.random.default_rng(seed).integers(0, 256, (64, 32), dtype=np.uint8)
+    gray = np.hstack([half, half[:, ::-1]])
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def blurred(frame, size):
+    return cv2.GaussianBlur(frame, (size, size), 0)
+
+
+def test_sharper_faces_score_higher():
+    frame = textured(0)
+    scores = [face_quality(frame, BOX)] + [face_quality(blurred(frame, size), BOX) for size in (3, 7, 15)]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[-1] < scores[0] / 10
+
+
+def test_turned_faces_score_lower():
+    frame = textured(1)
+    # Same texture, but no longer mirror-symmetric
+    turned = np.roll(frame, 16, axis=1)
+    assert face_quality(turned, BOX) < face_quality(frame, BOX)
+
+
+def test_empty_box_scores_zero():
+    assert face_quality(textured(2), (10, 10, 10, 10)) == 0.0
+
+
+class OneFace:
+    def detect(self, frame):
+        return [BOX]
+
+
+def test_burst_encodes_the_best_frames_first():
+    thread = EnrollmentThread(target_samples=3)
+    thread.preview = OneFace()
+    captured = []
+
+    def capture(frame):
+        captured.append(frame)
+        return True
+
+    thread.capture = capture
+
+    # Twelve frames of one face, blurred to a different degree each
+    sharpness = [0, 7, 3, 11, 0, 5, 15, 9, 3, 13, 7, 5]
+    frames = [textured(3) if size == 0 else blurred(textured(3), size) for size in sharpness]
+    thread.capture_burst(seconds=1.0)
+    start = thread.burst_until - 1.0
+    for i, frame in enumerate(frames):
+        thread.watch_burst(frame, start + i * 0.05)
+        frame[:] = 0  # The camera reuses its ring slot
+    assert not captured
+    assert len(thread.burst) <= 2 * 3
+
+    thread.watch_burst(frames[0], start + 1.0)
+
+    quality = [face_quality(frame, BOX) for frame in captured]
+    assert len(captured) == 3
+    assert quality == sorted(quality, reverse=True)
+    # The two unblurred frames and the least blurred ones
+    expected = sorted((face_quality(textured(3) if size == 0 else blurred(textured(3), size), BOX)
+                       for size in sharpness), reverse=True)[:3]
+    np.testing.assert_allclose(quality, expected)
+    assert thread.burst_until is None and thread.burst == []
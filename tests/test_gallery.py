@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from gallery import ENCODING_SIZE, UNKNOWN, GalleryMatcher
+
+
+def samples(rng, count):
+    return rng.normal(scale=0.3, size=(count, ENCODING_SIZE)).astype(np.float32)
+
+
+def assert_same_matches(matcher, expected, faces):
+    names, distances, margins = matcher.match(faces)
+    expected_names, expected_distances, expected_margins = expected.match(faces)
+    assert names == expected_names
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+    np.testing.assert_allclose(margins, expected_margins, rtol=1e-4)
+
+
+@pytest.mark.parametrize('policy', ['centroid', 'nearest', 'topk'])
+def test_incremental_changes_match_a_full_rebuild(policy):
+    rng = np.random.default_rng(0)
+    enrollments = {f'person{i}': samples(rng, 1 + i % 4) for i in range(30)}
+    matcher = GalleryMatcher(enrollments, tolerance=10.0, policy=policy)
+
+    # New people, re-enrollments with a different sample count, removals
+    for i in range(30, 45):
+        enrollments[f'person{i}'] = samples(rng, 1 + i % 5)
+        matcher.add(f'person{i}', enrollments[f'person{i}'])
+    for i in range(0, 30, 3):
+        enrollments[f'person{i}'] = samples(rng, 6)
+        matcher.replace(f'person{i}', enrollments[f'person{i}'])
+    for i in range(1, 45, 4):
+        del enrollments[f'person{i}']
+        matcher.remove(f'person{i}')
+
+    expected = GalleryMatcher(enrollments, tolerance=10.0, policy=policy)
+    assert len(matcher) == len(expected)
+    assert sorted(matcher.names) == sorted(expected.names)
+
+    # Probes near enrolled people and far from everyone
+    faces = np.concatenate([
+        np.stack([enrollments[name][0] for name in list(enrollments)[::5]]) + 0.05,
+        samples(rng, 5),
+    ])
+    assert_same_matches(matcher, expected, faces)
+
+
+def test_removed_person_never_matches():
+    rng = np.random.default_rng(1)
+    enrollments = {'alice': samples(rng, 3), 'bob': samples(rng, 3)}
+    matcher = GalleryMatcher(enrollments, tolerance=10.0)
+    probe = enrollments['alice'].mean(axis=0, keepdims=True)
+    assert matcher.match(probe)[0] == ['alice']
+
+    matcher.remove('alice')
+    assert 'alice' not in matcher
+    assert matcher.match(probe)[0] == ['bob']
+
+    matcher.remove('bob')
+    assert matcher.match(probe)[0] == [UNKNOWN]
+
+
+def test_repack_after_many_removals_keeps_matches():
+    rng = np.random.default_rng(2)
+    enrollments = {f'person{i}': samples(rng, 2) for i in range(20)}
+    matcher = GalleryMatcher(enrollments, tolerance=10.0, policy='nearest', repack_min_dead_rows=16)
+
+    # Dead rows outnumber live ones several times over
+    repacked = []
+    for round_ in range(5):
+        for i in range(15):
+            rows = matcher._gallery['rows']
+            enrollments[f'person{i}'] = samples(rng, 2)
+            matcher.replace(f'person{i}', enrollments[f'person{i}'])
+            if matcher._gallery['rows'] < rows:
+                repacked.append((matcher._gallery['rows'], matcher._gallery['dead_rows']))
+
+    assert repacked
+    assert all(dead_rows == 0 and rows == 2 * 20 for rows, dead_rows in repacked)
+    assert matcher._gallery['rows'] - matcher._gallery['dead_rows'] == 2 * 20
+
+    expected = GalleryMatcher(enrollments, tolerance=10.0, policy='nearest')
+    faces = np.stack([enrollments[name][1] for name in enrollments]) + 0.05
+    assert_same_matches(matcher, expected, faces)
+
+
+def test_published_snapshot_is_unchanged_by_later_updates():
+    rng = np.random.default_rng(3)
+    enrollments = {f'person{i}': samples(rng, 2) for i in range(10)}
+    matcher = GalleryMatcher(enrollments, tolerance=10.0)
+    faces = samples(rng, 4)
+
+    snapshot = matcher._gallery
+    before = matcher.distances(faces, snapshot).copy()
+    matcher.add('newcomer', samples(rng, 3))
+    matcher.remove('person0')
+    matcher.replace('person1', samples(rng, 5))
+
+    np.testing.assert_array_equal(matcher.distances(faces, snapshot), before)
@@ -0,0 +1,206 @@
+import random
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip('face_recognition')
+
+import recognition_pool
+from frame_ring import FrameRing
+from gallery import ENCODING_SIZE, GalleryMatcher
+from recognition_pool import RecognitionPool
+
+
+class ManualPool:
+    """Stands in for the process pool; the test decides when each frame finishes"""
+
+    def __init__(self):
+        self.calls = []
+        self.segments = []  # Shared memory names each task lists as live
+
+    def apply_async(self, func, args, callback, error_callback):
+        self.calls.append((args[0], callback, error_callback))
+        self.segments.append(args[-1])
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def empty_result(seq):
+    return seq, [], np.empty((0, ENCODING_SIZE), np.float32), [], []
+
+
+@pytest.fixture
+def manual_pool():
+    delivered = []
+    pool = RecognitionPool(
+        workers=2, slots_per_worker=4,
+        on_result=lambda seq, tag, *result: delivered.append((seq, tag)),
+    )
+    pool.pool = ManualPool()
+    yield pool, delivered
+    pool.close()
+
+
+def frame(value):
+    return np.full((24, 32, 3), value, np.uint8)
+
+
+def test_results_are_delivered_in_submission_order(manual_pool):
+    pool, delivered = manual_pool
+    seqs = [pool.submit(frame(i), tag=f'camera{i % 3}') for i in range(8)]
+    assert seqs == list(range(8))
+    assert pool.submit(frame(9)) is None  # Every slot is busy
+
+    calls = pool.pool.calls
+    random.Random(0).shuffle(calls)
+    finished = set()
+    for seq, callback, _ in calls:
+        callback(empty_result(seq))
+        finished.add(seq)
+        # Everything up to the first unfinished frame, nothing after it
+        ready = next(s for s in range(9) if s not in finished)
+        assert [seq for seq, _ in delivered] == list(range(ready))
+
+    assert delivered == [(seq, f'camera{seq % 3}') for seq in range(8)]
+    assert pool.stats()['in_flight'] == 0
+    assert pool.free_slots.qsize() == pool.slot_count
+
+
+def test_failed_frame_does_not_hold_back_later_results(manual_pool):
+    pool, delivered = manual_pool
+    for i in range(3):
+        pool.submit(frame(i), tag=i)
+    (_, _, fail_first), (_, second_done, _), (_, third_done, _) = pool.pool.calls
+
+    third_done(empty_result(2))
+    second_done(empty_result(1))
+    assert delivered == []
+    fail_first(RuntimeError("worker crashed"))
+    assert delivered == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_closed_rings_are_no_longer_live(manual_pool):
+    pool, _ = manual_pool
+    old_ring, new_ring = FrameRing((24, 32, 3), slots=2, shared=True), FrameRing((24, 32, 3), slots=2, shared=True)
+    old_name = old_ring.shm.name
+    try:
+        frame_ref = old_ring.write(frame(1))
+        pool.submit(frame_ref)
+        frame_ref.release()
+        assert old_name in pool.pool.segments[-1]
+
+        # The camera reopened with a new ring
+        old_ring.close()
+        frame_ref = new_ring.write(frame(2))
+        pool.submit(frame_ref)
+        frame_ref.release()
+        assert pool.pool.segments[-1] == {new_ring.shm.name}
+    finally:
+        pool.close()
+        old_ring.close()
+        new_ring.close()
+
+
+def test_workers_apply_published_changes(monkeypatch):
+    monkeypatch.setattr(recognition_pool, '_worker', {})
+    rng = np.random.default_rng(0)
+
+    def samples(count):
+        return rng.normal(scale=0.3, size=(count, ENCODING_SIZE)).astype(np.float32)
+
+    enrollments = {f'person{i}': samples(2) for i in range(10)}
+    pool = RecognitionPool(workers=1, tolerance=10.0)
+    try:
+        pool.set_gallery(enrollments)
+        recognition_pool._init_worker(pool.detector_config, pool.matcher_config)
+        recognition_pool._sync_gallery(*pool.gallery)
+
+        # One-person changes published after the worker loaded the gallery
+        enrollments['newcomer'] = samples(3)
+        pool.update_person('newcomer', enrollments['newcomer'], enrollments)
+        enrollments['person1'] = samples(4)
+        pool.update_person('person1', enrollments['person1'], enrollments)
+        del enrollments['person2']
+        pool.update_person('person2', None, enrollments)
+        recognition_pool._sync_gallery(*pool.gallery)
+
+        worker_matcher = recognition_pool._worker['matcher']
+        expected = GalleryMatcher(enrollments, tolerance=10.0)
+        faces = np.stack([samples[0] for samples in enrollments.values()]) + 0.05
+        assert sorted(worker_matcher.names) == sorted(enrollments)
+        assert worker_matcher.match(faces)[0] == expected.match(faces)[0]
+    finally:
+        pool.close()
+
+
+def test_worker_ahead_of_a_task_keeps_its_gallery(monkeypatch):
+    monkeypatch.setattr(recognition_pool, '_worker', {})
+    pool = RecognitionPool(workers=1)
+    try:
+        recognition_pool._init_worker(pool.detector_config, pool.matcher_config)
+        older = pool.gallery
+        pool.update_person('alice', np.zeros((1, ENCODING_SIZE), np.float32))
+        recognition_pool._sync_gallery(*pool.gallery)
+
+        # A frame submitted before the change reaches the worker afterwards
+        recognition_pool._sync_gallery(*older)
+        assert recognition_pool._worker['version'] == pool.gallery[0]
+        assert 'alice' in recognition_pool._worker['matcher']
+    finally:
+        pool.close()
+
+
+def test_workers_detach_from_closed_segments(monkeypatch):
+    monkeypatch.setattr(recognition_pool, '_worker', {'segments': {}})
+    old, new = (shared_memory.SharedMemory(create=True, size=64) for _ in range(2))
+    try:
+        recognition_pool._attach(old.name, frozenset([old.name]))
+        recognition_pool._attach(new.name, frozenset([old.name, new.name]))
+        assert set(recognition_pool._worker['segments']) == {old.name, new.name}
+
+        # The old ring was closed
+        recognition_pool._attach(new.name, frozenset([new.name]))
+        assert set(recognition_pool._worker['segments']) == {new.name}
+    finally:
+        for segment in recognition_pool._worker['segments'].values():
+            segment.close()
+        for segment in (old, new):
+            segment.close()
+            segment.unlink()
+
+
+def test_superseded_gallery_files_are_deleted():
+    pool = RecognitionPool(workers=1)
+    try:
+        directory = pool.gallery[2]
+        for i in range(3):
+            pool.update_person(f'person{i}', np.zeros((1, ENCODING_SIZE), np.float32))
+        pool.set_gallery({'alice': np.zeros((1, ENCODING_SIZE), np.float32)})
+
+        current = [f'gallery-{pool.gallery[0]}.npz']
+        assert [path.name for _, path in pool.files] == current
+        assert [path.name for path in Path(directory).iterdir()] == current
+    finally:
+        pool.close()
+
+
+def test_worker_processes_return_results_in_order():
+    delivered = []
+    pool = RecognitionPool(workers=2, on_result=lambda seq, tag, *result: delivered.append(tag))
+    try:
+        for i in range(12):
+            assert pool.submit(frame(i * 20), block=True, tag=i) is not None
+
+        deadline = time.monotonic() + 60
+        while pool.stats()['completed'] < 12 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert delivered == list(range(12))
+    finally:
+        pool.close()
@@ -0,0 +1,148 @@
+"""
+Multi-object face tracker so known faces are not re-encoded every frame
+"""
+from collections import deque, defaultdict
+from itertools import count
+
+import numpy as np
+
+from gallery import UNKNOWN
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU between two sets of (top, right, bottom, left) boxes, shape (A, B)"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    """One face followed across frames, with its identity vote history"""
+
+    def __init__(self, track_id, box, history=10):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.missed = 0
+        self.match_iou = 1.0
+        self.last_encoded = None
+        self.votes = deque(maxlen=history)
+
+    def predict(self):
+        """Constant-velocity prediction of the box for the next frame"""
+        return self.box + self.velocity * (self.missed + 1)
+
+    def update(self, box, match_iou):
+        box = np.asarray(box, dtype=np.float32)
+        step = (box - self.box) / (self.missed + 1)
+        # Smooth the velocity so a single jittery detection does not throw the prediction off
+        self.velocity = 0.5 * self.velocity + 0.5 * step
+        self.box = box
+        self.missed = 0
+        self.match_iou = match_iou
+
+    def add_vote(self, name, distance):
+        self.votes.append((name, float(distance)))
+
+    def identity(self):
+        """Identity voted over the track history: (name, confidence)"""
+        if not self.votes:
+            return UNKNOWN, 0.0
+
+        scores = defaultdict(float)
+        for name, distance in self.votes:
+            scores[name] += max(1.0 - distance, 0.0) if name != UNKNOWN else 0.5
+
+        name = max(scores, key=scores.get)
+        if name == UNKNOWN:
+            return UNKNOWN, 0.0
+
+        distances = [distance for voted, distance in self.votes if voted == name]
+        return name, 1.0 - float(np.mean(distances))
+
+
+class FaceTracker:
+    """
+    Associates detections with tracks by IoU against a constant-velocity
+    prediction. A track is only re-encoded when it is new, when it has not
+    been verified for reverify_interval processed frames, or when the
+    association was weak (IoU below min_confident_iou). Trackers for
+    several cameras can share one ids counter so track ids stay unique.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, reverify_interval=15,
+                 min_confident_iou=0.5, history=10, ids=None):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_interval = reverify_interval
+        self.min_confident_iou = min_confident_iou
+        self.history = history
+        self.tracks = []
+        self.frame_index = 0
+        self._ids = ids if ids is not None else count(1)
+
+    def reset(self):
+        self.tracks = []
+
+    def invalidate(self):
+        """Forget identity votes, e.g. after the gallery changed"""
+        for track in self.tracks:
+            track.votes.clear()
+            track.last_encoded = None
+
+    def update(self, boxes):
+        """Associate this frame's boxes with tracks; returns one track per box, in order"""
+        self.frame_index += 1
+        assigned = [None] * len(boxes)
+        unmatched_tracks = set(range(len(self.tracks)))
+
+        if self.tracks and boxes:
+            predicted = [track.predict() for track in self.tracks]
+            overlap = iou_matrix(predicted, boxes)
+
+            # Greedy assignment, best overlap first
+            for flat in np.argsort(overlap, axis=None)[::-1]:
+                t, b = np.unravel_index(flat, overlap.shape)
+                if overlap[t, b] < self.iou_threshold:
+                    break
+                if t in unmatched_tracks and assigned[b] is None:
+                    self.tracks[t].update(boxes[b], float(overlap[t, b]))
+                    assigned[b] = self.tracks[t]
+                    unmatched_tracks.discard(t)
+
+        for t in unmatched_tracks:
+            self.tracks[t].missed += 1
+
+        self.tracks = [
+            track for track in self.tracks if track.missed <= self.max_missed
+        ]
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                track = Track(next(self._ids), box, self.history)
+                self.tracks.append(track)
+                assigned[b] = track
+
+        return assigned
+
+    def needs_encoding(self, track):
+        return (
+            track.last_encoded is None
+            or self.frame_index - track.last_encoded >= self.reverify_interval
+            or track.match_iou < self.min_confident_iou
+        )
+
+    def record(self, track, name, distance):
+        """Store a fresh recognition result for a track"""
+        track.add_vote(name, distance)
+        track.last_encoded = self.frame_index
@@ -3,128 +3,131 @@ Worker threads for background processing to keep UI responsive
 """
 from PyQt5.QtCore import QThread, pyqtSignal
 import cv2
+import heapq
 import numpy as np
-import face_recognition
-from deepface import DeepFace
-from datetime import datetime
 import time
+from collections import deque
+from datetime import datetime
 
-
-class CameraThread(QThread):
-    """Thread for capturing video frames from camera"""
-    frame_ready = pyqtSignal(np.ndarray)
-
-    def __init__(self, camera_index=0):
+import ann_index
+import attendance_store
+from detection import FaceDetector, PreviewDetector, face_quality, DEFAULT_DETECTION_SCALE, DEFAULT_MIN_FACE_SIZE
+from emotion import EmotionModel, crop_face, cache_key, shared_cache
+from enrollment_store import EnrollmentStore
+from pipeline import FairMailbox, Mailbox
+from recognition import Recognizer
+from recognition_pool import RecognitionPool
+from sources import Capture
+
+
+class PipelineThread(QThread):
+    """
+    Base for pipeline stages that sleep until work arrives in their inbox.
+
+    Subclasses implement process(item). Stages created with batch_size > 1
+    implement process_batch(items) instead and receive everything waiting
+    in the inbox at once; with linger (seconds) they wait that long for a
+    batch to fill up first. Results leave through Qt signals. on_drop is
+    called for every queued item that is never processed. A stage fed by
+    several cameras passes a FairMailbox as inbox and receives
+    (camera_id, item) pairs.
+    """
+
+    def __init__(self, capacity=1, batch_size=1, drop='oldest', on_drop=None, inbox=None, linger=0.0):
         super().__init__()
-        self.camera_index = camera_index
         self.running = False
-        self.cap = None
+        self.batch_size = batch_size
+        self.linger = linger
+        self.inbox = inbox if inbox is not None else Mailbox(capacity, on_drop=on_drop, drop=drop)
 
-    def run(self):
-        self.cap = cv2.VideoCapture(self.camera_index)
-        if not self.cap.isOpened():
-            print(f"Error: Could not open camera {self.camera_index}")
-            return
+    def process(self, item):
+        raise NotImplementedError
+
+    def process_batch(self, items):
+        for item in items:
+            self.process(item)
 
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
+    def run(self):
         self.running = True
 
         while self.running:
-            ret, frame = self.cap.read()
-            if ret:
-                self.frame_ready.emit(frame)
-            time.sleep(0.01)  # ~100 FPS max
+            if self.batch_size > 1:
+                work = self.inbox.get_batch(self.batch_size, linger=self.linger)
+                if not work:  # Mailbox closed
+                    break
+            else:
+                item = self.inbox.get()
+                if item is None:  # Mailbox closed
+                    break
+                work = [item]
+
+            try:
+                self.process_batch(work)
+            except Exception as e:
+                print(f"Error in {type(self).__name__}: {e}")
+
+    def stats(self):
+        """Frames received, processed and dropped at this stage"""
+        return self.inbox.stats()
 
     def stop(self):
         self.running = False
-        if self.cap:
-            self.cap.release()
+        self.inbox.close()
         self.quit()
         self.wait()
+        self.inbox.clear()
 
 
-class FaceRecognitionThread(QThread):
-    """Thread for processing face recognition on frames"""
-    faces_detected = pyqtSignal(list, list, list)  # locations, names, confidences
+def release_frame(frame_ref):
+    frame_ref.release()
 
-    def __init__(self):
+
+class CameraThread(QThread):
+    """
+    Thread for capturing video frames from camera.
+
+    source is a camera index, an RTSP/HTTP URL or a video file (played
+    back at its own frame rate); camera_id tags every frame so results can
+    be attributed to the entrance it came from.
+
+    Frames are read straight into a preallocated FrameRing and emitted as
+    FrameRefs. The slot connected to frame_ready owns the emitted
+    reference and must release it; anything that keeps the frame longer
+    retains its own reference. With shared_frames=True the ring lives in
+    shared memory so a recognition process pool reads it without copying.
+    """
+    frame_ready = pyqtSignal(int, object)  # camera id, FrameRef
+
+    def __init__(self, source=0, camera_id=0, ring_slots=8, shared_frames=False):
         super().__init__()
+        self.capture = Capture(source, ring_slots, shared_frames)
+        self.camera_id = camera_id
         self.running = False
-        self.frame = None
-        self.known_encodings = []
-        self.known_names = []
-        self.tolerance = 0.6
-        self.process_every_n_frames = 3  # Process every 3rd frame for performance
-        self.frame_count = 0
-
-    def set_enrollments(self, enrollments, tolerance=0.6):
-        """Update known faces from enrollments dictionary"""
-        self.known_names = list(enrollments.keys())
-        # Average all encodings for each person
-        self.known_encodings = [
-            np.mean(enrollments[name], axis=0)
-            for name in self.known_names
-        ]
-        self.tolerance = tolerance
-
-    def set_frame(self, frame):
-        """Update frame to process"""
-        self.frame = frame
+
+    @property
+    def source(self):
+        return self.capture.source
 
     def run(self):
+        if not self.capture.open():
+            return
         self.running = True
 
-        while self.running:
-            if self.frame is not None:
-                self.frame_count += 1
-
-                # Only process every Nth frame for performance
-                if self.frame_count % self.process_every_n_frames == 0:
-                    try:
-                        # Detect faces in frame
-                        face_locations = face_recognition.face_locations(self.frame)
-
-                        if face_locations:
-                            face_encodings = face_recognition.face_encodings(
-                                self.frame, face_locations
-                            )
-
-                            names = []
-                            confidences = []
-
-                            for face_encoding in face_encodings:
-                                if self.known_encodings:
-                                    # Compare face to known faces
-                                    distances = face_recognition.face_distance(
-                                        self.known_encodings, face_encoding
-                                    )
-
-                                    min_distance = np.min(distances)
-
-                                    if min_distance <= self.tolerance:
-                                        best_match_index = np.argmin(distances)
-                                        name = self.known_names[best_match_index]
-                                        confidence = 1 - min_distance
-                                    else:
-                                        name = "Unknown"
-                                        confidence = 0.0
-                                else:
-                                    name = "Unknown"
-                                    confidence = 0.0
-
-                                names.append(name)
-                                confidences.append(confidence)
-
-                            self.faces_detected.emit(face_locations, names, confidences)
-                        else:
-                            self.faces_detected.emit([], [], [])
-
-                    except Exception as e:
-                        print(f"Error in face recognition: {e}")
-
-            time.sleep(0.03)  # ~30 Hz processing rate
+        try:
+            # read() blocks until the camera delivers the next frame, which
+            # paces this loop at the camera frame rate without sleeping
+            while self.running and not self.capture.finished:
+                frame_ref = self.capture.read()
+                if frame_ref is not None:
+                    self.frame_ready.emit(self.camera_id, frame_ref)
+        finally:
+            # Released here, on the capture thread, so read() is never
+            # interrupted by a release from the GUI thread
+            self.capture.close()
+
+    def stats(self):
+        """Capture rate plus frames published and dropped by the ring, allocations and bytes copied"""
+        return self.capture.stats()
 
     def stop(self):
         self.running = False
@@ -132,116 +135,427 @@ class FaceRecognitionThread(QThread):
         self.wait()
 
 
-class EmotionDetectionThread(QThread):
-    """Thread for detecting emotions in face regions"""
-    emotion_detected = pyqtSignal(str, str)  # name, emotion
+class Wakeup:
+    """Inbox item that only wakes a stage; dropping it frees nothing"""
 
-    def __init__(self):
-        super().__init__()
-        self.running = False
-        self.tasks = []  # Queue of (frame, face_location, name) tuples
+    def release(self):
+        pass
 
-    def add_task(self, frame, face_location, name):
-        """Add emotion detection task"""
-        self.tasks.append((frame, face_location, name))
 
-    def run(self):
-        self.running = True
+class FaceRecognitionThread(PipelineThread):
+    """
+    Thread for processing face recognition on frames from one or more
+    cameras. Cameras are served round-robin, each with its own latest-wins
+    lane and its own tracker, so every result is attributed to its camera;
+    the models and the gallery are shared by all of them.
+    """
+    faces_detected = pyqtSignal(int, list, list, list, list)  # camera id, locations, names, confidences, track ids
 
-        while self.running:
-            if self.tasks:
-                frame, face_location, name = self.tasks.pop(0)
+    POOL_RESULTS = 'pool results'  # Inbox lane that wakes the thread for pool results
+
+    def __init__(self, match_policy='centroid', top_k=3, reverify_interval=15,
+                 detection_scale=DEFAULT_DETECTION_SCALE, min_face_size=DEFAULT_MIN_FACE_SIZE,
+                 workers=0):
+        super().__init__(inbox=FairMailbox(1, on_drop=release_frame))
+        self.recognizer = Recognizer(
+            match_policy, top_k, reverify_interval, detection_scale, min_face_size
+        )
+        self.process_every_n_frames = 3  # Process every 3rd frame for performance
+        self.frame_counts = {}
+
+        # With workers > 0, detection, encoding and matching run in a process
+        # pool and every face is encoded; tracking and voting stay on this
+        # thread, which the pool wakes through the POOL_RESULTS lane
+        self.pool = None
+        self.pool_results = deque()  # Appended by the pool's result thread
+        if workers:
+            self.pool = RecognitionPool(
+                workers, on_result=self.handle_pool_result,
+                detection_scale=detection_scale, min_face_size=min_face_size,
+                policy=match_policy, top_k=top_k
+            )
+
+    def set_enrollments(self, enrollments, tolerance=0.6, index=None):
+        """Update known faces from enrollments dictionary and optional ANN index"""
+        self.recognizer.set_enrollments(enrollments, tolerance, index)
+        if self.pool:
+            self.pool.set_gallery(enrollments, index, tolerance)
+
+    def update_person(self, name, samples=None, enrollments=None, index=None):
+        """
+        Add, replace (samples given) or remove (samples None) one person;
+        the gallery is updated in place instead of rebuilt, in this thread
+        and in the pool workers. `enrollments` is only read when the pool
+        has to publish the whole gallery again.
+        """
+        self.recognizer.update_person(name, samples, index)
+        if self.pool:
+            self.pool.update_person(name, samples, enrollments, index)
+
+    def set_index(self, index, enrollments):
+        """Swap in a rebuilt ANN index covering the same enrolled samples"""
+        self.recognizer.matcher.index = index
+        if self.pool:
+            self.pool.set_gallery(enrollments, index)
+
+    def set_frame(self, camera_id, frame_ref):
+        """Queue a frame for processing; an unprocessed older frame from the same camera is replaced"""
+        frame_count = self.frame_counts.get(camera_id, 0) + 1
+        self.frame_counts[camera_id] = frame_count
+
+        # Only process every Nth frame for performance
+        if frame_count % self.process_every_n_frames == 0:
+            self.inbox.put(camera_id, frame_ref.retain())
+
+    def process(self, item):
+        camera_id, frame_ref = item
+        if camera_id == self.POOL_RESULTS:
+            self.track_pool_results()
+            return
+        try:
+            if self.pool:
+                # Results come back in order through handle_pool_result
+                self.pool.submit(frame_ref, tag=camera_id)
+            else:
+                results = self.recognizer.recognize(camera_id, frame_ref.image)
+                self.faces_detected.emit(camera_id, *results)
+        finally:
+            frame_ref.release()
+
+    def handle_pool_result(self, seq, camera_id, face_locations, encodings, names, distances):
+        """
+        Called by the pool's result thread in frame sequence order; the
+        Recognizer is not thread-safe, so tracking is handed to this thread
+        """
+        self.pool_results.append((camera_id, face_locations, names, distances))
+        self.inbox.put(self.POOL_RESULTS, Wakeup())
+
+    def track_pool_results(self):
+        """Track and vote on every pool result received so far, in order"""
+        while self.pool_results:
+            camera_id, face_locations, names, distances = self.pool_results.popleft()
+            results = self.recognizer.track_matches(camera_id, face_locations, names, distances)
+            self.faces_detected.emit(camera_id, *results)
+
+    def stats(self):
+        stats = super().stats()
+        # Wake-ups are not frames
+        lane = stats['lanes'].pop(self.POOL_RESULTS, None)
+        if lane:
+            for counter in ('received', 'delivered', 'dropped', 'depth'):
+                stats[counter] -= lane[counter]
+        if self.pool:
+            stats['pool'] = self.pool.stats()
+        return stats
+
+    def stop(self):
+        super().stop()
+        if self.pool:
+            self.pool.close()
+
+
+class EmotionDetectionThread(PipelineThread):
+    """Thread for detecting emotions in face regions, batched into one forward pass"""
+    emotion_detected = pyqtSignal(int, int, str, str)  # camera id, track id, name, emotion
+
+    def __init__(self, max_pending=64, max_batch=32, drop='oldest', cache=shared_cache):
+        # Tasks are (camera_id, track_id, name, crop) with a 48x48 grayscale crop, so a
+        # queued task never pins a full frame. Beyond max_pending waiting
+        # tasks the oldest (or, with drop='newest', the new one) is dropped.
+        super().__init__(capacity=max_pending, batch_size=max_batch, drop=drop)
+        self.cache = cache
+        self.model = None
+        self.batches = 0
+        self.batch_faces = 0
+        self.largest_batch = 0
+
+    def add_task(self, frame, face_location, name, track_id, camera_id=0):
+        """Crop the face now and queue only the crop for emotion detection"""
+        # A fresh cached result is answered straight away, no inference
+        cached = self.cache.get(cache_key(name, track_id))
+        if cached is not None:
+            self.emotion_detected.emit(camera_id, track_id, name, cached)
+            return
 
-                try:
-                    top, right, bottom, left = face_location
-                    face_img = frame[top:bottom, left:right]
+        crop = crop_face(frame, face_location)
+        if crop is None:  # Face region too small to classify
+            return
+        self.inbox.put((camera_id, track_id, name, crop))
+
+    def process_batch(self, tasks):
+        try:
+            # Load TensorFlow on this thread, not while the UI starts up
+            if self.model is None:
+                self.model = EmotionModel()
+
+            emotions = self.model.predict([crop for _, _, _, crop in tasks])
+
+        except Exception as e:
+            print(f"Error detecting emotion: {e}")
+            emotions = ["unknown"] * len(tasks)
+
+        self.batches += 1
+        self.batch_faces += len(tasks)
+        self.largest_batch = max(self.largest_batch, len(tasks))
+
+        for (camera_id, track_id, name, _), emotion in zip(tasks, emotions):
+            if emotion != "unknown":
+                self.cache.put(cache_key(name, track_id), emotion)
+            self.emotion_detected.emit(camera_id, track_id, name, emotion)
+
+    def stats(self):
+        """Queue depth and drops plus batch-size and cache figures"""
+        stats = super().stats()
+        stats.update({
+            'batches': self.batches,
+            'mean_batch': self.batch_faces / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'cache': self.cache.stats(),
+        })
+        return stats
+
+
+class AttendanceWriterThread(PipelineThread):
+    """
+    Writes attendance events to the database off the GUI thread.
+
+    Events are group-committed: the thread waits up to `flush_interval`
+    seconds after the first event for up to `batch_size` more and writes
+    them in one fsynced transaction. batch_logged is emitted once a batch
+    is on disk, with the rows actually written (people already logged that
+    day are left out). stop() writes whatever is still queued.
+    """
+    batch_logged = pyqtSignal(list)  # (name, emotion, timestamp) rows
+
+    def __init__(self, db_path=attendance_store.DB_PATH, batch_size=64, flush_interval=0.05,
+                 max_pending=10000):
+        # Beyond max_pending waiting events new ones are refused, not old ones
+        super().__init__(capacity=max_pending, batch_size=batch_size, drop='newest',
+                         linger=flush_interval)
+        self.db_path = db_path
+        self.batches = 0
+        self.events = 0
+        self.commit_seconds = 0.0
+
+    def log(self, name, emotion, timestamp=None):
+        """Queue one event; stamped now, not when it is written"""
+        return self.inbox.put((name, emotion, timestamp or datetime.now()))
 
-                    # Skip if face region is too small
-                    if face_img.shape[0] < 48 or face_img.shape[1] < 48:
-                        continue
+    def run(self):
+        # Every commit from this thread fsyncs the WAL, so a batch is on
+        # disk before batch_logged is emitted
+        attendance_store.connect(self.db_path).execute('PRAGMA synchronous=FULL')
+        try:
+            super().run()
+        finally:
+            attendance_store.close(self.db_path)
+
+    def process_batch(self, events):
+        started = time.perf_counter()
+        written = attendance_store.log_many(events, self.db_path)
+        self.commit_seconds += time.perf_counter() - started
+        self.batches += 1
+        self.events += len(events)
+        if written:
+            self.batch_logged.emit(written)
+
+    def stats(self):
+        """Queue depth and refused events plus batch sizes and commit time"""
+        stats = super().stats()
+        stats.update({
+            'batches': self.batches,
+            'mean_batch': self.events / self.batches if self.batches else 0.0,
+            'commit_ms': 1000 * self.commit_seconds / self.batches if self.batches else 0.0,
+        })
+        return stats
 
-                    result = DeepFace.analyze(
-                        face_img,
-                        actions=['emotion'],
-                        enforce_detection=False,
-                        silent=True
-                    )
+    def stop(self):
+        # Closing (without clearing) lets run() drain the queue first
+        self.inbox.close()
+        self.wait()
 
-                    if isinstance(result, list):
-                        emotion = result[0]['dominant_emotion']
-                    else:
-                        emotion = result['dominant_emotion']
 
-                    self.emotion_detected.emit(name, emotion)
+class ExportThread(QThread):
+    """
+    Exports filtered records to a .csv or .xlsx file off the GUI thread,
+    streamed from the store in chunks (attendance_store.export). progress
+    is emitted after each chunk; cancel() stops at the next one and leaves
+    no file behind.
+    """
+    progress = pyqtSignal(int)  # rows written so far
+    export_finished = pyqtSignal(int)  # rows written
+    export_cancelled = pyqtSignal()
+    export_failed = pyqtSignal(str)  # error message
 
-                except Exception as e:
-                    print(f"Error detecting emotion: {e}")
-                    self.emotion_detected.emit(name, "unknown")
+    def __init__(self, path, filters=None, db_path=attendance_store.DB_PATH):
+        super().__init__()
+        self.path = path
+        self.filters = filters or {}
+        self.db_path = db_path
+        self.cancelled = False
 
-            time.sleep(0.1)
+    def report(self, count):
+        self.progress.emit(count)
+        return not self.cancelled
 
-    def stop(self):
-        self.running = False
-        self.tasks.clear()
-        self.quit()
-        self.wait()
+    def run(self):
+        try:
+            count = attendance_store.export(self.path, self.db_path, progress=self.report, **self.filters)
+        except Exception as e:
+            self.export_failed.emit(str(e))
+        else:
+            if count is None:
+                self.export_cancelled.emit()
+            else:
+                self.export_finished.emit(count)
+        finally:
+            attendance_store.close(self.db_path)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class IndexBuildThread(QThread):
+    """
+    Builds (or reloads) the ANN index off the GUI thread. It reads its own
+    EnrollmentStore on the committed files, so enrollments made meanwhile
+    do not change what it indexes; version is handed back with the index
+    so the caller can tell whether it is already stale.
+    """
+    index_built = pyqtSignal(object, int)  # index or None, enrollments version it covers
+    build_failed = pyqtSignal(str)  # error message
+
+    def __init__(self, enrollments_path, version):
+        super().__init__()
+        self.enrollments_path = enrollments_path
+        self.version = version
 
+    def run(self):
+        try:
+            store = EnrollmentStore(self.enrollments_path)
+            index = ann_index.load_or_build(store, self.enrollments_path)
+        except Exception as e:
+            self.build_failed.emit(str(e))
+        else:
+            self.index_built.emit(index, self.version)
+
+
+class EnrollmentThread(PipelineThread):
+    """
+    Thread for enrolling new faces.
+
+    While waiting, frames only go through the cheap PreviewDetector, at
+    most PREVIEW_FPS times a second, to drive the "Face detected" overlay.
+    Full detection and encoding run only for captures: capture_sample()
+    encodes the next frame, capture_burst() watches the camera for a short
+    window and encodes the sharpest, most frontal frames it saw.
+    """
+    PREVIEW_FPS = 10
+    BURST_SECONDS = 1.5
 
-class EnrollmentThread(QThread):
-    """Thread for enrolling new faces"""
     progress_update = pyqtSignal(int, int)  # current, total
     face_detected = pyqtSignal(bool)  # True if exactly 1 face detected
-    encoding_captured = pyqtSignal(np.ndarray)  # face encoding
+    burst_finished = pyqtSignal(int)  # samples captured by the burst
     enrollment_complete = pyqtSignal(list)  # all encodings
 
-    def __init__(self, target_samples=5):
-        super().__init__()
-        self.frame = None
+    def __init__(self, target_samples=5, detection_scale=DEFAULT_DETECTION_SCALE):
+        super().__init__(capacity=1, on_drop=release_frame)
+        self.detector = FaceDetector(detection_scale)
+        self.preview = PreviewDetector()
         self.encodings = []
         self.target_samples = target_samples
         self.capture_flag = False
+        self.burst_until = None  # End of the running burst window (perf_counter)
+        self.burst = []  # (quality, time seen, frame copy) of the best frames seen in it
+        self.next_preview = 0.0
+        self.face_present = None
 
-    def set_frame(self, frame):
-        self.frame = frame
+    def set_frame(self, frame_ref):
+        self.inbox.put(frame_ref.retain())
 
     def capture_sample(self):
         """Signal to capture a sample from current frame"""
         self.capture_flag = True
 
+    def capture_burst(self, seconds=BURST_SECONDS):
+        """Capture the remaining samples from the best frames of the next `seconds`"""
+        self.burst = []
+        self.burst_until = time.perf_counter() + seconds
+
     def reset(self):
         """Reset for new enrollment"""
         self.encodings = []
         self.capture_flag = False
+        self.burst_until = None
+        self.burst = []
+
+    def process(self, frame_ref):
+        try:
+            now = time.perf_counter()
+            if self.capture_flag:
+                self.capture_flag = False
+                self.capture(frame_ref.image)
+            elif self.burst_until is not None:
+                self.watch_burst(frame_ref.image, now)
+            elif now >= self.next_preview:
+                self.next_preview = now + 1.0 / self.PREVIEW_FPS
+                self.show_preview(self.preview.detect(frame_ref.image))
+        except Exception as e:
+            print(f"Error in enrollment: {e}")
+        finally:
+            frame_ref.release()
+
+        if len(self.encodings) >= self.target_samples:
+            # Done: stop accepting frames so run() returns
+            self.inbox.close()
+            self.inbox.clear()
+            self.enrollment_complete.emit(self.encodings)
+
+    def show_preview(self, boxes):
+        """Tell the UI whether exactly one face is in view, when that changes"""
+        present = len(boxes) == 1
+        if present != self.face_present:
+            self.face_present = present
+            self.face_detected.emit(present)
+
+    def capture(self, frame):
+        """Full detection and encoding; keeps the sample if the frame has exactly one face"""
+        rgb = self.detector.to_rgb(frame)
+        face_locations = self.detector.detect(rgb)
+        self.show_preview(face_locations)
+        if len(face_locations) != 1:
+            return False
+
+        face_encodings = self.detector.encode(rgb, face_locations)
+        if not face_encodings:
+            return False
+
+        encoding = face_encodings[0]
+        self.encodings.append(encoding)
+        self.progress_update.emit(len(self.encodings), self.target_samples)
+        return True
+
+    def watch_burst(self, frame, now):
+        """Keep the best frames of the burst window, then encode them best first"""
+        wanted = self.target_samples - len(self.encodings)
+        if now < self.burst_until:
+            boxes = self.preview.detect(frame)
+            self.show_preview(boxes)
+            if len(boxes) == 1:
+                # A copy: holding ring frames for the whole window would starve the camera
+                heapq.heappush(self.burst, (face_quality(frame, boxes[0]), now, frame.copy()))
+                # Spares in case the full detector rejects some
+                while len(self.burst) > 2 * wanted:
+                    heapq.heappop(self.burst)
+            return
 
-    def run(self):
-        while len(self.encodings) < self.target_samples:
-            if self.frame is not None:
-                try:
-                    face_locations = face_recognition.face_locations(self.frame)
-
-                    # Emit whether exactly 1 face is detected
-                    self.face_detected.emit(len(face_locations) == 1)
-
-                    # If capture requested and exactly 1 face
-                    if self.capture_flag and len(face_locations) == 1:
-                        face_encodings = face_recognition.face_encodings(
-                            self.frame, face_locations
-                        )
-
-                        if face_encodings:
-                            encoding = face_encodings[0]
-                            self.encodings.append(encoding)
-                            self.encoding_captured.emit(encoding)
-                            self.progress_update.emit(
-                                len(self.encodings),
-                                self.target_samples
-                            )
-
-                        self.capture_flag = False
-
-                except Exception as e:
-                    print(f"Error in enrollment: {e}")
-
-            time.sleep(0.05)
+        candidates = [frame for _, _, frame in sorted(self.burst, key=lambda item: item[:2], reverse=True)]
+        self.burst_until = None
+        self.burst = []
 
-        self.enrollment_complete.emit(self.encodings)
+        captured = 0
+        for candidate in candidates:
+            if captured == wanted:
+                break
+            captured += self.capture(candidate)
+        self.burst_finished.emit(captured)